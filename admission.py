@@ -0,0 +1,242 @@
+"""
+Входной контроль обновлений (admission control).
+
+Стоит перед всеми обработчиками (TypeHandler в группе -1) и решает,
+обрабатывать ли обновление:
+- режим allowlist: при ALLOWLIST_MODE обновления пользователей не из
+  ALLOWED_USERS молча отбрасываются
+- у каждого пользователя свой token bucket: флуд и зацикленные клиенты
+  получают отказ, не доходя до LLM. Ведро проверяется в момент
+  поступления обновления (UserSerialUpdateProcessor вызывает on_arrival),
+  до очереди пользователя; там же ограничена глубина этой очереди
+- при перегрузке (много запросов к LLM ждут места или большая очередь
+  обновлений) отбрасываются обновления, которые требуют LLM; команды
+  проходят всегда
+
+Отброшенное обновление получает дешевый ответ "занят, попробуйте позже"
+из готовых текстов, без перевода через LLM.
+
+UserSerialUpdateProcessor позволяет обрабатывать обновления разных
+пользователей параллельно, сохраняя порядок для одного пользователя.
+Он же считает обновления, дошедшие до общей очереди (ждущие места и
+выполняющиеся): при concurrent_updates приложение сразу забирает их из
+update_queue, поэтому размер очереди перегрузку не показывает.
+Обновления, ждущие в очереди своего пользователя, не считаются - иначе
+флуд одного пользователя выглядел бы как перегрузка всего бота.
+"""
+
+import asyncio
+import logging
+import time
+from collections import Counter
+
+from telegram.ext import ApplicationHandlerStop, BaseUpdateProcessor
+
+from rate_limiter import Priority, TokenBucket
+
+logger = logging.getLogger(__name__)
+
+# Готовые ответы при отказе, по языкам кнопок выбора языка
+BUSY_MESSAGES = {
+    'en': "I'm a bit busy right now. Please try again in a few seconds.",
+    'ru': "Я сейчас немного занят. Пожалуйста, повторите через несколько секунд.",
+    'fr': "Je suis un peu occupé en ce moment. Veuillez réessayer dans quelques secondes.",
+    'ar': "أنا مشغول قليلاً الآن. يرجى المحاولة مرة أخرى بعد بضع ثوانٍ.",
+    'zh': "我现在有点忙，请几秒钟后再试。",
+    'th': "ตอนนี้ฉันยุ่งอยู่เล็กน้อย กรุณาลองใหม่อีกครั้งในอีกไม่กี่วินาที",
+}
+
+BUSY_REPLY_INTERVAL = 10.0  # Не чаще одного ответа "занят" пользователю (сек)
+PURGE_INTERVAL = 60.0       # Как часто удалять ведра неактивных пользователей (сек)
+
+
+def needs_llm(update):
+    """Обновления, обработка которых обращается к LLM: текст, локация, нажатия кнопок"""
+    if update.callback_query is not None:
+        return True
+    message = update.message
+    if message is None:
+        return False
+    if message.location is not None:
+        return True
+    return bool(message.text) and not message.text.startswith('/')
+
+
+class Admission:
+    """
+    rate, burst - скорость и всплеск per-user token bucket
+    llm_slots - общий ConcurrencyLimit запросов к LLM
+    max_waiting - сколько запросов может ждать места у LLM до отказа
+    max_backlog - сколько обновлений может ждать общего места или выполняться до отказа
+    max_queued - сколько обновлений одного пользователя может ждать своей очереди
+    allowed - функция user_id -> bool для режима allowlist (None - выключен)
+    """
+
+    def __init__(self, rate, burst, llm_slots, max_waiting, max_backlog, max_queued=3, allowed=None):
+        self.rate = float(rate)
+        self.burst = float(burst)
+        self.llm_slots = llm_slots
+        self.max_waiting = int(max_waiting)
+        self.max_backlog = int(max_backlog)
+        self.max_queued = int(max_queued)
+        self.allowed = allowed
+        self._users = {}  # user_id -> [TokenBucket, последнее обновление, последний ответ "занят"]
+        self._purged = time.monotonic()
+        self._rejected = {}  # update_id -> причина отказа, определенная при поступлении
+        self._stats = Counter()
+
+    def _user(self, user_id, now):
+        state = self._users.get(user_id)
+        if state is None:
+            state = self._users[user_id] = [TokenBucket(f'user:{user_id}', self.rate, self.burst), now, 0.0]
+        state[1] = now
+        return state
+
+    def _purge(self, now):
+        # Ведро, простоявшее дольше полного пополнения, снова полное - его можно забыть
+        idle = max(self.burst / self.rate, BUSY_REPLY_INTERVAL)
+        for user_id in [u for u, state in self._users.items() if now - state[1] > idle]:
+            del self._users[user_id]
+        self._purged = now
+
+    @staticmethod
+    def backlog(application):
+        """Обновления, ждущие общего места или выполняющиеся"""
+        pending = getattr(application.update_processor, 'pending', 0)
+        return pending + application.update_queue.qsize()
+
+    def overloaded(self, context):
+        return (
+            self.llm_slots.waiting >= self.max_waiting
+            or self.backlog(context.application) >= self.max_backlog
+        )
+
+    def on_arrival(self, update, queued):
+        """
+        Вызывается процессором при поступлении обновления, до очереди пользователя.
+        queued - сколько обновлений пользователя уже ждут или выполняются.
+        Возвращает причину отказа или None; отказ выполняет check().
+        """
+        user = update.effective_user
+        if user is None:
+            return None
+        now = time.monotonic()
+        if now - self._purged > PURGE_INTERVAL:
+            self._purge(now)
+        state = self._user(user.id, now)
+        if not state[0].try_acquire():
+            reason = 'flood'
+        elif queued >= self.max_queued:
+            reason = 'queue'
+        else:
+            return None
+        self._rejected[update.update_id] = reason
+        return reason
+
+    async def check(self, update, context):
+        """TypeHandler: пропускает обновление дальше или останавливает обработку"""
+        user = update.effective_user
+        if user is None:
+            return
+        rejected = self._rejected.pop(update.update_id, None)
+
+        if self.allowed is not None and not self.allowed(user.id):
+            self._stats['denied'] += 1
+            logger.info(f"[admission] user {user.id} is not in the allowlist")
+            raise ApplicationHandlerStop
+
+        state = self._user(user.id, time.monotonic())
+        if rejected:
+            await self._shed(update, context, state, rejected)
+        if needs_llm(update) and self.overloaded(context):
+            await self._shed(update, context, state, 'overload')
+        self._stats['admitted'] += 1
+
+    async def _shed(self, update, context, state, reason):
+        self._stats[f'shed_{reason}'] += 1
+        logger.warning(f"[admission] shedding update {update.update_id} from user {update.effective_user.id}: {reason}")
+        text = BUSY_MESSAGES.get(context.user_data.get('language'), BUSY_MESSAGES['en'])
+        try:
+            if update.callback_query is not None:
+                # На нажатие кнопки все равно нужно ответить, иначе она "зависнет"
+                await update.callback_query.answer(text)
+                self._stats['busy_replies'] += 1
+            elif update.effective_chat is not None and time.monotonic() - state[2] > BUSY_REPLY_INTERVAL:
+                state[2] = time.monotonic()
+                await context.bot.send_message(
+                    chat_id=update.effective_chat.id,
+                    text=text,
+                    rate_limit_args={'priority': Priority.BACKGROUND}
+                )
+                self._stats['busy_replies'] += 1
+        except Exception as e:
+            logger.error(f"[admission] failed to send busy reply: {e}")
+        raise ApplicationHandlerStop
+
+    def stats(self):
+        return dict(
+            self._stats,
+            users=len(self._users),
+            llm=self.llm_slots.stats(),
+        )
+
+
+class UserSerialUpdateProcessor(BaseUpdateProcessor):
+    """
+    Параллельная обработка обновлений (до max_concurrent_updates),
+    но обновления одного пользователя обрабатываются строго по очереди,
+    чтобы не было гонок в user_data.
+
+    Очередь пользователя стоит перед общим семафором: обновления,
+    ждущие своей очереди, не занимают общих мест. admission решает при
+    поступлении, отказать ли обновлению (флуд, длинная очередь); такое
+    обновление идет мимо очереди пользователя - обработчики его не видят,
+    admission.check только отправляет отказ.
+    """
+
+    def __init__(self, max_concurrent_updates, admission=None):
+        super().__init__(max_concurrent_updates)
+        self.admission = admission
+        self._slots = asyncio.BoundedSemaphore(max_concurrent_updates)
+        self._locks = {}  # ключ -> [asyncio.Lock, число обновлений в работе]
+        self.pending = 0  # Обновления, ждущие общего места или выполняющиеся
+
+    async def process_update(self, update, coroutine):
+        user = getattr(update, 'effective_user', None)
+        chat = getattr(update, 'effective_chat', None)
+        key = user.id if user else (chat.id if chat else None)
+
+        rejected = None
+        if key is not None and self.admission is not None:
+            entry = self._locks.get(key)
+            rejected = self.admission.on_arrival(update, entry[1] if entry else 0)
+        if key is None or rejected:
+            await self._run(update, coroutine)
+            return
+
+        entry = self._locks.setdefault(key, [asyncio.Lock(), 0])
+        entry[1] += 1
+        try:
+            async with entry[0]:
+                await self._run(update, coroutine)
+        finally:
+            entry[1] -= 1
+            if not entry[1]:
+                del self._locks[key]
+
+    async def _run(self, update, coroutine):
+        self.pending += 1
+        try:
+            async with self._slots:
+                await self.do_process_update(update, coroutine)
+        finally:
+            self.pending -= 1
+
+    async def do_process_update(self, update, coroutine):
+        await coroutine
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        pass
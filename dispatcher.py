@@ -0,0 +1,415 @@
+#!/usr/bin/env python
+"""
+Многопроцессный режим бота BookTable.
+
+Фронтовой диспетчер принимает webhook от Telegram и раздает обновления
+воркерам по консистентному хэшу от ID пользователя (или чата). Поэтому
+диалог одного пользователя всегда обрабатывается одним воркером, и его
+сессия лежит в памяти этого процесса. Сессии сохраняются в PostgreSQL
+(persistence.py), так что при падении воркера его пользователи переезжают
+на соседей вместе с состоянием.
+
+Воркер - это отдельный процесс с HTTP-интерфейсом:
+    POST /update - принять обновление Telegram
+    GET  /health - состояние воркера
+
+Диспетчер сам запускает локальных воркеров и перезапускает упавших.
+Воркеры на других машинах подключаются через --remote.
+
+По SIGHUP диспетчер по очереди заменяет локальных воркеров без потери
+обновлений: новый воркер стартует на запасном порту, обновления для его
+слота придерживаются, пока старый дорабатывает очередь и сохраняет сессии,
+после чего слот переключается на новый процесс.
+
+Использование:
+    python3 dispatcher.py serve --workers 4 --port 8443
+    python3 dispatcher.py serve --workers 2 --remote http://10.0.0.2:9001
+    python3 dispatcher.py worker --port 9001
+
+Переменные окружения:
+    WEBHOOK_URL - публичный адрес диспетчера для setWebhook
+    WEBHOOK_SECRET - секрет для заголовка X-Telegram-Bot-Api-Secret-Token
+    BOOKTABLE_WORKERS - общее число воркеров. Лимиты OPENAI_RPS, OPENAI_BURST,
+        TELEGRAM_RPS, TELEGRAM_BURST и LLM_CONCURRENCY задаются на весь бот и
+        делятся между воркерами. Локальным воркерам диспетчер выставляет ее сам,
+        удаленные нужно запускать с тем же значением.
+"""
+
+import argparse
+import asyncio
+import bisect
+import hashlib
+import logging
+import os
+import signal
+import subprocess
+import sys
+import time
+
+from aiohttp import ClientSession, ClientTimeout, web
+
+logger = logging.getLogger(__name__)
+
+HEALTH_INTERVAL = 2      # Как часто опрашивать воркеров (сек)
+HEALTH_FAILURES = 3      # Сколько неудачных проверок подряд до исключения из кольца
+FORWARD_TIMEOUT = 5      # Таймаут передачи обновления воркеру (сек)
+READY_TIMEOUT = 60       # Сколько ждать готовности нового воркера при перезагрузке (сек)
+DRAIN_TIMEOUT = 30       # Сколько ждать, пока старый воркер доработает очередь (сек)
+RELOAD_PORT_OFFSET = 1000  # Запасной порт для замены воркера
+
+
+class HashRing:
+    """Консистентное хэширование с виртуальными узлами"""
+
+    def __init__(self, replicas=100):
+        self.replicas = replicas
+        self._keys = []
+        self._nodes = {}
+
+    @staticmethod
+    def _hash(value):
+        return int.from_bytes(hashlib.md5(str(value).encode()).digest()[:8], 'big')
+
+    def __contains__(self, node):
+        return node in self._nodes.values()
+
+    def add(self, node):
+        for i in range(self.replicas):
+            key = self._hash(f"{node}#{i}")
+            self._nodes[key] = node
+            bisect.insort(self._keys, key)
+
+    def remove(self, node):
+        for i in range(self.replicas):
+            key = self._hash(f"{node}#{i}")
+            if self._nodes.pop(key, None) is not None:
+                self._keys.remove(key)
+
+    def get(self, value):
+        """Возвращает узел для ключа или None, если кольцо пустое"""
+        if not self._keys:
+            return None
+        index = bisect.bisect(self._keys, self._hash(value)) % len(self._keys)
+        return self._nodes[self._keys[index]]
+
+
+def shard_key(update):
+    """
+    Ключ шардирования для JSON-обновления Telegram:
+    ID пользователя, если он есть, иначе ID чата, иначе update_id.
+    """
+    for field, payload in update.items():
+        if field == 'update_id' or not isinstance(payload, dict):
+            continue
+        sender = payload.get('from') or payload.get('user')
+        if sender:
+            return sender['id']
+        chat = payload.get('chat') or (payload.get('message') or {}).get('chat')
+        if chat:
+            return chat['id']
+    return update.get('update_id')
+
+
+# ---------------------------------------------------------------------------
+# Воркер
+# ---------------------------------------------------------------------------
+
+async def run_worker(host, port):
+    """Запускает приложение бота без polling и принимает обновления по HTTP"""
+    import main
+    from telegram import Update
+    from admission import Admission
+    from persistence import PostgresPersistence
+
+    main.setup_logging()
+    persistence = PostgresPersistence(main.get_db_connection)
+    app = main.build_application(persistence=persistence)
+    started = time.time()
+    stats = {'processed': 0}
+
+    async def handle_update(request):
+        data = await request.json()
+        await app.update_queue.put(Update.de_json(data, app.bot))
+        stats['processed'] += 1
+        return web.Response(text='ok')
+
+    async def handle_health(request):
+        return web.json_response({
+            'pid': os.getpid(),
+            'uptime': round(time.time() - started, 1),
+            'processed': stats['processed'],
+            'pending': Admission.backlog(app),
+        })
+
+    async with app:
+        # post_init/post_shutdown вызываются только из run_polling/run_webhook
+        await app.post_init(app)
+        await app.start()
+
+        web_app = web.Application()
+        web_app.router.add_post('/update', handle_update)
+        web_app.router.add_get('/health', handle_health)
+        runner = web.AppRunner(web_app)
+        await runner.setup()
+        await web.TCPSite(runner, host, port).start()
+        logger.info(f"Worker {os.getpid()} ready on {host}:{port}")
+
+        stop = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGTERM, signal.SIGINT):
+            loop.add_signal_handler(sig, stop.set)
+        await stop.wait()
+
+        # Сначала перестаем принимать обновления, потом дорабатываем очередь
+        await runner.cleanup()
+        await app.stop()
+        await app.post_shutdown(app)
+
+
+# ---------------------------------------------------------------------------
+# Диспетчер
+# ---------------------------------------------------------------------------
+
+class WorkerHandle:
+    """Состояние воркера с точки зрения диспетчера"""
+
+    def __init__(self, url, process=None, port=None):
+        self.url = url
+        self.process = process
+        self.port = port
+        self.base_port = port
+        self.failures = 0
+        self.restarts = 0
+        self.health = None
+        self.inflight = 0
+        self.swapping = False
+        # Пока событие сброшено, обновления для воркера придерживаются
+        self.gate = asyncio.Event()
+        self.gate.set()
+
+    @property
+    def local(self):
+        return self.port is not None
+
+    def alive(self):
+        return self.process is None or self.process.poll() is None
+
+
+class Dispatcher:
+
+    def __init__(self, workers=0, base_port=9001, remote=(), host='127.0.0.1'):
+        self.host = host
+        self.ring = HashRing()
+        self.workers = {}
+        for i in range(workers):
+            port = base_port + i
+            self.workers[f"local-{i}"] = WorkerHandle(f"http://{host}:{port}", port=port)
+        for i, url in enumerate(remote):
+            self.workers[f"remote-{i}"] = WorkerHandle(url.rstrip('/'))
+        self.session = None
+        self.stats = {'forwarded': 0, 'rerouted': 0, 'rejected': 0}
+
+    def start_process(self, port):
+        # Во время замены воркеров процессов на время больше, но лимиты делятся по слотам кольца
+        env = dict(os.environ, BOOKTABLE_WORKERS=str(len(self.workers)))
+        return subprocess.Popen(
+            [sys.executable, os.path.abspath(__file__), 'worker', '--host', self.host, '--port', str(port)],
+            env=env
+        )
+
+    def spawn(self, name):
+        worker = self.workers[name]
+        worker.process = self.start_process(worker.port)
+        worker.failures = 0
+        logger.info(f"Started {name} (pid {worker.process.pid}) on port {worker.port}")
+
+    def evict(self, name, reason):
+        if name in self.ring:
+            self.ring.remove(name)
+            logger.warning(f"{name} removed from ring: {reason}")
+
+    async def check_worker(self, name, worker):
+        if worker.swapping:
+            return
+        if not worker.alive():
+            self.evict(name, f"process exited with code {worker.process.returncode}")
+            worker.restarts += 1
+            self.spawn(name)
+            return
+        try:
+            async with self.session.get(f"{worker.url}/health", timeout=ClientTimeout(total=1)) as resp:
+                resp.raise_for_status()
+                worker.health = await resp.json()
+            worker.failures = 0
+            if name not in self.ring:
+                self.ring.add(name)
+                logger.info(f"{name} is healthy, added to ring")
+        except Exception as e:
+            worker.failures += 1
+            if worker.failures >= HEALTH_FAILURES:
+                self.evict(name, f"health check failed: {e}")
+                if worker.local:
+                    # Зависший процесс перезапускаем, чтобы его кэш сессий не устарел
+                    worker.process.kill()
+
+    async def monitor(self):
+        while True:
+            await asyncio.gather(*(self.check_worker(n, w) for n, w in self.workers.items()))
+            await asyncio.sleep(HEALTH_INTERVAL)
+
+    async def forward(self, update):
+        """Передает обновление воркеру-владельцу; при ошибке - следующему по кольцу"""
+        key = shard_key(update)
+        for attempt in range(len(self.workers)):
+            name = self.ring.get(key)
+            if name is None:
+                break
+            worker = self.workers[name]
+            await worker.gate.wait()
+            worker.inflight += 1
+            try:
+                async with self.session.post(
+                    f"{worker.url}/update", json=update, timeout=ClientTimeout(total=FORWARD_TIMEOUT)
+                ) as resp:
+                    resp.raise_for_status()
+                self.stats['forwarded'] += 1
+                if attempt:
+                    self.stats['rerouted'] += 1
+                return True
+            except Exception as e:
+                self.evict(name, f"forward failed: {e}")
+            finally:
+                worker.inflight -= 1
+        self.stats['rejected'] += 1
+        return False
+
+    async def wait_healthy(self, url):
+        deadline = time.monotonic() + READY_TIMEOUT
+        while time.monotonic() < deadline:
+            try:
+                async with self.session.get(f"{url}/health", timeout=ClientTimeout(total=1)) as resp:
+                    if resp.status == 200:
+                        return True
+            except Exception:
+                pass
+            await asyncio.sleep(0.2)
+        return False
+
+    async def swap_worker(self, name):
+        """Заменяет локальный воркер новым процессом без потери обновлений"""
+        worker = self.workers[name]
+        worker.swapping = True
+        try:
+            # Воркер попеременно живет на основном и запасном порту
+            new_port = worker.base_port + RELOAD_PORT_OFFSET if worker.port == worker.base_port else worker.base_port
+            new_url = f"http://{self.host}:{new_port}"
+            process = self.start_process(new_port)
+            if not await self.wait_healthy(new_url):
+                logger.error(f"{name}: replacement on port {new_port} did not become healthy, keeping the old worker")
+                process.kill()
+                return
+
+            # Придерживаем новые обновления и ждем уже отправленные
+            worker.gate.clear()
+            while worker.inflight:
+                await asyncio.sleep(0.01)
+            started = time.monotonic()
+            old = worker.process
+            old.terminate()
+            try:
+                await asyncio.wait_for(asyncio.to_thread(old.wait), DRAIN_TIMEOUT)
+            except asyncio.TimeoutError:
+                logger.warning(f"{name}: old worker did not drain in {DRAIN_TIMEOUT}s, killing")
+                old.kill()
+
+            worker.process, worker.port, worker.url = process, new_port, new_url
+            worker.failures = 0
+            logger.info(f"{name}: swapped pid {old.pid} -> {process.pid}, held updates for {time.monotonic() - started:.2f}s")
+        finally:
+            worker.gate.set()
+            worker.swapping = False
+
+    async def reload(self):
+        for name, worker in self.workers.items():
+            if worker.local:
+                await self.swap_worker(name)
+
+    async def handle_update(self, request):
+        secret = os.getenv('WEBHOOK_SECRET')
+        if secret and request.headers.get('X-Telegram-Bot-Api-Secret-Token') != secret:
+            return web.Response(status=403)
+        update = await request.json()
+        if await self.forward(update):
+            return web.Response(text='ok')
+        # Telegram повторит доставку позже
+        return web.Response(status=503)
+
+    async def handle_health(self, request):
+        return web.json_response({
+            'ring': sorted({n for n in self.workers if n in self.ring}),
+            'stats': self.stats,
+            'workers': {
+                name: {'url': w.url, 'failures': w.failures, 'restarts': w.restarts, 'health': w.health}
+                for name, w in self.workers.items()
+            },
+        })
+
+    async def on_startup(self, app):
+        self.session = ClientSession()
+        for name, worker in self.workers.items():
+            if worker.local:
+                self.spawn(name)
+        app['monitor'] = asyncio.create_task(self.monitor())
+        asyncio.get_running_loop().add_signal_handler(signal.SIGHUP, lambda: asyncio.create_task(self.reload()))
+
+        webhook_url = os.getenv('WEBHOOK_URL')
+        if webhook_url:
+            from telegram import Bot
+            async with Bot(os.getenv('TELEGRAM_BOT_TOKEN')) as bot:
+                await bot.set_webhook(webhook_url, secret_token=os.getenv('WEBHOOK_SECRET'))
+            logger.info(f"Webhook set to {webhook_url}")
+
+    async def on_cleanup(self, app):
+        app['monitor'].cancel()
+        for worker in self.workers.values():
+            if worker.local and worker.alive():
+                worker.process.terminate()
+        for worker in self.workers.values():
+            if worker.local:
+                await asyncio.to_thread(worker.process.wait)
+        await self.session.close()
+
+    def build_app(self):
+        app = web.Application()
+        app.router.add_post('/', self.handle_update)
+        app.router.add_get('/health', self.handle_health)
+        app.on_startup.append(self.on_startup)
+        app.on_cleanup.append(self.on_cleanup)
+        return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Многопроцессный режим бота BookTable")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    serve = subparsers.add_parser('serve', help="Запустить диспетчер и воркеров")
+    serve.add_argument('--workers', type=int, default=os.cpu_count(), help="Количество локальных воркеров")
+    serve.add_argument('--port', type=int, default=8443, help="Порт для webhook")
+    serve.add_argument('--worker-port', type=int, default=9001, help="Первый порт локальных воркеров")
+    serve.add_argument('--remote', action='append', default=[], help="URL воркера на другой машине")
+
+    worker = subparsers.add_parser('worker', help="Запустить один воркер")
+    worker.add_argument('--host', default='127.0.0.1')
+    worker.add_argument('--port', type=int, required=True)
+
+    args = parser.parse_args()
+
+    if args.command == 'worker':
+        asyncio.run(run_worker(args.host, args.port))
+    else:
+        logging.basicConfig(format='%(asctime)s - %(name)s - %(levelname)s - %(message)s', level=logging.INFO)
+        dispatcher = Dispatcher(args.workers, args.worker_port, args.remote)
+        web.run_app(dispatcher.build_app(), port=args.port)
+
+if __name__ == '__main__':
+    main()
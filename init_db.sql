@@ -28,22 +28,44 @@ CREATE TABLE bookings (
 );
 
 -- Создание таблицы Restaurants
+-- Горячая часть каталога: только то, что читает поиск (см. restaurants.py)
 CREATE TABLE restaurants (
     id SERIAL PRIMARY KEY,
     name VARCHAR(255) NOT NULL,
     cuisine VARCHAR(255),
     location VARCHAR(255),
-    atmosphere TEXT,
     average_check DECIMAL(10,2),
+    coordinates POINT,
+    active BOOLEAN DEFAULT true,
+    discount DECIMAL(5,2),
+    google_rating DECIMAL(2,1),
+    tripadvisor_rating DECIMAL(2,1),
+    michelin BOOLEAN,
+    romantic BOOLEAN,
+    group_friendly BOOLEAN,
+    kids_menu BOOLEAN,
+    child_friendly BOOLEAN,
+    local_favorite BOOLEAN,
+    business_friendly BOOLEAN,
+    solo_friendly BOOLEAN,
+    tourist_friendly BOOLEAN,
+    outdoor_seating BOOLEAN,
+    private_dining BOOLEAN,
+    reservation_required BOOLEAN,
+    created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
+    updated_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
+);
+
+-- Холодная часть каталога: детали для карточки ресторана и бронирования
+CREATE TABLE restaurant_details (
+    restaurant_id INTEGER PRIMARY KEY REFERENCES restaurants(id) ON DELETE CASCADE,
+    atmosphere TEXT,
     features TEXT[],
     working_hours JSONB,
     booking_method VARCHAR(50),
     booking_contact VARCHAR(255),
-    active BOOLEAN DEFAULT true,
-    discount DECIMAL(5,2),
     key_dishes TEXT[],
-    michelin BOOLEAN,
-    coordinates POINT,
+    map_link TEXT,
     meal_types TEXT[],
     service_options TEXT[],
     dietary_options TEXT[],
@@ -55,14 +77,12 @@ CREATE TABLE restaurants (
     website TEXT,
     instagram TEXT,
     tripadvisor_link TEXT,
-    reservation_required BOOLEAN,
     payment_methods TEXT[],
     wifi BOOLEAN,
     languages_spoken TEXT[],
     menu_languages TEXT[],
     menu_options TEXT[],
     spicy_dishes BOOLEAN,
-    kids_menu BOOLEAN,
     portion_size VARCHAR(50),
     customizable_dishes BOOLEAN,
     dish_of_the_day BOOLEAN,
@@ -82,12 +102,10 @@ CREATE TABLE restaurants (
     coffee_tea_options TEXT[],
     sommelier_available BOOLEAN,
     noise_level VARCHAR(50),
-    outdoor_seating BOOLEAN,
     view TEXT[],
     air_conditioning BOOLEAN,
     smoking_area BOOLEAN,
     pet_friendly BOOLEAN,
-    child_friendly BOOLEAN,
     kids_area BOOLEAN,
     high_chairs BOOLEAN,
     animation_family_entertainment BOOLEAN,
@@ -96,26 +114,17 @@ CREATE TABLE restaurants (
     qr_menu BOOLEAN,
     mobile_app BOOLEAN,
     online_chat_available BOOLEAN,
-    private_dining BOOLEAN,
-    group_friendly BOOLEAN,
     event_support BOOLEAN,
     gift_cards BOOLEAN,
     holiday_specials BOOLEAN,
-    romantic BOOLEAN,
     instagrammable BOOLEAN,
     chef_interaction BOOLEAN,
     unique_features TEXT[],
     story_or_concept TEXT,
     nearby_landmarks TEXT[],
     popular_with TEXT[],
-    solo_friendly BOOLEAN,
     senior_friendly BOOLEAN,
-    tourist_friendly BOOLEAN,
-    local_favorite BOOLEAN,
-    business_friendly BOOLEAN,
     fast_service BOOLEAN,
-    google_rating DECIMAL(2,1),
-    tripadvisor_rating DECIMAL(2,1),
     notable_mentions TEXT[],
     celebrity_visits TEXT[],
     press_features TEXT[],
@@ -123,8 +132,39 @@ CREATE TABLE restaurants (
     hygiene_measures TEXT[],
     certifications TEXT[],
     cleaning_protocol TEXT,
-    safety_policy TEXT,
-    created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
+    safety_policy TEXT
+);
+
+-- Полное представление ресторана (горячие + холодные колонки)
+CREATE VIEW restaurants_full AS
+SELECT r.*,
+    d.atmosphere, d.features, d.working_hours, d.booking_method,
+    d.booking_contact, d.key_dishes, d.map_link, d.meal_types, d.service_options,
+    d.dietary_options, d.occasions, d.drinks_entertainment, d.accessibility,
+    d.address, d.phone, d.website, d.instagram,
+    d.tripadvisor_link, d.payment_methods, d.wifi, d.languages_spoken,
+    d.menu_languages, d.menu_options, d.spicy_dishes, d.portion_size,
+    d.customizable_dishes, d.dish_of_the_day, d.organic_local_ingredients, d.tasting_menu,
+    d.takeaway_available, d.delivery_options, d.catering_available, d.allergen_info,
+    d.product_source_info, d.sustainability_policy, d.drink_specials, d.corkage_fee,
+    d.wine_list, d.cocktails, d.non_alcoholic_drinks, d.coffee_tea_options,
+    d.sommelier_available, d.noise_level, d.view, d.air_conditioning,
+    d.smoking_area, d.pet_friendly, d.kids_area, d.high_chairs,
+    d.animation_family_entertainment, d.dress_code, d.power_sockets, d.qr_menu,
+    d.mobile_app, d.online_chat_available, d.event_support, d.gift_cards,
+    d.holiday_specials, d.instagrammable, d.chef_interaction, d.unique_features,
+    d.story_or_concept, d.nearby_landmarks, d.popular_with, d.senior_friendly,
+    d.fast_service, d.notable_mentions, d.celebrity_visits, d.press_features,
+    d.customer_quotes, d.hygiene_measures, d.certifications, d.cleaning_protocol,
+    d.safety_policy
+FROM restaurants r
+LEFT JOIN restaurant_details d ON d.restaurant_id = r.id;
+
+-- Сессии бота (context.user_data) для многопроцессного режима
+CREATE TABLE bot_sessions (
+    telegram_user_id BIGINT PRIMARY KEY,
+    user_data JSONB NOT NULL DEFAULT '{}',
+    version BIGINT NOT NULL DEFAULT 1,
     updated_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
 );
 
@@ -1,44 +1,133 @@
 #!/usr/bin/env python
 
-import logging, os, uuid, json
+import logging, os, uuid, json, argparse, signal
+from functools import lru_cache
 from telegram import Update, ForceReply, InlineKeyboardButton, InlineKeyboardMarkup, ReplyKeyboardMarkup, KeyboardButton, ReplyKeyboardRemove
-from telegram.ext import ApplicationBuilder, CommandHandler, MessageHandler, ContextTypes, filters, CallbackQueryHandler
-from telegram.constants import ChatAction
+from telegram.ext import ApplicationBuilder, CommandHandler, MessageHandler, ContextTypes, filters, CallbackQueryHandler, TypeHandler
 from dotenv import load_dotenv
-from openai import OpenAI
 import psycopg2
 from psycopg2.extras import DictCursor
-from geopy.geocoders import Nominatim
 import asyncio
-from math import radians, sin, cos, sqrt, atan2
+from rate_limiter import Priority, TokenBucket, ConcurrencyLimit, TelegramRateLimiter, parse_retry_after
+from restaurants import RestaurantDetails, detect_preferences
+from model_router import ModelRouter, load_profiles
+from settings import get_section
+from outbound import Outbox
+from prefetch import Prefetcher
+from admission import Admission, UserSerialUpdateProcessor
+from turn import TurnError, parse_turn, turn_messages
+import turn
+import outbound
 
 # Load environment variables
 load_dotenv()
 
-# Читаем версию
-with open('version.txt', 'r') as f:
-    VERSION = f.read().strip()
-
-# Enable logging
-logging.basicConfig(
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    level=logging.DEBUG,  # Меняем уровень на DEBUG
-    handlers=[
-        logging.FileHandler("bot.log"),
-        logging.StreamHandler()
-    ]
-)
+# Тяжелые модули (openai, geopy) и файлы (version.txt, prompt.txt) загружаются
+# при первом использовании, чтобы перезапуск бота быстро доходил до polling.
+# Бюджет времени импорта проверяет scripts/startup_benchmark.py
 
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.DEBUG)  # Устанавливаем уровень DEBUG для логгера
-logger.info(f"Starting BookTable bot version {VERSION}")
+
+def read_version():
+    with open('version.txt', 'r') as f:
+        return f.read().strip()
+
+def setup_logging():
+    # Enable logging
+    logging.basicConfig(
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+        level=logging.DEBUG,  # Меняем уровень на DEBUG
+        handlers=[
+            logging.FileHandler("bot.log"),
+            logging.StreamHandler()
+        ]
+    )
 
 # Получаем токены из переменных окружения
 telegram_token = os.getenv('TELEGRAM_BOT_TOKEN')
 openai_api_key = os.getenv('OPENAI_API_KEY')
 
-# Инициализация клиента OpenAI
-client = OpenAI(api_key=openai_api_key)
+@lru_cache(maxsize=None)
+def get_openai_client():
+    """Создает клиент OpenAI при первом запросе"""
+    from openai import OpenAI
+    # Повторы делает create_chat_completion: после 429 - через общий ограничитель,
+    # после сбоев сети и 5xx - с экспоненциальной паузой.
+    # base_url позволяет работать с локальной заглушкой (иначе берется OPENAI_BASE_URL)
+    return OpenAI(api_key=openai_api_key, base_url=get_section('openai').get('base_url'), max_retries=0)
+
+@lru_cache(maxsize=None)
+def get_ranker():
+    """Создает движок ранжирования (NumPy и матрица каталога) при первом запросе"""
+    from ranking import Ranker
+    ranker = Ranker(get_db_connection)
+    ranker.refresh()
+    return ranker
+
+@lru_cache(maxsize=None)
+def get_geolocator():
+    """Создает геокодер при первом запросе"""
+    from geopy.geocoders import Nominatim
+    return Nominatim(user_agent="booktable_bot")
+
+# Лимиты OpenAI и Telegram общие на весь бот. В многопроцессном режиме (dispatcher.py)
+# каждый воркер получает свою долю: BOOKTABLE_WORKERS - число воркеров
+WORKER_COUNT = max(1, int(os.getenv('BOOKTABLE_WORKERS', '1')))
+
+def worker_share(name, default, minimum=1.0):
+    """Доля общего лимита из переменной окружения name, приходящаяся на этот процесс"""
+    return max(float(os.getenv(name, default)) / WORKER_COUNT, minimum)
+
+# Ограничители исходящих запросов (запросов в секунду)
+openai_limiter = TokenBucket('openai', worker_share('OPENAI_RPS', '3', 0.1), worker_share('OPENAI_BURST', '10'))
+telegram_limiter = TokenBucket('telegram', worker_share('TELEGRAM_RPS', '25', 0.1), worker_share('TELEGRAM_BURST', '30'))
+OPENAI_MAX_RETRIES = 2
+OPENAI_RETRY_BACKOFF = 0.5  # Пауза перед первым повтором после сбоя (сек), дальше удваивается
+
+def is_transient_openai_error(e):
+    """Сбои, после которых запрос стоит повторить (как это делает SDK): сеть, таймаут, 408, 409, 5xx"""
+    from openai import APIConnectionError, APIStatusError
+    if isinstance(e, APIConnectionError):  # APITimeoutError - его подкласс
+        return True
+    return isinstance(e, APIStatusError) and (e.status_code in (408, 409) or e.status_code >= 500)
+
+# Сколько запросов к LLM может выполняться одновременно
+llm_slots = ConcurrencyLimit('llm', int(worker_share('LLM_CONCURRENCY', '8')))
+
+async def create_chat_completion(priority=Priority.INTERACTIVE, **kwargs):
+    """
+    Вызывает OpenAI через общий ограничитель.
+    Блокирующий вызов клиента выполняется в отдельном потоке.
+    """
+    from openai import RateLimitError
+    client = get_openai_client()
+    for attempt in range(OPENAI_MAX_RETRIES + 1):
+        await openai_limiter.acquire(priority)
+        try:
+            async with llm_slots.slot(priority):
+                return await asyncio.to_thread(client.chat.completions.create, **kwargs)
+        except RateLimitError as e:
+            openai_limiter.retry_after(parse_retry_after(e.response.headers.get('retry-after'), 5.0))
+            if attempt == OPENAI_MAX_RETRIES:
+                raise
+        except Exception as e:
+            if not is_transient_openai_error(e) or attempt == OPENAI_MAX_RETRIES:
+                raise
+            delay = OPENAI_RETRY_BACKOFF * 2 ** attempt
+            logger.warning(f"OpenAI request failed ({e}), retrying in {delay:.1f}s")
+            await asyncio.sleep(delay)
+
+@lru_cache(maxsize=None)
+def get_router():
+    """
+    Выбор модели и параметров по задаче (см. model_router.py и config.ini).
+    Профили читаются из конфига при первом запросе, а не при импорте модуля.
+    """
+    return ModelRouter(load_profiles(), create_chat_completion)
+
+# Упреждающая подготовка следующего шага онбординга (см. prefetch.py)
+prefetcher = Prefetcher(ttl=float(os.getenv('PREFETCH_TTL', '300')))
 
 # Подключение к базе данных
 def get_db_connection():
@@ -127,40 +216,48 @@ def save_user_to_db(user_id, username, first_name, last_name, language):
             conn.close()
             logger.info("Database connection closed")
 
-# Загружаем промпт
-with open('prompt.txt', 'r', encoding='utf-8') as f:
-    system_prompt = f.read().strip()
+@lru_cache(maxsize=None)
+def get_system_prompt():
+    # Загружаем промпт
+    with open('prompt.txt', 'r', encoding='utf-8') as f:
+        return f.read().strip()
 
-# Базовый контекст для ChatGPT
-start_convo = [
-    {"role": "system", "content": system_prompt}
-]
+def get_start_convo():
+    # Базовый контекст для ChatGPT
+    return [
+        {"role": "system", "content": get_system_prompt()}
+    ]
 
 def is_this_user_allowed(user_id):
     allowed_users = os.getenv('ALLOWED_USERS', '').split(',')
     return str(user_id) in allowed_users
 
-def ask(q, chat_log=None, language='en'):
+# Входной контроль: флуд от одного пользователя и перегрузка LLM (см. admission.py)
+admission = Admission(
+    rate=float(os.getenv('USER_RPS', '0.5')),
+    burst=float(os.getenv('USER_BURST', '5')),
+    llm_slots=llm_slots,
+    max_waiting=int(os.getenv('LLM_MAX_WAITING', '16')),
+    max_backlog=int(os.getenv('UPDATE_BACKLOG', '100')),
+    max_queued=int(os.getenv('USER_QUEUE_DEPTH', '3')),
+    allowed=is_this_user_allowed if os.getenv('ALLOWLIST_MODE', '').lower() in ('1', 'true', 'yes') else None,
+)
+
+async def ask(q, chat_log=None, language='en', priority=Priority.INTERACTIVE):
     if chat_log is None:
-        chat_log = start_convo.copy()
+        chat_log = get_start_convo()
     
     # Добавляем инструкцию о языке в промпт
     language_instruction = f"Please respond in {language} language."
     chat_log = chat_log + [{"role": "user", "content": f"{language_instruction}\n{q}"}]
     
-    response = client.chat.completions.create(
-        model="gpt-4",
-        messages=chat_log,
-        temperature=0.7,
-        max_tokens=1000
-    )
-    answer = response.choices[0].message.content
+    answer = await get_router().complete('dialogue', chat_log, priority)
     chat_log = chat_log + [{"role": "assistant", "content": answer}]
     return answer, chat_log
 
 def append_interaction_to_chat_log(q, a, chat_log=None):
     if chat_log is None:
-        chat_log = start_convo.copy()
+        chat_log = get_start_convo()
     chat_log = chat_log + [{"role": "user", "content": q}]
     chat_log = chat_log + [{"role": "assistant", "content": a}]
     return chat_log
@@ -204,29 +301,46 @@ BASE_MESSAGES = {
     'other_area_prompt': "Please specify the area or location you're interested in."
 }
 
-async def translate_message(message_key: str, language: str, **kwargs) -> str:
+# Сообщения шага выбора локации, которые переводятся заранее
+NEXT_STEP_MESSAGES = ['other_area_prompt']
+
+# Диапазоны среднего чека для кнопок бюджета
+BUDGET_RANGES = {
+    '1': (0, 500),
+    '2': (500, 1500),
+    '3': (1500, 3000),
+    '4': (3000, 100000)
+}
+
+# Готовые переводы базовых сообщений: (ключ, язык) -> текст
+translations = {}
+
+async def translate_message(message_key: str, language: str, priority=Priority.CONFIRMATION, **kwargs) -> str:
     """
     Переводит сообщение на нужный язык с помощью ChatGPT.
+    Перевод запоминается, повторно для того же языка ChatGPT не вызывается.
     """
     try:
         # Если язык английский, возвращаем оригинальное сообщение
         if language == 'en':
             return BASE_MESSAGES[message_key].format(**kwargs)
+        if (message_key, language) in translations:
+            return translations[message_key, language].format(**kwargs)
             
         # Формируем промпт для перевода
         prompt = f"""Translate the following English message to {language} language. 
         Keep the same meaning and tone. If there are placeholders like {{}}, keep them in the translation.
         Message: {BASE_MESSAGES[message_key]}"""
         
-        response = client.chat.completions.create(
-            model="gpt-4",
-            messages=[{"role": "user", "content": prompt}],
-            temperature=0.3,  # Низкая температура для более точного перевода
-            max_tokens=100
+        translated = await get_router().complete(
+            'translate',
+            [{"role": "user", "content": prompt}],
+            priority
         )
-        
-        translated = response.choices[0].message.content.strip()
-        return translated.format(**kwargs)
+        translated = translated.strip()
+        result = translated.format(**kwargs)
+        translations[message_key, language] = translated
+        return result
     except Exception as e:
         logger.error(f"Error translating message: {e}")
         return BASE_MESSAGES[message_key].format(**kwargs)  # Возвращаем оригинальное сообщение в случае ошибки
@@ -236,13 +350,29 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     user_id = user["id"]
     username = user["username"]
 
-    # Первое приветственное сообщение
-    await update.message.reply_text(
-        'Hello and welcome to BookTable.AI!\n'
-        'I will help you find the perfect restaurant in Phuket and book a table in seconds.'
-    )
+    # Новая сессия: заготовки прошлой больше не нужны
+    prefetcher.cancel(user_id)
+
+    async with Outbox(update, context) as out:
+        # Приветствие и выбор языка уходят одним сообщением
+        out.say(
+            'Hello and welcome to BookTable.AI!\n'
+            'I will help you find the perfect restaurant in Phuket and book a table in seconds.'
+        )
+        await out.send(
+            'Please choose your language or just type a message — I understand more than 120 languages and will reply in yours!',
+            reply_markup=language_keyboard()
+        )
 
-    # Кнопки выбора языка
+    context.user_data['awaiting_language'] = True
+    context.user_data['chat_log'] = get_start_convo()
+    context.user_data['preferences'] = []
+    context.user_data['slots'] = {}
+    context.user_data['sessionid'] = str(uuid.uuid4())
+    logger.info("New session with %s", username)
+
+def language_keyboard():
+    """Кнопки выбора языка"""
     keyboard = [
         [
             InlineKeyboardButton("Русский", callback_data="lang_ru"),
@@ -257,104 +387,80 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
             InlineKeyboardButton("ภาษาไทย", callback_data="lang_th")
         ]
     ]
-    reply_markup = InlineKeyboardMarkup(keyboard)
-    
-    # Отправляем объединенное сообщение с кнопками
-    await update.message.reply_text(
-        'Please choose your language or just type a message — I understand more than 120 languages and will reply in yours!',
-        reply_markup=reply_markup
-    )
-
-    context.user_data['awaiting_language'] = True
-    context.user_data['chat_log'] = start_convo.copy()
-    context.user_data['sessionid'] = str(uuid.uuid4())
-    logger.info("New session with %s", username)
+    return InlineKeyboardMarkup(keyboard)
 
 async def language_callback(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
-    try:
-        query = update.callback_query
-        logger.debug(f"[language_callback] Received callback query: {query.data}")
-        print("[language_callback] Received callback query")
-        
-        # Получаем выбранный язык из callback_data
-        lang = query.data.split('_')[1]
-        logger.debug(f"[language_callback] Selected language: {lang}")
-        print(f"[language_callback] Selected language: {lang}")
-        
-        context.user_data['language'] = lang
-        context.user_data['awaiting_language'] = False
-        
-        # Удаляем сообщение с кнопками выбора языка
-        await query.message.delete()
-        logger.debug("[language_callback] Deleted language selection message")
-        print("[language_callback] Deleted language selection message")
-        
-        # Сохраняем пользователя в базу данных
-        user = update.effective_user
-        logger.debug(f"[language_callback] Processing user: {user.id} ({user.username})")
-        print(f"[language_callback] Processing user: {user.id} ({user.username})")
-        
-        client_number = save_user_to_db(
-            user_id=user.id,
-            username=user.username,
-            first_name=user.first_name,
-            last_name=user.last_name,
-            language=lang
-        )
-        logger.debug(f"[language_callback] User saved with client_number: {client_number}")
-        print(f"[language_callback] User saved with client_number: {client_number}")
-        
-        # Отправляем приветствие на выбранном языке
-        welcome_messages = {
-            'ru': "Я знаю о ресторанах на Пхукете всё.",
-            'en': "I know everything about restaurants in Phuket.",
-            'fr': "Je connais tout sur les restaurants de Phuket.",
-            'ar': "أعرف كل شيء عن المطاعم في بوكيت.",
-            'zh': "我了解普吉岛的所有餐厅。",
-            'th': "ผมรู้ทุกอย่างเกี่ยวกับร้านอาหารในภูเก็ต"
-        }
-        
-        welcome_message = welcome_messages.get(lang, welcome_messages['en'])
-        logger.debug(f"[language_callback] Sending welcome message: {welcome_message}")
-        print(f"[language_callback] Sending welcome message: {welcome_message}")
-        await query.message.reply_text(welcome_message)
-        logger.debug("[language_callback] Welcome message sent")
-        print("[language_callback] Welcome message sent")
-        
-        # Показываем кнопки выбора бюджета
-        keyboard = [
-            [
-                InlineKeyboardButton("$", callback_data="budget_1"),
-                InlineKeyboardButton("$$", callback_data="budget_2"),
-                InlineKeyboardButton("$$$", callback_data="budget_3"),
-                InlineKeyboardButton("$$$$", callback_data="budget_4")
-            ]
-        ]
-        reply_markup = InlineKeyboardMarkup(keyboard)
-        
-        # Сообщения о выборе бюджета на разных языках
-        budget_messages = {
-            'ru': "С каким средним чеком подберем ресторан?",
-            'en': "What price range would you prefer for the restaurant?",
-            'fr': "Quelle gamme de prix préférez-vous pour le restaurant ?",
-            'ar': "ما هو نطاق السعر الذي تفضله للمطعم؟",
-            'zh': "您希望餐厅的价格范围是多少？",
-            'th': "คุณต้องการช่วงราคาของร้านอาหารเท่าไหร่?"
-        }
-        
-        message = budget_messages.get(lang, budget_messages['en'])
-        logger.debug(f"[language_callback] Sending budget message: {message}")
-        print(f"[language_callback] Sending budget message: {message}")
-        await query.message.reply_text(message, reply_markup=reply_markup)
-        logger.debug("[language_callback] Budget message sent")
-        print("[language_callback] Budget message sent")
-        
-    except Exception as e:
-        logger.error(f"Error in language_callback: {e}")
-        print(f"[language_callback] Exception: {e}")
-        await query.message.reply_text("Sorry, an error occurred. Please try again.")
+    async with Outbox(update, context) as out:
+        try:
+            query = update.callback_query
+            logger.debug(f"[language_callback] Received callback query: {query.data}")
+            print("[language_callback] Received callback query")
+            
+            # Получаем выбранный язык из callback_data
+            lang = query.data.split('_')[1]
+            logger.debug(f"[language_callback] Selected language: {lang}")
+            print(f"[language_callback] Selected language: {lang}")
+            
+            context.user_data['language'] = lang
+            context.user_data['awaiting_language'] = False
+            
+            # Удаляем сообщение с кнопками выбора языка (параллельно с остальной работой)
+            out.answer(query)
+            out.delete(query.message.message_id)
+            
+            # Сохраняем пользователя в базу данных
+            user = update.effective_user
+            logger.debug(f"[language_callback] Processing user: {user.id} ({user.username})")
+            print(f"[language_callback] Processing user: {user.id} ({user.username})")
+            
+            client_number = save_user_to_db(
+                user_id=user.id,
+                username=user.username,
+                first_name=user.first_name,
+                last_name=user.last_name,
+                language=lang
+            )
+            logger.debug(f"[language_callback] User saved with client_number: {client_number}")
+            print(f"[language_callback] User saved with client_number: {client_number}")
+            
+            # Приветствие на выбранном языке
+            welcome_messages = {
+                'ru': "Я знаю о ресторанах на Пхукете всё.",
+                'en': "I know everything about restaurants in Phuket.",
+                'fr': "Je connais tout sur les restaurants de Phuket.",
+                'ar': "أعرف كل شيء عن المطاعم في بوكيت.",
+                'zh': "我了解普吉岛的所有餐厅。",
+                'th': "ผมรู้ทุกอย่างเกี่ยวกับร้านอาหารในภูเก็ต"
+            }
+            
+            welcome_message = welcome_messages.get(lang, welcome_messages['en'])
+            out.say(welcome_message)
+            
+            # Сообщения о выборе бюджета на разных языках
+            budget_messages = {
+                'ru': "С каким средним чеком подберем ресторан?",
+                'en': "What price range would you prefer for the restaurant?",
+                'fr': "Quelle gamme de prix préférez-vous pour le restaurant ?",
+                'ar': "ما هو نطاق السعر الذي تفضله للمطعم؟",
+                'zh': "您希望餐厅的价格范围是多少？",
+                'th': "คุณต้องการช่วงราคาของร้านอาหารเท่าไหร่?"
+            }
+            
+            # Приветствие и кнопки бюджета уходят одним сообщением
+            message = budget_messages.get(lang, budget_messages['en'])
+            logger.debug(f"[language_callback] Sending welcome and budget message: {message}")
+            print(f"[language_callback] Sending welcome and budget message: {message}")
+            await out.send(message, reply_markup=budget_keyboard())
+            logger.debug("[language_callback] Budget message sent")
+            print("[language_callback] Budget message sent")
+            
+        except Exception as e:
+            logger.error(f"Error in language_callback: {e}")
+            print(f"[language_callback] Exception: {e}")
+            await out.send("Sorry, an error occurred. Please try again.")
 
-async def show_budget_buttons(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+def budget_keyboard():
+    """Кнопки выбора бюджета"""
     keyboard = [
         [
             InlineKeyboardButton("$", callback_data="budget_1"),
@@ -363,289 +469,306 @@ async def show_budget_buttons(update: Update, context: ContextTypes.DEFAULT_TYPE
             InlineKeyboardButton("$$$$", callback_data="budget_4")
         ]
     ]
-    
-    reply_markup = InlineKeyboardMarkup(keyboard)
-    
+    return InlineKeyboardMarkup(keyboard)
+
+def area_keyboard():
+    """Кнопки районов в два ряда"""
+    areas = list(PHUKET_AREAS.items())
+    keyboard = []
+    for i in range(0, len(areas), 2):
+        row = []
+        row.append(InlineKeyboardButton(areas[i][1], callback_data=f'area_{areas[i][0]}'))
+        if i + 1 < len(areas):
+            row.append(InlineKeyboardButton(areas[i+1][1], callback_data=f'area_{areas[i+1][0]}'))
+        keyboard.append(row)
+    return InlineKeyboardMarkup(keyboard)
+
+async def show_budget_buttons(update: Update, context: ContextTypes.DEFAULT_TYPE, out: Outbox) -> None:
     # Получаем актуальный язык пользователя
     lang = context.user_data.get('language', 'en')
     message = await translate_message('budget_question', lang)
     
-    await update.message.reply_text(message, reply_markup=reply_markup)
+    # Отложенные тексты (например, приветствие) уйдут вместе с кнопками
+    await out.send(message, reply_markup=budget_keyboard())
 
 async def budget_callback(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     query = update.callback_query
     logger.debug(f"[budget_callback] Received callback query: {query.data}")
     print("[budget_callback] Received callback query")
     
-    # Сразу включаем эффект печатания
-    await context.bot.send_chat_action(chat_id=query.message.chat_id, action=ChatAction.TYPING)
-    
-    # Сохраняем выбор бюджета
-    budget = query.data.split('_')[1]
-    context.user_data['budget'] = budget
-    logger.debug(f"[budget_callback] Budget set: {budget}")
-    print(f"[budget_callback] Budget set: {budget}")
+    async with Outbox(update, context) as out:
+        out.answer(query)
+        
+        # Сохраняем выбор бюджета
+        budget = query.data.split('_')[1]
+        context.user_data['budget'] = budget
+        logger.debug(f"[budget_callback] Budget set: {budget}")
+        print(f"[budget_callback] Budget set: {budget}")
+        
+        language = context.user_data.get('language', 'en')
+        
+        # Пока пользователь выбирает локацию, готовим следующий шаг
+        start_prefetch(update.effective_user.id, context, budget, language)
+        
+        # Подготавливаем сообщение о сохранении бюджета, пока показываем "печатает"
+        async with out.typing():
+            budget_saved = await translate_message('budget_saved', language)
+        
+        # Удаляем сообщение с приветствием и кнопками бюджета
+        out.delete(query.message.message_id)
+        
+        # Отправляем сообщение о сохранении бюджета
+        logger.debug(f"[budget_callback] Sending budget_saved message: {budget_saved}")
+        print(f"[budget_callback] Sending budget_saved message: {budget_saved}")
+        await out.send(budget_saved)
+        logger.debug("[budget_callback] budget_saved message sent")
+        print("[budget_callback] budget_saved message sent")
     
+    # Устанавливаем флаг, что ждем ответа пользователя
+    context.user_data['awaiting_budget_response'] = True
+
+def opener_prompt(location, language):
+    """Запрос к ChatGPT для первого сообщения диалога после выбора локации"""
+    if location == 'any':
+        if language == 'ru':
+            return "Пользователь выбрал язык, бюджет и любое место на острове. Начни диалог."
+        return "User selected language, budget and any location on the island. Start the conversation."
+    if isinstance(location, dict) and 'area' in location:
+        if language == 'ru':
+            return f"Пользователь выбрал язык, бюджет и район {location['name']}. Начни диалог."
+        return f"User selected language, budget and area {location['name']}. Start the conversation."
+    if language == 'ru':
+        return "Пользователь выбрал язык, бюджет и отправил свою локацию. Начни диалог."
+    return "User selected language, budget and sent their location. Start the conversation."
+
+def guess_location(context):
+    """
+    Вероятный выбор локации: район или "любое место" из прошлой сессии,
+    иначе "любое место". Геолокацию угадать нельзя.
+    """
+    location = context.user_data.get('location')
+    if location == 'any' or (isinstance(location, dict) and 'area' in location):
+        return location
+    return 'any'
+
+def start_prefetch(user_id, context, budget, language):
+    """
+    Упреждающая подготовка после выбора бюджета (фоновый приоритет):
+    все рестораны под бюджет с адресами (локация, пожелания и кухня еще
+    неизвестны и применяются при выборе), переводы для следующего шага.
+    Первое сообщение диалога готовится позже (prefetch_opener), когда
+    история диалога уже не изменится.
+    """
+    prefetcher.cancel(user_id)
+    prefetcher.schedule(user_id, ('candidates', budget), asyncio.to_thread(fetch_pool, budget))
+    if language not in ('ru', 'en'):
+        for key in NEXT_STEP_MESSAGES:
+            prefetcher.schedule(user_id, ('text', key), translate_message(key, language, Priority.BACKGROUND))
+
+def prefetch_opener(user_id, context, language):
+    """
+    Первое сообщение диалога для наиболее вероятной локации (фоновый приоритет).
+    Вызывается, когда показаны кнопки выбора локации: до выбора история
+    диалога больше не меняется, и ключ (длина истории) останется верным.
+    """
+    chat_log = context.user_data['chat_log']
+    q = opener_prompt(guess_location(context), language)
+    prefetcher.schedule(user_id, ('opener', q, language, len(chat_log)), ask(q, chat_log, language, Priority.BACKGROUND))
+
+async def prefetched_message(user_id, message_key, language):
+    """Перевод сообщения: из упреждающего кэша, если уже готов, или запросом"""
+    text = await prefetcher.take(user_id, ('text', message_key), wait=False)
+    if text is None:
+        text = await translate_message(message_key, language)
+    return text
+
+async def start_dialogue(update: Update, context: ContextTypes.DEFAULT_TYPE, out: Outbox) -> None:
+    """Первое сообщение ChatGPT после выбора локации"""
+    user_id = update.effective_user.id
     language = context.user_data.get('language', 'en')
-    
-    # Подготавливаем сообщение о сохранении бюджета
-    budget_saved = await translate_message('budget_saved', language)
-    
-    # Удаляем сообщение с кнопками бюджета
-    await query.message.delete()
-    
-    # Удаляем предыдущее сообщение (приветствие)
+    chat_log = context.user_data['chat_log']
+    q = opener_prompt(context.user_data.get('location'), language)
     try:
-        # Получаем ID чата
-        chat_id = query.message.chat_id
-        # Получаем ID сообщения с кнопками
-        message_id = query.message.message_id
-        # Удаляем предыдущее сообщение (message_id - 1)
-        await context.bot.delete_message(chat_id=chat_id, message_id=message_id-1)
+        # Если локация угадана, ответ уже готов. Недоделанный фоновый запрос не ждем:
+        # под нагрузкой он обслуживается последним, а ответа ждет пользователь
+        prefetched = await prefetcher.take(user_id, ('opener', q, language, len(chat_log)), wait=False)
+        if prefetched is None:
+            async with out.typing():
+                prefetched = await ask(q, chat_log, language)
+        a, context.user_data['chat_log'] = prefetched
+        await out.send(a)
     except Exception as e:
-        logger.error(f"Error deleting previous message: {e}")
-    
-    await query.answer()
-    logger.debug("[budget_callback] Query answered")
-    print("[budget_callback] Query answered")
-    
-    # Отправляем сообщение о сохранении бюджета
-    logger.debug(f"[budget_callback] Sending budget_saved message: {budget_saved}")
-    print(f"[budget_callback] Sending budget_saved message: {budget_saved}")
-    await query.message.reply_text(budget_saved)
-    logger.debug("[budget_callback] budget_saved message sent")
-    print("[budget_callback] budget_saved message sent")
-    
-    # Устанавливаем флаг, что ждем ответа пользователя
-    context.user_data['awaiting_budget_response'] = True
+        logger.error(f"Error in ask: {e}")
+        error_message = await translate_message('error', language)
+        await out.send(error_message)
+    finally:
+        # Онбординг закончен: неугаданное больше не понадобится
+        prefetcher.cancel(user_id)
 
 async def location_callback(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Обработчик выбора местоположения"""
     query = update.callback_query
-    await query.answer()
-    
-    language = context.user_data.get('language', 'en')
     
-    if query.data == 'location_near':
-        # Включаем эффект печатания
-        await context.bot.send_chat_action(chat_id=query.message.chat_id, action=ChatAction.TYPING)
-        await asyncio.sleep(1)  # Добавляем небольшую задержку
-        
-        # Проверяем, является ли клиент десктопным
-        if update.effective_user.is_bot or not update.effective_user.is_premium:
-            await query.message.reply_text(
-                "К сожалению, отправка геолокации доступна только в мобильном приложении Telegram. "
-                "Пожалуйста, выберите район из списка или укажите любое место на острове."
-            )
-            # Показываем кнопки районов
-            areas = list(PHUKET_AREAS.items())
-            keyboard = []
-            for i in range(0, len(areas), 2):
-                row = []
-                row.append(InlineKeyboardButton(areas[i][1], callback_data=f'area_{areas[i][0]}'))
-                if i + 1 < len(areas):
-                    row.append(InlineKeyboardButton(areas[i+1][1], callback_data=f'area_{areas[i+1][0]}'))
-                keyboard.append(row)
-            
-            reply_markup = InlineKeyboardMarkup(keyboard)
-            await query.message.reply_text("Выберите район из списка или напишите мне более точное место", reply_markup=reply_markup)
-            return
-            
-        keyboard = [[KeyboardButton("Отправить мою локацию", request_location=True)]]
-        reply_markup = ReplyKeyboardMarkup(keyboard, one_time_keyboard=True)
-        await query.message.reply_text("Пожалуйста, отправьте вашу локацию:", reply_markup=reply_markup)
-    
-    elif query.data == 'location_area':
-        # Включаем эффект печатания
-        await context.bot.send_chat_action(chat_id=query.message.chat_id, action=ChatAction.TYPING)
-        await asyncio.sleep(1)  # Добавляем небольшую задержку
-        
-        # Создаем кнопки районов в два ряда
-        areas = list(PHUKET_AREAS.items())
-        keyboard = []
-        for i in range(0, len(areas), 2):
-            row = []
-            row.append(InlineKeyboardButton(areas[i][1], callback_data=f'area_{areas[i][0]}'))
-            if i + 1 < len(areas):
-                row.append(InlineKeyboardButton(areas[i+1][1], callback_data=f'area_{areas[i+1][0]}'))
-            keyboard.append(row)
+    async with Outbox(update, context) as out:
+        out.answer(query)
         
-        reply_markup = InlineKeyboardMarkup(keyboard)
-        await query.message.reply_text("Выберите район из списка или напишите мне более точное место", reply_markup=reply_markup)
-    
-    elif query.data == 'location_any':
-        # Включаем эффект печатания
-        await context.bot.send_chat_action(chat_id=query.message.chat_id, action=ChatAction.TYPING)
-        await asyncio.sleep(1)  # Добавляем небольшую задержку
-        
-        context.user_data['location'] = 'any'
-        await query.message.reply_text("Хорошо, я буду искать рестораны по всему острову.")
-        # Инициализируем чат с ChatGPT
-        q = "Пользователь выбрал язык, бюджет и любое место на острове. Начни диалог." if language == 'ru' else "User selected language, budget and any location on the island. Start the conversation."
-        try:
-            a, chat_log = ask(q, context.user_data['chat_log'], language)
-            context.user_data['chat_log'] = chat_log
-            await update.message.reply_text(a)
-        except Exception as e:
-            logger.error(f"Error in ask: {e}")
-            error_message = await translate_message('error', language)
-            await update.message.reply_text(error_message)
-
-async def area_callback(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
-    """Обработчик выбора района"""
-    query = update.callback_query
-    await query.answer()
-    
-    language = context.user_data.get('language', 'en')
-    
-    area_id = query.data.split('_')[1]
-    
-    if area_id == 'other':
-        # Если выбран "Другой", просим пользователя ввести место
-        other_message = "Пожалуйста, напишите название района или места, где вы хотите найти ресторан."
-        if language != 'ru':
-            other_message = await translate_message('other_area_prompt', language)
-        await query.message.reply_text(other_message)
-        context.user_data['awaiting_area_input'] = True
-        return
+        if query.data == 'location_near':
+            # Проверяем, является ли клиент десктопным
+            if update.effective_user.is_bot or not update.effective_user.is_premium:
+                out.say(
+                    "К сожалению, отправка геолокации доступна только в мобильном приложении Telegram. "
+                    "Пожалуйста, выберите район из списка или укажите любое место на острове."
+                )
+                # Показываем кнопки районов
+                await out.send("Выберите район из списка или напишите мне более точное место", reply_markup=area_keyboard())
+                return
+                
+            keyboard = [[KeyboardButton("Отправить мою локацию", request_location=True)]]
+            reply_markup = ReplyKeyboardMarkup(keyboard, one_time_keyboard=True)
+            await out.send("Пожалуйста, отправьте вашу локацию:", reply_markup=reply_markup)
         
-    area_name = PHUKET_AREAS[area_id]
-    context.user_data['location'] = {'area': area_id, 'name': area_name}
-    
-    # Получаем координаты центра района
-    geolocator = Nominatim(user_agent="booktable_bot")
+        elif query.data == 'location_area':
+            await out.send("Выберите район из списка или напишите мне более точное место", reply_markup=area_keyboard())
+        
+        elif query.data == 'location_any':
+            context.user_data['location'] = 'any'
+            # Подтверждение уйдет вместе с первым ответом ChatGPT
+            out.say("Хорошо, я буду искать рестораны по всему острову.")
+            await start_dialogue(update, context, out)
+
+def save_user_coordinates(user_id, lon, lat):
+    """Сохраняет координаты пользователя в базу"""
+    conn = get_db_connection()
+    cur = conn.cursor()
+    cur.execute(
+        "UPDATE users SET coordinates = POINT(%s, %s) WHERE telegram_user_id = %s",
+        (lon, lat, user_id)
+    )
+    conn.commit()
+    cur.close()
+    conn.close()
+
+def save_area_coordinates(user_id, area_name):
+    """Получает координаты центра района и сохраняет их в базу"""
     try:
-        location_data = geolocator.geocode(f"{area_name}, Phuket, Thailand")
+        location_data = get_geolocator().geocode(f"{area_name}, Phuket, Thailand")
         if location_data:
-            # Сохраняем координаты в базу
-            conn = get_db_connection()
-            cur = conn.cursor()
-            cur.execute(
-                "UPDATE users SET coordinates = POINT(%s, %s) WHERE telegram_user_id = %s",
-                (location_data.longitude, location_data.latitude, update.effective_user.id)
-            )
-            conn.commit()
-            cur.close()
-            conn.close()
+            save_user_coordinates(user_id, location_data.longitude, location_data.latitude)
     except Exception as e:
         logger.error(f"Error getting coordinates for area: {e}")
+
+async def area_callback(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Обработчик выбора района"""
+    query = update.callback_query
     
-    await query.message.reply_text(f"Выбран район: {area_name}")
-    
-    # Показываем отладочный список ресторанов
-    await debug_show_restaurants(update, context)
-    
-    # Инициализируем чат с ChatGPT
-    q = f"Пользователь выбрал язык, бюджет и район {area_name}. Начни диалог." if language == 'ru' else f"User selected language, budget and area {area_name}. Start the conversation."
+    async with Outbox(update, context) as out:
+        out.answer(query)
+        
+        language = context.user_data.get('language', 'en')
+        
+        area_id = query.data.split('_')[1]
+        
+        if area_id == 'other':
+            # Если выбран "Другой", просим пользователя ввести место
+            other_message = "Пожалуйста, напишите название района или места, где вы хотите найти ресторан."
+            if language != 'ru':
+                other_message = await prefetched_message(update.effective_user.id, 'other_area_prompt', language)
+            await out.send(other_message)
+            context.user_data['awaiting_area_input'] = True
+            return
+            
+        area_name = PHUKET_AREAS[area_id]
+        context.user_data['location'] = {'area': area_id, 'name': area_name}
+        
+        # Координаты центра района нужны только в базе - получаем их параллельно
+        geocoding = asyncio.create_task(asyncio.to_thread(save_area_coordinates, update.effective_user.id, area_name))
+        
+        # Подтверждение и отладочный список ресторанов уходят одним сообщением
+        out.say(f"Выбран район: {area_name}")
+        await debug_show_restaurants(update, context, out)
+        await out.send()
+        
+        await start_dialogue(update, context, out)
+        await geocoding
+
+def budget_range(budget):
+    return BUDGET_RANGES.get(str(budget), (0, 100000))
+
+def load_addresses(restaurant_ids):
+    """Адреса ресторанов (лежат в restaurant_details) одним запросом"""
+    conn = get_db_connection()
     try:
-        a, chat_log = ask(q, context.user_data['chat_log'], language)
-        context.user_data['chat_log'] = chat_log
-        await query.message.reply_text(a)
-    except Exception as e:
-        logger.error(f"Error in ask: {e}")
-        error_message = await translate_message('error', language)
-        await query.message.reply_text(error_message)
+        details = RestaurantDetails(conn, ['address'])
+        details.want(restaurant_ids)
+        return {i: details.get(i).get('address') for i in restaurant_ids}
+    finally:
+        conn.close()
 
-def calculate_distance(lat1, lon1, lat2, lon2):
+def fetch_pool(budget):
+    """Снимок матрицы ранжирования и адреса всех ресторанов под бюджет"""
+    catalog, ids = get_ranker().budget_pool(budget_range(budget))
+    return catalog, load_addresses(ids) if ids else {}
+
+def fetch_candidates(location, budget, preferences=(), cuisine=None, pool=None):
     """
-    Рассчитывает расстояние между двумя точками на Земле в километрах
-    используя формулу гаверсинусов
+    Лучшие рестораны для локации, бюджета и пожеланий вместе с адресами.
+    Порядок задает движок ранжирования (ranking.py).
+    pool - результат fetch_pool(): тогда ранжирование идет в памяти, без базы.
     """
-    R = 6371  # радиус Земли в километрах
-    
-    lat1, lon1, lat2, lon2 = map(radians, [lat1, lon1, lat2, lon2])
-    dlat = lat2 - lat1
-    dlon = lon2 - lon1
-    
-    a = sin(dlat/2)**2 + cos(lat1) * cos(lat2) * sin(dlon/2)**2
-    c = 2 * atan2(sqrt(a), sqrt(1-a))
-    distance = R * c
-    
-    return distance
+    if location == 'any':
+        where = {}
+    elif isinstance(location, dict) and 'area' in location:
+        where = {'area': location['name']}
+    elif isinstance(location, dict) and 'lat' in location and 'lon' in location:
+        where = {'coordinates': (location['lat'], location['lon'])}
+    else:
+        return []
+    catalog, addresses = pool if pool is not None else (None, None)
+    rows = get_ranker().rank(budget_range(budget), preferences=preferences, cuisine=cuisine, catalog=catalog, **where)
+    if rows and addresses is None:
+        # Грузим адреса только для показанных
+        addresses = load_addresses([r['id'] for r in rows])
+    for r in rows:
+        r['address'] = addresses.get(r['id'])
+    return rows
 
-async def debug_show_restaurants(update, context):
-    """Отладочная функция для показа подходящих ресторанов"""
+async def debug_show_restaurants(update, context, out):
+    """
+    Отладочная функция для показа подходящих ресторанов.
+    Список откладывается в out и уходит вместе со следующим сообщением.
+    """
     # Получаем критерии
     location = context.user_data.get('location')
     budget = context.user_data.get('budget')
-    
-    # Преобразуем бюджет в диапазон
-    budget_ranges = {
-        '1': (0, 500),
-        '2': (500, 1500),
-        '3': (1500, 3000),
-        '4': (3000, 100000)
-    }
-    min_check, max_check = budget_ranges.get(str(budget), (0, 100000))
+    preferences = context.user_data.get('preferences', [])
+    cuisine = context.user_data.get('slots', {}).get('cuisine')
     
     try:
-        conn = get_db_connection()
-        cur = conn.cursor(cursor_factory=DictCursor)
-        
-        if location == 'any':
-            # Если любое место - ищем по всему острову
-            cur.execute(
-                """SELECT name, average_check, coordinates FROM restaurants
-                WHERE average_check >= %s AND average_check <= %s AND active = true
-                ORDER BY average_check""", (min_check, max_check)
-            )
-        elif isinstance(location, dict) and 'area' in location:
-            # Если выбран район
-            cur.execute(
-                """SELECT name, average_check, coordinates FROM restaurants
-                WHERE location = %s AND average_check >= %s AND average_check <= %s AND active = true
-                ORDER BY average_check""", (location['name'], min_check, max_check)
-            )
-        elif isinstance(location, dict) and 'lat' in location and 'lon' in location:
-            # Если есть точные координаты пользователя
-            # Получаем все рестораны в радиусе 5 км
-            cur.execute(
-                """SELECT name, average_check, coordinates FROM restaurants
-                WHERE average_check >= %s AND average_check <= %s AND active = true""",
-                (min_check, max_check)
-            )
-            
-            # Фильтруем рестораны по расстоянию
-            user_lat = location['lat']
-            user_lon = location['lon']
-            nearby_restaurants = []
-            
-            for row in cur.fetchall():
-                if row['coordinates']:
-                    # Извлекаем координаты из POINT
-                    rest_lon, rest_lat = row['coordinates']
-                    distance = calculate_distance(user_lat, user_lon, rest_lat, rest_lon)
-                    if distance <= 5:  # 5 км радиус
-                        nearby_restaurants.append({
-                            'name': row['name'],
-                            'average_check': row['average_check'],
-                            'distance': round(distance, 1)
-                        })
-            
-            # Сортируем по расстоянию
-            nearby_restaurants.sort(key=lambda x: x['distance'])
-            rows = nearby_restaurants
+        # Рестораны под бюджет готовятся после его выбора; локация, пожелания и кухня
+        # применяются к ним в памяти
+        pool = await prefetcher.take(update.effective_user.id, ('candidates', budget))
+        if pool is not None:
+            rows = fetch_candidates(location, budget, preferences, cuisine, pool)
         else:
-            rows = []
+            rows = await asyncio.to_thread(fetch_candidates, location, budget, preferences, cuisine)
             
         if not rows:
-            await update.message.reply_text("Нет подходящих ресторанов (отладка)")
+            out.say("Нет подходящих ресторанов (отладка)")
         else:
             msg = "Подходящие рестораны (отладка):\n\n"
             for r in rows:
-                if isinstance(r, dict) and 'distance' in r:
+                if 'distance' in r:
                     # Если это результат поиска по радиусу
-                    msg += f"{r['name']} — {r['average_check']}฿ (в {r['distance']} км)\n"
+                    msg += f"{r['name']} — {r['average_check']:.0f}฿ (в {r['distance']} км)\n"
                 else:
                     # Если это результат поиска по району или всему острову
-                    msg += f"{r['name']} — {r['average_check']}฿\n"
-            await update.message.reply_text(msg)
-            
-        cur.close()
-        conn.close()
+                    msg += f"{r['name']} — {r['average_check']:.0f}฿\n"
+                if r['address']:
+                    msg += f"   {r['address']}\n"
+            out.say(msg.rstrip())
     except Exception as e:
         logger.error(f"Error in debug_show_restaurants: {e}")
-        await update.message.reply_text(f"Ошибка поиска ресторанов: {e}")
+        out.say(f"Ошибка поиска ресторанов: {e}")
 
 async def handle_location(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Обработчик получения геолокации"""
@@ -655,48 +778,33 @@ async def handle_location(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
         'lon': location.longitude
     }
     
-    language = context.user_data.get('language', 'en')
-    
-    # Получаем адрес по координатам
-    geolocator = Nominatim(user_agent="booktable_bot")
+    async with Outbox(update, context) as out:
+        # Адрес по координатам нужен только для сессии и базы - получаем его параллельно
+        geocoding = asyncio.create_task(asyncio.to_thread(reverse_geocode, update.effective_user.id, location))
+        
+        # Подтверждение и отладочный список ресторанов уходят одним сообщением
+        out.say("Спасибо! Теперь я знаю ваше местоположение.")
+        await debug_show_restaurants(update, context, out)
+        await out.send(reply_markup=ReplyKeyboardRemove())
+        
+        await start_dialogue(update, context, out)
+        
+        address = await geocoding
+        if address:
+            context.user_data['location']['address'] = address
+
+def reverse_geocode(user_id, location):
+    """Получает адрес по координатам и сохраняет координаты в базу"""
     try:
-        location_data = geolocator.reverse(f"{location.latitude}, {location.longitude}")
+        location_data = get_geolocator().reverse(f"{location.latitude}, {location.longitude}")
         if location_data:
-            context.user_data['location']['address'] = location_data.address
-            
-            # Сохраняем координаты в базу
-            conn = get_db_connection()
-            cur = conn.cursor()
-            cur.execute(
-                "UPDATE users SET coordinates = POINT(%s, %s) WHERE telegram_user_id = %s",
-                (location.longitude, location.latitude, update.effective_user.id)
-            )
-            conn.commit()
-            cur.close()
-            conn.close()
+            save_user_coordinates(user_id, location.longitude, location.latitude)
+            return location_data.address
     except Exception as e:
         logger.error(f"Error getting address from coordinates: {e}")
-    
-    await update.message.reply_text(
-        "Спасибо! Теперь я знаю ваше местоположение.",
-        reply_markup=ReplyKeyboardRemove()
-    )
-    
-    # Показываем отладочный список ресторанов
-    await debug_show_restaurants(update, context)
-    
-    # Инициализируем чат с ChatGPT
-    q = "Пользователь выбрал язык, бюджет и отправил свою локацию. Начни диалог." if language == 'ru' else "User selected language, budget and sent their location. Start the conversation."
-    try:
-        a, chat_log = ask(q, context.user_data['chat_log'], language)
-        context.user_data['chat_log'] = chat_log
-        await update.message.reply_text(a)
-    except Exception as e:
-        logger.error(f"Error in ask: {e}")
-        error_message = await translate_message('error', language)
-        await update.message.reply_text(error_message)
+    return None
 
-def detect_language(text):
+async def detect_language(text):
     """
     Определяет язык текста с помощью ChatGPT.
     Возвращает код языка в формате ISO 639-1.
@@ -707,35 +815,99 @@ def detect_language(text):
         Текст: "{text}"
         Ответ должен содержать только код языка, без дополнительных слов или символов."""
         
-        response = client.chat.completions.create(
-            model="gpt-4",
-            messages=[{"role": "user", "content": prompt}],
-            temperature=0.1,  # Низкая температура для более точного ответа
-            max_tokens=10
+        lang = await get_router().complete(
+            'detect_language',
+            [{"role": "user", "content": prompt}],
+            Priority.INTERACTIVE
         )
-        
-        lang = response.choices[0].message.content.strip().lower()
+        lang = lang.strip().lower()
         logger.info(f"ChatGPT detected language: {lang}")
-        
-        # Специальная обработка для языков
-        if lang in ['es', 'ca', 'gl']:  # Испанский, каталанский, галисийский
-            return 'es'
-        elif lang in ['fr', 'oc']:  # Французский, окситанский
-            return 'fr'
-        elif lang in ['ru', 'uk', 'be']:  # Русский, украинский, белорусский
-            return 'ru'
-        elif lang in ['zh', 'zh_cn', 'zh_tw']:  # Китайский
-            return 'zh'
-        elif lang in ['ar', 'fa', 'ur']:  # Арабский, персидский, урду
-            return 'ar'
-        elif lang in ['th', 'lo']:  # Тайский, лаосский
-            return 'th'
-            
-        return lang
+        return normalize_language(lang)
     except Exception as e:
         logger.error(f"Error detecting language with ChatGPT: {e}")
         return 'en'  # По умолчанию английский
 
+def normalize_language(lang):
+    """Сводит близкие языки к поддерживаемым"""
+    # Специальная обработка для языков
+    if lang in ['es', 'ca', 'gl']:  # Испанский, каталанский, галисийский
+        return 'es'
+    elif lang in ['fr', 'oc']:  # Французский, окситанский
+        return 'fr'
+    elif lang in ['ru', 'uk', 'be']:  # Русский, украинский, белорусский
+        return 'ru'
+    elif lang in ['zh', 'zh_cn', 'zh_tw', 'zh-cn', 'zh-tw']:  # Китайский
+        return 'zh'
+    elif lang in ['ar', 'fa', 'ur']:  # Арабский, персидский, урду
+        return 'ar'
+    elif lang in ['th', 'lo']:  # Тайский, лаосский
+        return 'th'
+    return lang
+
+def fused_turns_enabled():
+    return get_section('turn').get('fused', 'false').lower() in ('1', 'true', 'yes')
+
+async def fused_turn(text, chat_log, priority=Priority.INTERACTIVE):
+    """
+    Один запрос к LLM вместо detect_language() + ask(): язык, намерение,
+    слоты и ответ (см. turn.py). Возвращает None, если ответ не прошел
+    проверку или запрос не удался - тогда используется обычный путь.
+    """
+    areas = [name for area_id, name in PHUKET_AREAS.items() if area_id != 'other']
+    try:
+        # Кухня - только из каталога, иначе "Thai" не найдет "тайская"
+        cuisines = await asyncio.to_thread(lambda: get_ranker().cuisine_names())
+    except Exception as e:
+        logger.error(f"Failed to load cuisines for fused turn: {e}")
+        cuisines = []
+    try:
+        content = await get_router().complete(
+            'turn', turn_messages(chat_log, text, areas, cuisines), priority,
+            response_format={'type': 'json_object'}
+        )
+        result = parse_turn(content, areas, cuisines)
+    except TurnError as e:
+        turn.stats['invalid'] += 1
+        logger.warning(f"Fused turn rejected, falling back: {e}")
+        return None
+    except Exception as e:
+        turn.stats['failed'] += 1
+        logger.error(f"Fused turn failed, falling back: {e}")
+        return None
+    turn.stats['fused'] += 1
+    result['language'] = normalize_language(result['language'])
+    # В истории диалога остается обычный текст ответа, а не JSON
+    result['chat_log'] = chat_log + [
+        {"role": "user", "content": text},
+        {"role": "assistant", "content": result['reply']},
+    ]
+    return result
+
+def remember_slots(context, slots):
+    """Сохраняет слоты реплики в сессии: кухня и район сразу влияют на поиск ресторанов"""
+    if not slots:
+        return
+    context.user_data.setdefault('slots', {}).update(slots)
+    area_name = slots.get('area')
+    location = context.user_data.get('location')
+    # Точную геолокацию пользователя район из текста не переопределяет
+    if area_name and not (isinstance(location, dict) and 'lat' in location):
+        area_id = next(a for a, name in PHUKET_AREAS.items() if name == area_name)
+        context.user_data['location'] = {'area': area_id, 'name': area_name}
+
+async def dialogue_reply(context, text, language, fused=None):
+    """Ответ ChatGPT на реплику: готовый из совмещенного запроса или через ask()"""
+    if fused is not None:
+        context.user_data['chat_log'] = fused['chat_log']
+        return fused['reply']
+    try:
+        a, chat_log = await ask(text, context.user_data['chat_log'], language)
+        context.user_data['chat_log'] = chat_log
+        return a
+    except Exception as e:
+        logger.error(f"Error in ask: {e}")
+        return await translate_message('error', language)
+
 async def talk(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     user = update.effective_user
     user_id = user["id"]
@@ -743,8 +915,26 @@ async def talk(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
 
     logger.info("Processing message from %s: %s", username, update.message.text)
 
+    async with Outbox(update, context) as out:
+        # "Печатает" показываем сразу, пока определяем язык и готовим ответ
+        async with out.typing():
+            await reply_to_text(update, context, out)
+
+async def reply_to_text(update: Update, context: ContextTypes.DEFAULT_TYPE, out: Outbox) -> None:
+    user = update.effective_user
     text = update.message.text.strip()
-    detected_lang = detect_language(text)
+    
+    # В совмещенном режиме язык, намерение, слоты и ответ приходят одним запросом.
+    # Первое сообщение после /start - только выбор языка, там хватает detect_language
+    fused = None
+    if fused_turns_enabled() and not context.user_data.get('awaiting_language'):
+        fused = await fused_turn(text, context.user_data['chat_log'])
+    if fused is not None:
+        detected_lang = fused['language']
+        remember_slots(context, fused['slots'])
+    else:
+        turn.stats['classic'] += 1
+        detected_lang = await detect_language(text)
     logger.info(f"Detected language: {detected_lang}")
 
     # Если язык отличается от сохранённого — обновляем в базе и в context
@@ -773,24 +963,17 @@ async def talk(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
         )
         logger.info(f"User saved with client_number: {client_number}")
         
-        # Включаем эффект печатания
-        await context.bot.send_chat_action(chat_id=update.message.chat_id, action=ChatAction.TYPING)
-        await asyncio.sleep(1)  # Добавляем небольшую задержку
-        
+        # Приветствие уйдет одним сообщением с кнопками бюджета
         welcome_message = await translate_message('welcome', detected_lang)
-        await update.message.reply_text(welcome_message)
+        out.say(welcome_message)
         
-        await show_budget_buttons(update, context)
+        await show_budget_buttons(update, context, out)
         return
 
     # Если это ответ после выбора бюджета
     if context.user_data.get('awaiting_budget_response'):
         context.user_data['awaiting_budget_response'] = False
         
-        # Включаем эффект печатания
-        await context.bot.send_chat_action(chat_id=update.message.chat_id, action=ChatAction.TYPING)
-        await asyncio.sleep(1)  # Добавляем небольшую задержку
-        
         # Проверяем, относится ли ответ к ресторанам
         restaurant_keywords = ['мясо', 'рыба', 'морепродукты', 'тайская', 'итальянская', 'японская', 
                              'китайская', 'индийская', 'вегетарианская', 'веганская', 'барбекю', 
@@ -798,18 +981,19 @@ async def talk(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
                              'ресторан', 'кухня', 'еда', 'ужин', 'обед', 'завтрак', 'brunch']
         
         text_lower = text.lower()
-        is_restaurant_related = any(keyword in text_lower for keyword in restaurant_keywords)
+        if fused is not None:
+            is_restaurant_related = fused['intent'] in ('search', 'booking')
+        else:
+            is_restaurant_related = any(keyword in text_lower for keyword in restaurant_keywords)
+        
+        # Пожелания (романтика, дети, терраса...) учитываются при ранжировании
+        preferences = detect_preferences(text)
+        if preferences:
+            context.user_data['preferences'] = preferences
         
         if not is_restaurant_related:
             # Если ответ не о ресторанах - используем ChatGPT
-            try:
-                a, chat_log = ask(text, context.user_data['chat_log'], detected_lang)
-                context.user_data['chat_log'] = chat_log
-                await update.message.reply_text(a)
-            except Exception as e:
-                logger.error(f"Error in ask: {e}")
-                error_message = await translate_message('error', detected_lang)
-                await update.message.reply_text(error_message)
+            out.say(await dialogue_reply(context, text, detected_lang, fused))
         
         # В любом случае показываем кнопки выбора локации в одну строку
         keyboard = [[
@@ -819,23 +1003,22 @@ async def talk(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
         ]]
         reply_markup = InlineKeyboardMarkup(keyboard)
         
+        # Ответ ChatGPT и вопрос о локации уходят одним сообщением
         location_message = "Прекрасно, подберу для Вас отличный ресторан! Поискать поблизости, в другом районе или в любом месте на Пхукете?"
-        await update.message.reply_text(location_message, reply_markup=reply_markup)
+        await out.send(location_message, reply_markup=reply_markup)
+        
+        # Пока пользователь выбирает локацию, готовим первое сообщение диалога
+        prefetch_opener(user.id, context, detected_lang)
         return
 
     # Все остальные сообщения — обычный диалог
-    try:
-        # Включаем эффект печатания
-        await context.bot.send_chat_action(chat_id=update.message.chat_id, action=ChatAction.TYPING)
-        await asyncio.sleep(1)  # Добавляем небольшую задержку
-        
-        a, chat_log = ask(update.message.text, context.user_data['chat_log'], detected_lang)
-        context.user_data['chat_log'] = chat_log
-        await update.message.reply_text(a)
-    except Exception as e:
-        logger.error("Error in ask: %s", e)
-        error_message = await translate_message('error', detected_lang)
-        await update.message.reply_text(error_message)
+    out.say(await dialogue_reply(context, update.message.text, detected_lang, fused))
+    
+    # Если пользователь уточнил поиск (кухня, район), сразу показываем подходящие рестораны
+    if (fused is not None and fused['intent'] == 'search' and fused['slots']
+            and context.user_data.get('location') and context.user_data.get('budget')):
+        await debug_show_restaurants(update, context, out)
+    await out.send()
 
 async def check_budget(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Показывает текущий выбранный бюджет"""
@@ -849,8 +1032,43 @@ async def check_budget(update: Update, context: ContextTypes.DEFAULT_TYPE) -> No
     
     await update.message.reply_text(message)
 
-def main():
-    app = ApplicationBuilder().token(telegram_token).build()
+async def log_limiter_stats(app) -> None:
+    """Выводит метрики ограничителей, входного контроля и расход LLM при остановке бота"""
+    for limiter in (openai_limiter, telegram_limiter):
+        logger.info(f"Rate limiter {limiter.name} stats: {limiter.stats()}")
+    logger.info(f"LLM usage by task: {get_router().stats()}")
+    logger.info(f"Outbound Telegram calls: {outbound.stats}")
+    logger.info(f"Prefetch: {prefetcher.stats()}")
+    logger.info(f"Admission: {admission.stats()}")
+    logger.info(f"Turns: {dict(turn.stats)}")
+
+async def warm_up_clients(app) -> None:
+    """
+    post_init: запускает импорт тяжелых клиентов в фоновых потоках.
+    post_init выполняется до начала polling, но не ждет этих задач,
+    поэтому polling стартует, не дожидаясь прогрева.
+    """
+    app.create_task(asyncio.to_thread(get_openai_client))
+    app.create_task(asyncio.to_thread(get_ranker))
+
+def build_application(persistence=None):
+    """Создает приложение бота со всеми обработчиками"""
+    # Профили моделей читаются здесь: ошибка в config.ini видна сразу при старте
+    get_router()
+    builder = (
+        ApplicationBuilder()
+        .token(telegram_token)
+        .rate_limiter(TelegramRateLimiter(telegram_limiter))
+        .concurrent_updates(UserSerialUpdateProcessor(int(os.getenv('CONCURRENT_UPDATES', '16')), admission))
+        .post_init(warm_up_clients)
+        .post_shutdown(log_limiter_stats)
+    )
+    if persistence is not None:
+        builder = builder.persistence(persistence)
+    app = builder.build()
+    
+    # Входной контроль выполняется раньше всех обработчиков
+    app.add_handler(TypeHandler(Update, admission.check), group=-1)
     
     # Базовые команды
     app.add_handler(CommandHandler("start", start))
@@ -866,8 +1084,79 @@ def main():
     app.add_handler(MessageHandler(filters.LOCATION, handle_location))
     app.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, talk))
     
+    return app
+
+async def run_supervised(app, standby=False, ready_file=None, released_file=None):
+    """
+    Запуск под supervisor.py для перезагрузки без простоя.
+    Процесс инициализируется, сообщает о готовности через ready_file и,
+    в режиме standby, начинает polling только по SIGUSR1.
+    По SIGTERM прекращает polling, дорабатывает уже полученные обновления,
+    сохраняет сессии в базу и только после этого создает released_file -
+    супервизор запускает polling нового процесса. Так обновления одного
+    пользователя никогда не обрабатываются двумя процессами сразу, а новый
+    процесс читает из базы уже сохраненные сессии.
+    """
+    loop = asyncio.get_running_loop()
+    go = asyncio.Event()
+    stop = asyncio.Event()
+    loop.add_signal_handler(signal.SIGUSR1, go.set)
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(sig, stop.set)
+
+    async with app:
+        await app.post_init(app)
+        if ready_file:
+            with open(ready_file, 'w') as f:
+                f.write(str(os.getpid()))
+        logger.info("Bot is ready" + (", waiting for handover" if standby else ""))
+
+        if standby:
+            await asyncio.wait(
+                [asyncio.create_task(go.wait()), asyncio.create_task(stop.wait())],
+                return_when=asyncio.FIRST_COMPLETED
+            )
+
+        if not stop.is_set():
+            await app.updater.start_polling()
+            await app.start()
+            logger.info("Polling started")
+            await stop.wait()
+
+            # Сначала перестаем забирать обновления (updater.stop() подтверждает offset),
+            # потом дорабатываем полученные и сохраняем сессии
+            await app.updater.stop()
+            await app.stop()
+            if app.persistence:
+                await app.update_persistence()
+            logger.info("Drained in-flight updates")
+            if released_file:
+                with open(released_file, 'w') as f:
+                    f.write(str(os.getpid()))
+        await app.post_shutdown(app)
+
+def main():
+    parser = argparse.ArgumentParser(description="BookTable bot")
+    parser.add_argument('--persist', action='store_true', help="Хранить сессии в PostgreSQL (bot_sessions)")
+    parser.add_argument('--standby', action='store_true', help="Ждать SIGUSR1 перед началом polling")
+    parser.add_argument('--ready-file', help="Файл, который создается, когда бот готов принимать обновления")
+    parser.add_argument('--released-file', help="Файл, который создается, когда бот по SIGTERM доработал обновления и сохранил сессии")
+    args = parser.parse_args()
+
+    setup_logging()
+    logger.info(f"Starting BookTable bot version {read_version()}")
+
+    persistence = None
+    if args.persist:
+        from persistence import PostgresPersistence
+        persistence = PostgresPersistence(get_db_connection)
+    app = build_application(persistence=persistence)
+    
     # Запуск бота
-    app.run_polling()
+    if args.standby or args.ready_file:
+        asyncio.run(run_supervised(app, args.standby, args.ready_file, args.released_file))
+    else:
+        app.run_polling()
 
 if __name__ == '__main__':
     main()
\ No newline at end of file
@@ -0,0 +1,213 @@
+"""
+Маршрутизация запросов к LLM по задачам.
+
+Для каждой задачи (диалог, определение языка, перевод, совмещенная
+реплика) задается свой
+профиль: модель, температура, max_tokens и цена. Профили по умолчанию
+можно переопределить в config.ini секциями [model:<задача>]:
+
+    [model:dialogue]
+    model = gpt-4
+    temperature = 0.7
+    max_tokens = 1000
+    hedge_model = gpt-4o-mini
+    hedge_after = 6
+
+Если основная модель не ответила за hedge_after секунд, параллельно
+отправляется запрос к hedge_model, и используется ответ, пришедший первым.
+Запрос к модели не отменяется - ни проигравший в гонке, ни брошенный
+отмененным вызывающим (например, упреждающей задачей): синхронный вызов
+клиента в потоке все равно не прервать. Он дорабатывает в фоне, держит
+свое место в ограничителе, а его токены и стоимость попадают в учет.
+
+По каждой задаче ведется учет задержек, токенов и стоимости.
+Для проверки на локальной заглушке (scripts/openai_stub.py) достаточно
+задать OPENAI_BASE_URL.
+"""
+
+import asyncio
+import logging
+import time
+
+from settings import get_section
+
+logger = logging.getLogger(__name__)
+
+# Профили по умолчанию. Цены - доллары за 1000 токенов (вход, выход)
+DEFAULT_PROFILES = {
+    'dialogue': {
+        'model': 'gpt-4', 'temperature': 0.7, 'max_tokens': 1000,
+        'hedge_model': 'gpt-4o-mini', 'hedge_after': 6.0,
+    },
+    'detect_language': {
+        'model': 'gpt-4o-mini', 'temperature': 0.0, 'max_tokens': 5,
+    },
+    'translate': {
+        'model': 'gpt-4o-mini', 'temperature': 0.3, 'max_tokens': 100,
+    },
+    # Совмещенная реплика (turn.py): нужна модель с поддержкой JSON-режима
+    'turn': {
+        'model': 'gpt-4o', 'temperature': 0.7, 'max_tokens': 1000,
+        'hedge_model': 'gpt-4o-mini', 'hedge_after': 6.0,
+    },
+}
+
+PRICES = {
+    'gpt-4': (0.03, 0.06),
+    'gpt-4o': (0.0025, 0.01),
+    'gpt-4o-mini': (0.00015, 0.0006),
+}
+
+
+class TaskProfile:
+    """Параметры вызова LLM для одной задачи"""
+
+    def __init__(self, task, model, temperature=0.7, max_tokens=None,
+                 hedge_model=None, hedge_after=None, price_in=None, price_out=None):
+        self.task = task
+        self.model = model
+        self.temperature = float(temperature)
+        self.max_tokens = int(max_tokens) if max_tokens else None
+        self.hedge_model = hedge_model or None
+        self.hedge_after = float(hedge_after) if hedge_after else None
+        self.prices = {}
+        for name in {model, hedge_model} - {None}:
+            default_in, default_out = PRICES.get(name, (0.0, 0.0))
+            if name == model and price_in is not None:
+                default_in, default_out = float(price_in), float(price_out or 0)
+            self.prices[name] = (default_in, default_out)
+
+    def request(self, model):
+        kwargs = {'model': model, 'temperature': self.temperature}
+        if self.max_tokens:
+            kwargs['max_tokens'] = self.max_tokens
+        return kwargs
+
+
+def load_profiles():
+    """Профили по умолчанию, дополненные секциями [model:<задача>] из config.ini"""
+    profiles = {}
+    for task, defaults in DEFAULT_PROFILES.items():
+        params = dict(defaults, **get_section(f'model:{task}'))
+        profiles[task] = TaskProfile(task, **params)
+    return profiles
+
+
+class ModelRouter:
+    """
+    Выполняет запросы к LLM по профилю задачи.
+
+    call - корутина call(priority, **kwargs), делающая сам запрос
+    (в боте это create_chat_completion с ограничителем частоты).
+    """
+
+    def __init__(self, profiles, call):
+        self.profiles = profiles
+        self.call = call
+        self._stats = {}
+        self._background = set()  # Проигравшие запросы, которые еще выполняются
+
+    def _task_stats(self, task):
+        return self._stats.setdefault(task, {
+            'calls': 0, 'errors': 0, 'cancelled': 0, 'hedged': 0, 'hedge_wins': 0, 'in_background': 0,
+            'latency_total': 0.0, 'latency_max': 0.0,
+            'prompt_tokens': 0, 'completion_tokens': 0, 'cost': 0.0,
+        })
+
+    async def _request(self, profile, model, messages, priority, overrides):
+        response = await self.call(priority, messages=messages, **dict(profile.request(model), **overrides))
+        return model, response
+
+    async def complete(self, task, messages, priority, **overrides):
+        """
+        Возвращает текст ответа для задачи task.
+        overrides переопределяют параметры профиля (например, max_tokens).
+        """
+        profile = self.profiles[task]
+        stats = self._task_stats(task)
+        started = time.monotonic()
+        stats['calls'] += 1
+        try:
+            model, response = await self._complete_hedged(profile, messages, priority, overrides, stats)
+        except asyncio.CancelledError:
+            stats['cancelled'] += 1
+            raise
+        except Exception:
+            stats['errors'] += 1
+            raise
+
+        latency = time.monotonic() - started
+        stats['latency_total'] += latency
+        stats['latency_max'] = max(stats['latency_max'], latency)
+        self._record_usage(profile, stats, model, response)
+        logger.debug(f"[{task}] {model} answered in {latency:.2f}s")
+        return response.choices[0].message.content
+
+    @staticmethod
+    def _record_usage(profile, stats, model, response):
+        usage = getattr(response, 'usage', None)
+        if usage is not None:
+            price_in, price_out = profile.prices.get(model, (0.0, 0.0))
+            stats['prompt_tokens'] += usage.prompt_tokens
+            stats['completion_tokens'] += usage.completion_tokens
+            stats['cost'] += (usage.prompt_tokens * price_in + usage.completion_tokens * price_out) / 1000
+
+    def _finish_in_background(self, profile, stats, task):
+        """Оставляет ненужный запрос дорабатывать; по завершении учитывает его токены"""
+        stats['in_background'] += 1
+        self._background.add(task)
+
+        def done(task):
+            self._background.discard(task)
+            if task.cancelled():
+                return
+            if task.exception() is not None:
+                logger.debug(f"[{profile.task}] abandoned request failed: {task.exception()}")
+                return
+            model, response = task.result()
+            self._record_usage(profile, stats, model, response)
+
+        task.add_done_callback(done)
+
+    async def _complete_hedged(self, profile, messages, priority, overrides, stats):
+        primary = asyncio.create_task(self._request(profile, profile.model, messages, priority, overrides))
+        try:
+            if not profile.hedge_model:
+                # Отмена вызывающего не должна отменять запрос, который уже выполняется в потоке
+                return await asyncio.shield(primary)
+            done, _ = await asyncio.wait({primary}, timeout=profile.hedge_after)
+        except asyncio.CancelledError:
+            self._finish_in_background(profile, stats, primary)
+            raise
+        if done:
+            return primary.result()
+
+        stats['hedged'] += 1
+        logger.info(f"[{profile.task}] {profile.model} is slow, hedging with {profile.hedge_model}")
+        hedge = asyncio.create_task(self._request(profile, profile.hedge_model, messages, priority, overrides))
+        pending = {primary, hedge}
+        error = None
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is hedge:
+                            stats['hedge_wins'] += 1
+                        return task.result()
+                    error = task.exception()
+            raise error
+        finally:
+            # Ответ проигравшего (или обоих, если отменили вызывающего) не нужен,
+            # но отмена не остановит поток с запросом
+            for task in pending:
+                self._finish_in_background(profile, stats, task)
+
+    def stats(self):
+        result = {}
+        for task, stats in self._stats.items():
+            answered = stats['calls'] - stats['errors'] - stats['cancelled']
+            avg = stats['latency_total'] / answered if answered else 0.0
+            result[task] = dict(stats, latency_avg=round(avg, 3), cost=round(stats['cost'], 4))
+        result['running_in_background'] = len(self._background)
+        return result
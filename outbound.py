@@ -0,0 +1,137 @@
+"""
+Исходящие сообщения бота в рамках одного обновления.
+
+Outbox собирает все обращения обработчика к Telegram:
+- соседние тексты, отложенные через say(), уходят одним сообщением
+  при следующем send() или в конце обработки
+- независимые вызовы (удаление сообщений, ответ на callback) выполняются
+  параллельно в фоне и дожидаются только в конце обработки
+- индикатор "печатает" держится, пока идет работа, вместо фиксированных пауз
+- считается количество вызовов Telegram API на каждое обновление
+
+Использование:
+    async with Outbox(update, context) as out:
+        out.answer(query)
+        out.delete(query.message.message_id)
+        out.say("Выбран район: Ката")
+        async with out.typing():
+            answer = await ask(...)
+        await out.send(answer, reply_markup=keyboard)
+"""
+
+import asyncio
+import logging
+import time
+from collections import Counter
+from contextlib import asynccontextmanager
+
+from telegram.constants import ChatAction, MessageLimit
+
+logger = logging.getLogger(__name__)
+
+TYPING_REFRESH = 4.5  # Индикатор "печатает" гаснет через 5 секунд
+
+# Сводные метрики по всем обновлениям
+stats = {'updates': 0, 'calls': Counter(), 'merged_texts': 0}
+
+
+def split_text(text, limit=MessageLimit.MAX_TEXT_LENGTH):
+    """Делит длинный текст на части не длиннее лимита Telegram, по возможности по строкам"""
+    chunks = []
+    while len(text) > limit:
+        cut = text.rfind('\n', 0, limit)
+        if cut <= 0:
+            cut = limit
+        chunks.append(text[:cut])
+        text = text[cut:].lstrip('\n')
+    chunks.append(text)
+    return chunks
+
+
+class Outbox:
+
+    def __init__(self, update, context):
+        self.bot = context.bot
+        self.chat_id = update.effective_chat.id
+        self.update_id = update.update_id
+        self.calls = Counter()
+        self._texts = []
+        self._tasks = []
+        self._started = time.monotonic()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.flush()
+        stats['updates'] += 1
+        stats['calls'].update(self.calls)
+        logger.debug(
+            f"[outbound] update {self.update_id}: {sum(self.calls.values())} Telegram calls "
+            f"{dict(self.calls)} in {time.monotonic() - self._started:.2f}s"
+        )
+
+    async def _call(self, method, coro):
+        self.calls[method] += 1
+        return await coro
+
+    def background(self, method, coro):
+        """Запускает независимый вызов параллельно, результат дожидается в flush()"""
+        self._tasks.append(asyncio.create_task(self._call(method, coro)))
+
+    def say(self, text):
+        """Откладывает текст, чтобы отправить его вместе со следующим"""
+        self._texts.append(text)
+
+    async def send(self, text=None, reply_markup=None, **kwargs):
+        """Отправляет отложенные тексты и text одним сообщением"""
+        if text is not None:
+            self._texts.append(text)
+        if not self._texts:
+            return None
+        if len(self._texts) > 1:
+            stats['merged_texts'] += len(self._texts) - 1
+        chunks = split_text("\n\n".join(self._texts))
+        self._texts = []
+        message = None
+        for i, chunk in enumerate(chunks):
+            markup = reply_markup if i == len(chunks) - 1 else None
+            message = await self._call(
+                'sendMessage',
+                self.bot.send_message(chat_id=self.chat_id, text=chunk, reply_markup=markup, **kwargs)
+            )
+        return message
+
+    def delete(self, message_id):
+        self.background('deleteMessage', self.bot.delete_message(chat_id=self.chat_id, message_id=message_id))
+
+    def answer(self, query, text=None):
+        self.background('answerCallbackQuery', query.answer(text))
+
+    @asynccontextmanager
+    async def typing(self):
+        """Показывает "печатает", пока выполняется блок"""
+        async def keep_typing():
+            while True:
+                try:
+                    await self._call(
+                        'sendChatAction',
+                        self.bot.send_chat_action(chat_id=self.chat_id, action=ChatAction.TYPING)
+                    )
+                except Exception as e:
+                    logger.error(f"Error sending chat action: {e}")
+                await asyncio.sleep(TYPING_REFRESH)
+
+        task = asyncio.create_task(keep_typing())
+        try:
+            yield
+        finally:
+            task.cancel()
+
+    async def flush(self):
+        """Отправляет оставшиеся тексты и дожидается фоновых вызовов"""
+        await self.send()
+        tasks, self._tasks = self._tasks, []
+        for result in await asyncio.gather(*tasks, return_exceptions=True):
+            if isinstance(result, Exception):
+                logger.error(f"Background Telegram call failed: {result}")
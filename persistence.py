@@ -0,0 +1,166 @@
+"""
+Хранение сессий бота (context.user_data) в PostgreSQL.
+
+Используется, когда бот запущен несколькими процессами: каждый воркер
+держит в памяти только своих пользователей, а при переезде пользователя
+на другой воркер (падение, перебалансировка) сессия подгружается из базы.
+
+У каждой сессии есть версия (колонка version), она растет при каждой
+записи. Воркер помнит версию своей копии и перед каждым обновлением
+перечитывает сессию, только если в базе версия новее - например, когда
+пользователь успел поработать на другом воркере и вернулся обратно.
+Запись условная: если в базе уже более новая версия, устаревшая копия
+не затирает ее, а сбрасывается и будет перечитана.
+
+Таблица bot_sessions создается скриптом scripts/migrate_sessions.sql.
+"""
+
+import asyncio
+import json
+import logging
+import threading
+
+from psycopg2.extras import Json
+from telegram.ext import BasePersistence, PersistenceInput
+
+logger = logging.getLogger(__name__)
+
+
+class PostgresPersistence(BasePersistence):
+    """
+    Persistence для python-telegram-bot, хранящий user_data в JSONB.
+
+    connect - функция, возвращающая соединение psycopg2 (например, get_db_connection)
+    update_interval - как часто (сек) изменения сбрасываются в базу
+    """
+
+    def __init__(self, connect, update_interval=5):
+        super().__init__(
+            store_data=PersistenceInput(bot_data=False, chat_data=False, user_data=True, callback_data=False),
+            update_interval=update_interval
+        )
+        self._connect = connect
+        self._conn = None
+        self._lock = threading.Lock()
+        self._versions = {}  # user_id -> версия сессии, с которой работает этот воркер
+
+    def _execute(self, query, params, fetch=False):
+        """Выполняет запрос в общем соединении, переподключаясь при обрыве"""
+        with self._lock:
+            return self._execute_locked(query, params, fetch)
+
+    def _execute_locked(self, query, params, fetch):
+        for attempt in range(2):
+            try:
+                if self._conn is None or self._conn.closed:
+                    self._conn = self._connect()
+                with self._conn.cursor() as cur:
+                    cur.execute(query, params)
+                    result = cur.fetchone() if fetch else None
+                self._conn.commit()
+                return result
+            except Exception as e:
+                logger.error(f"Session storage error: {e}")
+                if self._conn is not None:
+                    self._conn.close()
+                    self._conn = None
+                if attempt == 1:
+                    raise
+
+    async def load_user_data(self, user_id, newer_than=-1):
+        """Сессия и ее версия, если версия в базе больше newer_than, иначе None"""
+        return await asyncio.to_thread(
+            self._execute,
+            "SELECT user_data, version FROM bot_sessions WHERE telegram_user_id = %s AND version > %s",
+            (user_id, newer_than),
+            True
+        )
+
+    async def get_user_data(self):
+        # Сессии загружаются лениво в refresh_user_data, а не все сразу при старте
+        return {}
+
+    async def refresh_user_data(self, user_id, user_data):
+        # Один запрос по первичному ключу; если копия актуальна, данные не передаются
+        known = self._versions.get(user_id)
+        row = await self.load_user_data(user_id, -1 if known is None else known)
+        if row is not None:
+            if known is not None:
+                logger.info(f"Session of user {user_id} was changed by another worker, reloading")
+            user_data.clear()
+            user_data.update(row[0])
+            self._versions[user_id] = row[1]
+        elif known is None:
+            # Сессии в базе еще нет
+            self._versions[user_id] = 0
+
+    async def update_user_data(self, user_id, data):
+        row = await asyncio.to_thread(
+            self._execute,
+            """
+            INSERT INTO bot_sessions (telegram_user_id, user_data, version, updated_at)
+            VALUES (%s, %s, 1, CURRENT_TIMESTAMP)
+            ON CONFLICT (telegram_user_id)
+            DO UPDATE SET user_data = EXCLUDED.user_data, version = bot_sessions.version + 1,
+                          updated_at = EXCLUDED.updated_at
+            WHERE bot_sessions.version = %s
+            RETURNING version
+            """,
+            (user_id, Json(data, dumps=lambda obj: json.dumps(obj, default=str)), self._versions.get(user_id, 0)),
+            True
+        )
+        if row is not None:
+            self._versions[user_id] = row[0]
+        else:
+            # Сессию уже сохранил другой воркер: наша копия устарела, перечитаем ее при следующем обновлении
+            logger.warning(f"Session of user {user_id} was saved by another worker, discarding the local copy")
+            self._versions.pop(user_id, None)
+
+    async def drop_user_data(self, user_id):
+        self._versions.pop(user_id, None)
+        await asyncio.to_thread(
+            self._execute,
+            "DELETE FROM bot_sessions WHERE telegram_user_id = %s",
+            (user_id,)
+        )
+
+    async def flush(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+    # Остальные данные не хранятся (см. store_data)
+
+    async def get_chat_data(self):
+        return {}
+
+    async def get_bot_data(self):
+        return {}
+
+    async def get_callback_data(self):
+        return None
+
+    async def get_conversations(self, name):
+        return {}
+
+    async def update_chat_data(self, chat_id, data):
+        pass
+
+    async def update_bot_data(self, data):
+        pass
+
+    async def update_callback_data(self, data):
+        pass
+
+    async def update_conversation(self, name, key, new_state):
+        pass
+
+    async def drop_chat_data(self, chat_id):
+        pass
+
+    async def refresh_chat_data(self, chat_id, chat_data):
+        pass
+
+    async def refresh_bot_data(self, bot_data):
+        pass
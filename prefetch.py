@@ -0,0 +1,107 @@
+"""
+Упреждающее выполнение в воронке онбординга.
+
+Пока пользователь выбирает локацию, бот заранее готовит то, что
+понадобится на следующем шаге (рестораны под бюджет, переводы,
+первое сообщение диалога). Результаты лежат в кэше сессии:
+- у каждой записи есть TTL, просроченные записи отменяются
+- запись забирается один раз (take); если задача еще выполняется,
+  take дожидается ее, а не запускает работу заново. Задачи с фоновым
+  приоритетом ждать нельзя, когда ответа ждет пользователь: под нагрузкой
+  они обслуживаются последними. Для них take(wait=False) отменяет
+  незавершенную задачу, и вызывающий делает обычный запрос
+- cancel() отменяет все незабранные задачи сессии
+
+Реестр сессий хранится в памяти процесса, а не в user_data: задачи
+asyncio нельзя сохранить в persistence. В режиме нескольких рабочих
+процессов пользователь всегда попадает в один процесс (dispatcher.py).
+"""
+
+import asyncio
+import logging
+import time
+from collections import Counter
+
+logger = logging.getLogger(__name__)
+
+
+class Prefetcher:
+
+    def __init__(self, ttl):
+        self.ttl = ttl
+        self._sessions = {}  # user_id -> {key: (task, expires)}
+        self._stats = Counter()
+        self._wait_total = 0.0
+
+    def schedule(self, user_id, key, coro, ttl=None):
+        """Запускает coro в фоне и кладет задачу в кэш сессии под ключом key"""
+        self._purge()
+        entries = self._sessions.setdefault(user_id, {})
+        if key in entries:
+            entries.pop(key)[0].cancel()
+        task = asyncio.create_task(coro)
+        task.add_done_callback(self._log_failure)
+        entries[key] = (task, time.monotonic() + (ttl or self.ttl))
+        self._stats['scheduled'] += 1
+
+    async def take(self, user_id, key, wait=True):
+        """
+        Возвращает результат задачи key или None, если ее нет,
+        она просрочена или завершилась ошибкой.
+        wait=False - не ждать незавершенную задачу, а отменить ее и вернуть None.
+        """
+        entry = self._sessions.get(user_id, {}).pop(key, None)
+        if entry is None:
+            self._stats['misses'] += 1
+            return None
+        task, expires = entry
+        if time.monotonic() > expires:
+            task.cancel()
+            self._stats['expired'] += 1
+            return None
+
+        if not task.done() and not wait:
+            task.cancel()
+            self._stats['abandoned'] += 1
+            return None
+        if not task.done():
+            started = time.monotonic()
+            await asyncio.wait({task})
+            self._stats['waited'] += 1
+            self._wait_total += time.monotonic() - started
+        if task.cancelled() or task.exception() is not None:
+            self._stats['failed'] += 1
+            return None
+        self._stats['hits'] += 1
+        return task.result()
+
+    def cancel(self, user_id):
+        """Отменяет все незабранные задачи сессии"""
+        for task, _ in self._sessions.pop(user_id, {}).values():
+            if not task.done():
+                task.cancel()
+                self._stats['cancelled'] += 1
+
+    def _purge(self):
+        now = time.monotonic()
+        for user_id in list(self._sessions):
+            entries = self._sessions[user_id]
+            for key in [k for k, (_, expires) in entries.items() if expires < now]:
+                entries.pop(key)[0].cancel()
+                self._stats['expired'] += 1
+            if not entries:
+                del self._sessions[user_id]
+
+    @staticmethod
+    def _log_failure(task):
+        # Забираем исключение, чтобы asyncio не ругался на неполученный результат
+        if not task.cancelled() and task.exception() is not None:
+            logger.warning(f"Prefetch task failed: {task.exception()}")
+
+    def stats(self):
+        waited = self._stats['waited']
+        return dict(
+            self._stats,
+            sessions=len(self._sessions),
+            wait_avg=round(self._wait_total / waited, 3) if waited else 0.0,
+        )
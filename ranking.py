@@ -0,0 +1,239 @@
+"""
+Ранжирование ресторанов-кандидатов.
+
+Горячие колонки активных ресторанов держатся в памяти в виде массивов
+NumPy (матрица признаков). Оценка всех кандидатов считается одним
+векторным проходом:
+
+    score = w_budget * соответствие бюджету (1 внутри диапазона)
+          + w_distance * близость (только при известных координатах)
+          + w_rating * рейтинг (Google и TripAdvisor, 0..1)
+          + w_preferences * доля совпавших пожеланий (romantic, kids_menu, ...)
+          + w_discount * скидка
+          + w_michelin * michelin
+          + w_cuisine * совпадение кухни (если пользователь ее назвал)
+
+Бюджет - жесткий фильтр: рестораны со средним чеком вне диапазона не
+рассматриваются. budget_tolerance (в батах) допускает небольшой выход
+за края диапазона, соответствие бюджету при этом линейно падает до 0.
+
+Лучшие K выбираются частичной сортировкой (np.argpartition).
+Матрица перестраивается, только если изменился каталог: проверяется
+COUNT(*) и MAX(updated_at) таблицы restaurants (не чаще refresh_interval).
+
+budget_pool() возвращает снимок матрицы и рестораны, подходящие по
+бюджету; rank(catalog=...) по такому снимку работает без обращения
+к базе (упреждающая подготовка в main.py).
+
+Веса и параметры задаются в config.ini:
+
+    [ranking]
+    budget = 1.0
+    distance = 1.0
+    rating = 1.0
+    preferences = 0.5
+    discount = 0.2
+    michelin = 0.3
+    cuisine = 1.0
+    budget_tolerance = 0
+    top_k = 10
+    radius_km = 5
+    distance_scale_km = 2
+    refresh_interval = 60
+"""
+
+import logging
+import threading
+import time
+
+import numpy as np
+
+from restaurants import FLAG_COLUMNS, parse_point
+from settings import get_section
+
+logger = logging.getLogger(__name__)
+
+DEFAULTS = {
+    'budget': 1.0, 'distance': 1.0, 'rating': 1.0,
+    'preferences': 0.5, 'discount': 0.2, 'michelin': 0.3, 'cuisine': 1.0,
+    'budget_tolerance': 0.0, 'top_k': 10, 'radius_km': 5.0, 'distance_scale_km': 2.0,
+    'refresh_interval': 60.0,
+}
+
+EARTH_RADIUS_KM = 6371.0
+
+
+class Catalog:
+    """Матрица признаков активных ресторанов"""
+
+    def __init__(self, rows):
+        n = len(rows)
+        self.ids = np.array([r['id'] for r in rows], dtype=np.int64)
+        self.names = [r['name'] for r in rows]
+        self.locations = np.array([r['location'] or '' for r in rows], dtype=object)
+        self.cuisines = np.array([(r['cuisine'] or '').lower() for r in rows], dtype=str)
+        # Словарь кухонь каталога (колонка может содержать несколько через запятую)
+        self.cuisine_vocabulary = sorted({c.strip() for value in self.cuisines for c in value.split(',') if c.strip()})
+        self.average_check = np.array(
+            [float(r['average_check']) if r['average_check'] is not None else np.nan for r in rows]
+        )
+
+        points = [parse_point(r['coordinates']) for r in rows]
+        self.lon = np.radians([p[0] if p else np.nan for p in points])
+        self.lat = np.radians([p[1] if p else np.nan for p in points])
+
+        # Рейтинг 0..1: среднее доступных рейтингов, без рейтинга - середина шкалы
+        ratings = np.array(
+            [[float(r[c]) if r[c] is not None else np.nan for c in ('google_rating', 'tripadvisor_rating')] for r in rows]
+        ).reshape(n, 2) / 5.0
+        known = ~np.isnan(ratings)
+        totals = np.where(known, ratings, 0.0).sum(axis=1)
+        counts = known.sum(axis=1)
+        self.rating = np.divide(totals, counts, out=np.full(n, 0.5), where=counts > 0)
+
+        self.discount = np.array([float(r['discount'] or 0) for r in rows]) / 100.0
+        self.flags = np.array([[bool(r[c]) for c in FLAG_COLUMNS] for r in rows], dtype=bool).reshape(n, len(FLAG_COLUMNS))
+
+    def __len__(self):
+        return len(self.ids)
+
+
+class Ranker:
+    """
+    Ранжирует рестораны по матрице признаков.
+    connect - функция, возвращающая новое соединение psycopg2.
+    """
+
+    def __init__(self, connect, config=None):
+        params = dict(DEFAULTS, **(config if config is not None else get_section('ranking')))
+        self.connect = connect
+        self.weights = {k: float(params[k]) for k in ('budget', 'distance', 'rating', 'preferences', 'discount', 'michelin', 'cuisine')}
+        self.budget_tolerance = float(params['budget_tolerance'])
+        self.top_k = int(params['top_k'])
+        self.radius_km = float(params['radius_km'])
+        self.distance_scale_km = float(params['distance_scale_km'])
+        self.refresh_interval = float(params['refresh_interval'])
+        self.catalog = None
+        self._version = None
+        self._checked = 0.0
+        self._lock = threading.Lock()
+
+    def refresh(self, force=False):
+        """Перестраивает матрицу, если каталог изменился"""
+        if not force and self.catalog is not None and time.monotonic() - self._checked < self.refresh_interval:
+            return
+        with self._lock:
+            if not force and self.catalog is not None and time.monotonic() - self._checked < self.refresh_interval:
+                return
+            conn = self.connect()
+            cur = conn.cursor()
+            try:
+                cur.execute("SELECT COUNT(*), MAX(updated_at) FROM restaurants")
+                version = cur.fetchone()
+                if force or version != self._version:
+                    started = time.monotonic()
+                    cur.execute(
+                        f"""SELECT id, name, cuisine, location, average_check, coordinates, google_rating,
+                        tripadvisor_rating, discount, {', '.join(FLAG_COLUMNS)}
+                        FROM restaurants WHERE active = true ORDER BY id"""
+                    )
+                    columns = [d.name for d in cur.description]
+                    catalog = Catalog([dict(zip(columns, row)) for row in cur.fetchall()])
+                    # Подменяем целиком: параллельные rank() видят либо старую, либо новую матрицу
+                    self.catalog, self._version = catalog, version
+                    logger.info(f"Ranking catalog rebuilt: {len(catalog)} restaurants in {time.monotonic() - started:.2f}s")
+                self._checked = time.monotonic()
+            finally:
+                cur.close()
+                conn.close()
+
+    def cuisine_names(self):
+        """Кухни каталога в нижнем регистре - значения, которые понимает rank(cuisine=...)"""
+        self.refresh()
+        return self.catalog.cuisine_vocabulary
+
+    def _budget_fit(self, catalog, budget_range):
+        # Соответствие бюджету: 1 внутри диапазона, за краями - 0 или линейное падение до 0 на budget_tolerance
+        low, high = (float(x) for x in budget_range)
+        outside = np.maximum(low - catalog.average_check, 0) + np.maximum(catalog.average_check - high, 0)
+        if self.budget_tolerance > 0:
+            fit = np.clip(1 - outside / self.budget_tolerance, 0, 1)
+        else:
+            fit = (outside == 0).astype(float)
+        return np.nan_to_num(fit, nan=0.0)
+
+    def budget_pool(self, budget_range):
+        """Снимок матрицы и список id ресторанов, проходящих фильтр бюджета"""
+        self.refresh()
+        catalog = self.catalog
+        if not len(catalog):
+            return catalog, []
+        return catalog, catalog.ids[self._budget_fit(catalog, budget_range) > 0].tolist()
+
+    def rank(self, budget_range, area=None, coordinates=None, preferences=(), cuisine=None, k=None, catalog=None):
+        """
+        Лучшие рестораны по убыванию оценки.
+        budget_range - (min, max) среднего чека; area - название района;
+        coordinates - (lat, lon) пользователя, тогда учитывается радиус;
+        cuisine - кухня, которую назвал пользователь (подстрока колонки cuisine);
+        catalog - снимок матрицы из budget_pool(), тогда актуальность каталога не проверяется.
+        Возвращает список словарей id, name, location, average_check, score (+ distance).
+        """
+        if catalog is None:
+            self.refresh()
+            catalog = self.catalog
+        k = k or self.top_k
+        if not len(catalog):
+            return []
+        w = self.weights
+
+        budget_fit = self._budget_fit(catalog, budget_range)
+        mask = budget_fit > 0
+
+        score = w['budget'] * budget_fit + w['rating'] * catalog.rating
+        score += w['discount'] * catalog.discount
+        score += w['michelin'] * catalog.flags[:, FLAG_COLUMNS.index('michelin')]
+
+        if area is not None:
+            mask &= catalog.locations == area
+
+        distance = None
+        if coordinates is not None:
+            lat, lon = np.radians(coordinates[0]), np.radians(coordinates[1])
+            a = (np.sin((catalog.lat - lat) / 2) ** 2
+                 + np.cos(lat) * np.cos(catalog.lat) * np.sin((catalog.lon - lon) / 2) ** 2)
+            # Без координат ресторан считается бесконечно далеким
+            distance = np.where(np.isnan(a), np.inf, 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(a)))
+            mask &= distance <= self.radius_km
+            score += w['distance'] * np.exp(-distance / self.distance_scale_km)
+
+        wanted = [FLAG_COLUMNS.index(p) for p in preferences if p in FLAG_COLUMNS]
+        if wanted:
+            score += w['preferences'] * catalog.flags[:, wanted].mean(axis=1)
+
+        if cuisine and len(catalog.cuisines):
+            score += w['cuisine'] * (np.char.find(catalog.cuisines, cuisine.lower()) >= 0)
+
+        candidates = np.flatnonzero(mask)
+        if not len(candidates):
+            return []
+        if len(candidates) > k:
+            # Частичная сортировка: O(n) на отбор K лучших, сортируются только они
+            top = candidates[np.argpartition(-score[candidates], k - 1)[:k]]
+        else:
+            top = candidates
+        top = top[np.argsort(-score[top], kind='stable')]
+
+        result = []
+        for i in top:
+            row = {
+                'id': int(catalog.ids[i]),
+                'name': catalog.names[i],
+                'location': catalog.locations[i],
+                'average_check': float(catalog.average_check[i]),
+                'score': round(float(score[i]), 3),
+            }
+            if distance is not None:
+                row['distance'] = round(float(distance[i]), 1)
+            result.append(row)
+        return result
@@ -0,0 +1,257 @@
+"""
+Общий ограничитель исходящих запросов к OpenAI и Telegram.
+
+Для каждого внешнего сервиса заводится свой token bucket. Запросы, которым
+не хватило токена, встают в очередь с приоритетом: интерактивный диалог
+обслуживается первым, подтверждения — вторыми, прогрев и фоновые задачи —
+последними. Поэтому при перегрузке ответы пользователю деградируют в
+последнюю очередь.
+
+Если сервис ответил 429 / flood wait, ведро блокируется на время Retry-After
+для всех, а не только для запроса, который получил ошибку.
+
+ConcurrencyLimit ограничивает число одновременных операций (например,
+запросов к LLM в работе) с той же приоритетной очередью.
+"""
+
+import asyncio
+import heapq
+import itertools
+import logging
+import time
+from contextlib import asynccontextmanager
+from datetime import timedelta
+from email.utils import parsedate_to_datetime
+from enum import IntEnum
+
+from telegram.error import RetryAfter
+from telegram.ext import BaseRateLimiter
+
+logger = logging.getLogger(__name__)
+
+
+class Priority(IntEnum):
+    """Классы приоритета: чем меньше значение, тем раньше обслуживается запрос."""
+    INTERACTIVE = 0   # Ответы в диалоге
+    CONFIRMATION = 1  # Подтверждения выбора, служебные сообщения
+    BACKGROUND = 2    # Прогрев, предзагрузка, удаление сообщений
+
+
+class TokenBucket:
+    """
+    Token bucket с приоритетной очередью ожидания.
+
+    rate - скорость пополнения (токенов в секунду)
+    capacity - максимальный размер всплеска
+    """
+
+    def __init__(self, name, rate, capacity=None):
+        self.name = name
+        self.rate = float(rate)
+        self.capacity = float(capacity or rate)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._blocked_until = 0.0
+        self._waiters = []  # (priority, seq, future)
+        self._seq = itertools.count()
+        self._timer = None
+        self._stats = {p: {'requests': 0, 'queued': 0, 'wait_total': 0.0, 'wait_max': 0.0} for p in Priority}
+
+    def _refill(self, now):
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def _try_take(self, now):
+        if now < self._blocked_until:
+            return False
+        self._refill(now)
+        if self._tokens >= 1:
+            self._tokens -= 1
+            return True
+        return False
+
+    def _delay_until_token(self, now):
+        return max(self._blocked_until - now, (1 - self._tokens) / self.rate, 0.001)
+
+    def _has_waiters(self):
+        while self._waiters and self._waiters[0][2].done():
+            heapq.heappop(self._waiters)
+        return bool(self._waiters)
+
+    def _drain(self):
+        """Раздает накопившиеся токены ожидающим в порядке приоритета."""
+        self._timer = None
+        now = time.monotonic()
+        while self._has_waiters():
+            if not self._try_take(now):
+                break
+            _, _, future = heapq.heappop(self._waiters)
+            future.set_result(None)
+        if self._has_waiters():
+            loop = asyncio.get_running_loop()
+            self._timer = loop.call_later(self._delay_until_token(now), self._drain)
+
+    def _record(self, priority, waited):
+        stats = self._stats[priority]
+        stats['requests'] += 1
+        if waited > 0:
+            stats['queued'] += 1
+            stats['wait_total'] += waited
+            stats['wait_max'] = max(stats['wait_max'], waited)
+            if waited > 1:
+                logger.debug(f"[{self.name}] {priority.name} request waited {waited:.2f}s in queue")
+
+    def try_acquire(self):
+        """Берет токен без ожидания. Возвращает False, если токенов нет."""
+        if self._has_waiters():
+            return False
+        return self._try_take(time.monotonic())
+
+    async def acquire(self, priority=Priority.INTERACTIVE):
+        """Ждет свободный токен с учетом приоритета."""
+        priority = Priority(priority)
+        start = time.monotonic()
+        if not self._has_waiters() and self._try_take(start):
+            self._record(priority, 0.0)
+            return
+
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        heapq.heappush(self._waiters, (priority, next(self._seq), future))
+        if self._timer is None:
+            self._timer = loop.call_later(self._delay_until_token(start), self._drain)
+        # Отмененный future остается в куче и выбрасывается при следующей раздаче
+        await future
+        self._record(priority, time.monotonic() - start)
+
+    def retry_after(self, seconds):
+        """Блокирует ведро для всех запросов на указанное сервисом время."""
+        now = time.monotonic()
+        self._blocked_until = max(self._blocked_until, now + seconds)
+        self._tokens = 0
+        # Пополнение начинается с конца блокировки, иначе сразу после нее ушел бы целый всплеск
+        self._updated = self._blocked_until
+        logger.warning(f"[{self.name}] upstream asked to retry after {seconds:.1f}s")
+
+    def stats(self):
+        """Метрики очереди по каждому классу приоритета."""
+        result = {}
+        for priority, stats in self._stats.items():
+            avg = stats['wait_total'] / stats['requests'] if stats['requests'] else 0.0
+            result[priority.name.lower()] = dict(stats, wait_avg=avg)
+        result['waiting'] = sum(1 for _, _, f in self._waiters if not f.done())
+        return result
+
+
+class ConcurrencyLimit:
+    """
+    Ограничение числа одновременно выполняемых операций.
+
+    Как и в TokenBucket, ожидающие обслуживаются в порядке приоритета:
+    освободившееся место получает самый срочный запрос.
+    """
+
+    def __init__(self, name, limit):
+        self.name = name
+        self.limit = int(limit)
+        self.inflight = 0
+        self._waiters = []  # (priority, seq, future)
+        self._seq = itertools.count()
+        self._stats = {'acquired': 0, 'queued': 0, 'wait_total': 0.0, 'wait_max': 0.0, 'inflight_max': 0}
+
+    @property
+    def waiting(self):
+        return sum(1 for _, _, f in self._waiters if not f.done())
+
+    async def acquire(self, priority=Priority.INTERACTIVE):
+        start = time.monotonic()
+        if self.inflight < self.limit and not self.waiting:
+            self.inflight += 1
+        else:
+            future = asyncio.get_running_loop().create_future()
+            heapq.heappush(self._waiters, (Priority(priority), next(self._seq), future))
+            self._stats['queued'] += 1
+            try:
+                await future
+            except asyncio.CancelledError:
+                # Место уже передали этому запросу, но он отменен - отдаем следующему
+                if future.done() and not future.cancelled():
+                    self.release()
+                raise
+            waited = time.monotonic() - start
+            self._stats['wait_total'] += waited
+            self._stats['wait_max'] = max(self._stats['wait_max'], waited)
+        self._stats['acquired'] += 1
+        self._stats['inflight_max'] = max(self._stats['inflight_max'], self.inflight)
+
+    def release(self):
+        # Место передается ожидающему напрямую, inflight не меняется
+        while self._waiters:
+            _, _, future = heapq.heappop(self._waiters)
+            if not future.done():
+                future.set_result(None)
+                return
+        self.inflight -= 1
+
+    @asynccontextmanager
+    async def slot(self, priority=Priority.INTERACTIVE):
+        await self.acquire(priority)
+        try:
+            yield
+        finally:
+            self.release()
+
+    def stats(self):
+        return dict(self._stats, inflight=self.inflight, waiting=self.waiting)
+
+
+def parse_retry_after(value, default=None):
+    """Разбирает заголовок Retry-After: число секунд или HTTP-дата."""
+    if value is None:
+        return default
+    if isinstance(value, timedelta):
+        return value.total_seconds()
+    try:
+        return max(float(value), 0.0)
+    except (TypeError, ValueError):
+        pass
+    try:
+        return max(parsedate_to_datetime(value).timestamp() - time.time(), 0.0)
+    except (TypeError, ValueError):
+        return default
+
+
+class TelegramRateLimiter(BaseRateLimiter):
+    """
+    Ограничитель для python-telegram-bot на основе общего TokenBucket.
+
+    Приоритет можно передать явно через rate_limit_args={'priority': ...},
+    иначе он выбирается по методу Bot API.
+    """
+
+    ENDPOINT_PRIORITIES = {
+        'answerCallbackQuery': Priority.CONFIRMATION,
+        'deleteMessage': Priority.BACKGROUND,
+        'sendChatAction': Priority.BACKGROUND,
+    }
+
+    def __init__(self, bucket, max_retries=2):
+        self.bucket = bucket
+        self.max_retries = max_retries
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        pass
+
+    async def process_request(self, callback, args, kwargs, endpoint, data, rate_limit_args):
+        priority = (rate_limit_args or {}).get('priority', self.ENDPOINT_PRIORITIES.get(endpoint, Priority.INTERACTIVE))
+        for attempt in range(self.max_retries + 1):
+            await self.bucket.acquire(priority)
+            try:
+                return await callback(*args, **kwargs)
+            except RetryAfter as e:
+                self.bucket.retry_after(parse_retry_after(e.retry_after, 1.0))
+                if attempt == self.max_retries:
+                    raise
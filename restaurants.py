@@ -0,0 +1,220 @@
+"""
+Доступ к каталогу ресторанов.
+
+Каталог разделен на две таблицы:
+- restaurants - узкая "горячая" таблица: то, что читает поиск
+  (название, кухня, район, чек, координаты, рейтинги, флаги)
+- restaurant_details - "холодные" колонки, которые нужны только
+  при показе карточки ресторана или бронировании
+
+Детали подгружаются лениво и пачками через RestaurantDetails.
+Схема и типы колонок здесь - единый источник для загрузчика каталога
+(scripts/load_restaurants.py) и миграции (scripts/split_restaurants.sql).
+"""
+
+import logging
+
+from psycopg2.extras import DictCursor
+
+logger = logging.getLogger(__name__)
+
+# Горячие колонки: читаются при каждом поиске
+HOT_COLUMNS = {
+    'id': 'INTEGER',
+    'name': 'VARCHAR(255)',
+    'cuisine': 'VARCHAR(255)',
+    'location': 'VARCHAR(255)',
+    'average_check': 'DECIMAL(10,2)',
+    'coordinates': 'POINT',
+    'active': 'BOOLEAN',
+    'discount': 'DECIMAL(5,2)',
+    'google_rating': 'DECIMAL(2,1)',
+    'tripadvisor_rating': 'DECIMAL(2,1)',
+    'michelin': 'BOOLEAN',
+    'romantic': 'BOOLEAN',
+    'group_friendly': 'BOOLEAN',
+    'kids_menu': 'BOOLEAN',
+    'child_friendly': 'BOOLEAN',
+    'local_favorite': 'BOOLEAN',
+    'business_friendly': 'BOOLEAN',
+    'solo_friendly': 'BOOLEAN',
+    'tourist_friendly': 'BOOLEAN',
+    'outdoor_seating': 'BOOLEAN',
+    'private_dining': 'BOOLEAN',
+    'reservation_required': 'BOOLEAN',
+}
+
+# Холодные колонки: нужны только для карточки ресторана и бронирования
+DETAIL_COLUMNS = {
+    'atmosphere': 'TEXT',
+    'features': 'TEXT[]',
+    'working_hours': 'JSONB',
+    'booking_method': 'VARCHAR(50)',
+    'booking_contact': 'VARCHAR(255)',
+    'key_dishes': 'TEXT[]',
+    'map_link': 'TEXT',
+    'meal_types': 'TEXT[]',
+    'service_options': 'TEXT[]',
+    'dietary_options': 'TEXT[]',
+    'occasions': 'TEXT[]',
+    'drinks_entertainment': 'TEXT[]',
+    'accessibility': 'TEXT[]',
+    'address': 'TEXT',
+    'phone': 'VARCHAR(50)',
+    'website': 'TEXT',
+    'instagram': 'TEXT',
+    'tripadvisor_link': 'TEXT',
+    'payment_methods': 'TEXT[]',
+    'wifi': 'BOOLEAN',
+    'languages_spoken': 'TEXT[]',
+    'menu_languages': 'TEXT[]',
+    'menu_options': 'TEXT[]',
+    'spicy_dishes': 'BOOLEAN',
+    'portion_size': 'VARCHAR(50)',
+    'customizable_dishes': 'BOOLEAN',
+    'dish_of_the_day': 'BOOLEAN',
+    'organic_local_ingredients': 'BOOLEAN',
+    'tasting_menu': 'BOOLEAN',
+    'takeaway_available': 'BOOLEAN',
+    'delivery_options': 'TEXT[]',
+    'catering_available': 'BOOLEAN',
+    'allergen_info': 'TEXT',
+    'product_source_info': 'TEXT',
+    'sustainability_policy': 'TEXT',
+    'drink_specials': 'TEXT[]',
+    'corkage_fee': 'DECIMAL(10,2)',
+    'wine_list': 'TEXT[]',
+    'cocktails': 'TEXT[]',
+    'non_alcoholic_drinks': 'TEXT[]',
+    'coffee_tea_options': 'TEXT[]',
+    'sommelier_available': 'BOOLEAN',
+    'noise_level': 'VARCHAR(50)',
+    'view': 'TEXT[]',
+    'air_conditioning': 'BOOLEAN',
+    'smoking_area': 'BOOLEAN',
+    'pet_friendly': 'BOOLEAN',
+    'kids_area': 'BOOLEAN',
+    'high_chairs': 'BOOLEAN',
+    'animation_family_entertainment': 'BOOLEAN',
+    'dress_code': 'VARCHAR(255)',
+    'power_sockets': 'BOOLEAN',
+    'qr_menu': 'BOOLEAN',
+    'mobile_app': 'BOOLEAN',
+    'online_chat_available': 'BOOLEAN',
+    'event_support': 'BOOLEAN',
+    'gift_cards': 'BOOLEAN',
+    'holiday_specials': 'BOOLEAN',
+    'instagrammable': 'BOOLEAN',
+    'chef_interaction': 'BOOLEAN',
+    'unique_features': 'TEXT[]',
+    'story_or_concept': 'TEXT',
+    'nearby_landmarks': 'TEXT[]',
+    'popular_with': 'TEXT[]',
+    'senior_friendly': 'BOOLEAN',
+    'fast_service': 'BOOLEAN',
+    'notable_mentions': 'TEXT[]',
+    'celebrity_visits': 'TEXT[]',
+    'press_features': 'TEXT[]',
+    'customer_quotes': 'TEXT[]',
+    'hygiene_measures': 'TEXT[]',
+    'certifications': 'TEXT[]',
+    'cleaning_protocol': 'TEXT',
+    'safety_policy': 'TEXT',
+}
+
+# Колонки, которые показываются в карточке ресторана
+CARD_COLUMNS = ['address', 'phone', 'working_hours', 'key_dishes', 'atmosphere']
+
+# Колонки, которые нужны для бронирования
+BOOKING_COLUMNS = ['booking_method', 'booking_contact', 'phone', 'reservation_required']
+
+# Флаги-пожелания, которые можно учитывать при ранжировании
+FLAG_COLUMNS = [
+    'michelin', 'romantic', 'group_friendly', 'kids_menu', 'child_friendly',
+    'local_favorite', 'business_friendly', 'solo_friendly', 'tourist_friendly',
+    'outdoor_seating', 'private_dining',
+]
+
+# Ключевые слова в сообщении пользователя -> флаги
+PREFERENCE_KEYWORDS = {
+    'romantic': ['романт', 'свидан', 'romantic', 'date'],
+    'group_friendly': ['компани', 'друзья', 'group', 'friends', 'party'],
+    'kids_menu': ['детск', 'kids'],
+    'child_friendly': ['дет', 'ребен', 'ребён', 'child', 'family', 'семь'],
+    'local_favorite': ['местн', 'local'],
+    'business_friendly': ['делов', 'бизнес', 'business'],
+    'outdoor_seating': ['террас', 'на улице', 'outdoor', 'terrace'],
+    'private_dining': ['отдельн', 'private'],
+    'michelin': ['мишлен', 'michelin'],
+}
+
+
+def detect_preferences(text):
+    """Флаги-пожелания, упомянутые в тексте"""
+    text = text.lower()
+    return [flag for flag, words in PREFERENCE_KEYWORDS.items() if any(w in text for w in words)]
+
+
+def parse_point(value):
+    """
+    Координаты POINT в виде (lon, lat).
+    psycopg2 без адаптера возвращает POINT строкой "(lon,lat)".
+    """
+    if value is None:
+        return None
+    if isinstance(value, str):
+        lon, lat = value.strip('()').split(',')
+        return float(lon), float(lat)
+    lon, lat = value
+    return float(lon), float(lat)
+
+
+def fetch_details(conn, restaurant_ids, columns=None):
+    """
+    Загружает детальные колонки для списка ресторанов одним запросом.
+    Возвращает словарь {restaurant_id: {колонка: значение}}.
+    """
+    ids = list(set(restaurant_ids))
+    if not ids:
+        return {}
+    columns = [c for c in (columns or DETAIL_COLUMNS) if c in DETAIL_COLUMNS]
+    cur = conn.cursor(cursor_factory=DictCursor)
+    try:
+        cur.execute(
+            f"SELECT restaurant_id, {', '.join(columns)} FROM restaurant_details WHERE restaurant_id = ANY(%s)",
+            (ids,)
+        )
+        return {row['restaurant_id']: {c: row[c] for c in columns} for row in cur}
+    finally:
+        cur.close()
+
+
+class RestaurantDetails:
+    """
+    Ленивая пакетная подгрузка деталей ресторанов.
+
+    Сначала через want() регистрируются все рестораны, которые будут
+    показаны, а первый get() загружает их детали одним запросом.
+    """
+
+    def __init__(self, conn, columns=None):
+        self.conn = conn
+        self.columns = columns
+        self._pending = set()
+        self._cache = {}
+
+    def want(self, restaurant_ids):
+        self._pending.update(i for i in restaurant_ids if i not in self._cache)
+
+    def get(self, restaurant_id):
+        if restaurant_id not in self._cache:
+            self._pending.add(restaurant_id)
+            self._load()
+        return self._cache.get(restaurant_id) or {}
+
+    def _load(self):
+        ids, self._pending = self._pending, set()
+        loaded = fetch_details(self.conn, ids, self.columns)
+        logger.debug(f"Loaded details for {len(loaded)} of {len(ids)} restaurants")
+        for restaurant_id in ids:
+            self._cache[restaurant_id] = loaded.get(restaurant_id, {})
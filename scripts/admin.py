@@ -0,0 +1,237 @@
+#!/usr/bin/env python3
+"""
+Административная выгрузка и просмотр базы данных BookTable.
+
+Функциональность:
+- Потоковая выгрузка users, bookings и restaurants в CSV, JSONL или на экран
+- Серверные (именованные) курсоры: строки читаются пачками по --fetch-size,
+  память не зависит от размера таблицы
+- Фильтры по колонкам и по дате, постраничная выгрузка по ключу (--after / --limit)
+- Сводка (количество по языкам, бронирования по статусам и датам) считается в SQL
+
+Использование:
+    python3 scripts/admin.py export users --format csv --output users.csv
+    python3 scripts/admin.py export users --filter language=ru --limit 100 --after 5000
+    python3 scripts/admin.py export bookings --since 2026-01-01 --filter status=confirmed --format jsonl
+    python3 scripts/admin.py export restaurants --filter location=Паттонг --details
+    python3 scripts/admin.py summary bookings --days 30
+
+Требования:
+- PostgreSQL должен быть запущен
+- База данных booktable должна существовать
+- Пользователь root должен иметь доступ к базе
+"""
+
+import argparse
+import csv
+import json
+import sys
+from datetime import date, timedelta
+
+import psycopg2
+from psycopg2 import sql
+from psycopg2.extras import DictCursor
+
+# Описание таблиц: источник, ключ для постраничной выгрузки, колонка даты для --since/--until
+TABLES = {
+    'users': {'source': 'users', 'key': 'client_number', 'date': None},
+    'bookings': {'source': 'bookings', 'key': 'booking_number', 'date': 'date'},
+    'restaurants': {'source': 'restaurants', 'details': 'restaurants_full', 'key': 'id', 'date': 'updated_at'},
+}
+
+# Сводки: заголовок и запрос с группировкой
+SUMMARIES = {
+    'users': [
+        ("Users by language", "SELECT language, COUNT(*) AS users FROM users GROUP BY language ORDER BY users DESC"),
+        ("Users with phone", "SELECT COUNT(*) FILTER (WHERE phone IS NOT NULL) AS with_phone, COUNT(*) AS total FROM users"),
+    ],
+    'bookings': [
+        ("Bookings by status", "SELECT status, COUNT(*) AS bookings, SUM(guests) AS guests FROM bookings GROUP BY status ORDER BY bookings DESC"),
+        ("Bookings by date", "SELECT date, COUNT(*) AS bookings, SUM(guests) AS guests FROM bookings WHERE date >= %(since)s GROUP BY date ORDER BY date"),
+        ("Top restaurants", "SELECT restaurant, COUNT(*) AS bookings FROM bookings WHERE date >= %(since)s GROUP BY restaurant ORDER BY bookings DESC LIMIT 20"),
+    ],
+    'restaurants': [
+        ("Restaurants by location", "SELECT location, COUNT(*) FILTER (WHERE active) AS active, COUNT(*) AS total, ROUND(AVG(average_check)) AS avg_check FROM restaurants GROUP BY location ORDER BY total DESC"),
+    ],
+}
+
+
+def get_connection():
+    conn = psycopg2.connect(
+        dbname="booktable",
+        user="root",
+        host="/var/run/postgresql"
+    )
+    conn.set_session(readonly=True)
+    return conn
+
+
+def build_query(args):
+    """Собирает SELECT с фильтрами и постраничной выгрузкой"""
+    table = TABLES[args.table]
+    source = table['details'] if args.details and 'details' in table else table['source']
+    key = sql.Identifier(table['key'])
+    conditions, params = [], []
+
+    for item in args.filter:
+        column, sep, value = item.partition('=')
+        if not sep:
+            sys.exit(f"Invalid filter {item!r}, expected column=value")
+        if value == 'null':
+            conditions.append(sql.SQL("{} IS NULL").format(sql.Identifier(column)))
+        else:
+            # Сравниваем как текст, чтобы фильтр работал для любых типов
+            conditions.append(sql.SQL("{}::text = %s").format(sql.Identifier(column)))
+            params.append(value)
+    if args.since or args.until:
+        if not table['date']:
+            sys.exit(f"Table {args.table} has no date column for --since/--until")
+        date_column = sql.Identifier(table['date'])
+        if args.since:
+            conditions.append(sql.SQL("{} >= %s").format(date_column))
+            params.append(args.since)
+        if args.until:
+            conditions.append(sql.SQL("{} < %s").format(date_column))
+            params.append(args.until)
+    if args.after is not None:
+        conditions.append(sql.SQL("{} > %s").format(key))
+        params.append(args.after)
+
+    query = sql.SQL("SELECT * FROM {}").format(sql.Identifier(source))
+    if conditions:
+        query += sql.SQL(" WHERE ") + sql.SQL(" AND ").join(conditions)
+    query += sql.SQL(" ORDER BY {}").format(key)
+    if args.limit:
+        query += sql.SQL(" LIMIT %s")
+        params.append(args.limit)
+    return query, params
+
+
+def to_text(value):
+    """Значение для CSV: массивы и JSON как JSON, остальное как строка"""
+    if value is None:
+        return ''
+    if isinstance(value, (list, dict)):
+        return json.dumps(value, ensure_ascii=False, default=str)
+    return str(value)
+
+
+class TableWriter:
+    """Построчный вывод в читаемом виде (как в check_db.py)"""
+
+    def __init__(self, out):
+        self.out = out
+
+    def header(self, columns):
+        pass
+
+    def row(self, row):
+        for column, value in row.items():
+            self.out.write(f"{column}: {'' if value is None else value}\n")
+        self.out.write("-" * 50 + "\n")
+
+
+class CsvWriter:
+
+    def __init__(self, out):
+        self.writer = csv.writer(out)
+
+    def header(self, columns):
+        self.writer.writerow(columns)
+
+    def row(self, row):
+        self.writer.writerow([to_text(v) for v in row.values()])
+
+
+class JsonlWriter:
+
+    def __init__(self, out):
+        self.out = out
+
+    def header(self, columns):
+        pass
+
+    def row(self, row):
+        self.out.write(json.dumps(dict(row), ensure_ascii=False, default=str) + "\n")
+
+
+WRITERS = {'table': TableWriter, 'csv': CsvWriter, 'jsonl': JsonlWriter}
+
+
+def export(args):
+    query, params = build_query(args)
+    out = open(args.output, 'w', encoding='utf-8', newline='') if args.output else sys.stdout
+    writer = WRITERS[args.format](out)
+    key = TABLES[args.table]['key']
+
+    conn = get_connection()
+    # Именованный курсор живет на сервере: клиент получает строки пачками
+    cur = conn.cursor(name=f"admin_export_{args.table}", cursor_factory=DictCursor)
+    count, last_key = 0, None
+    try:
+        cur.execute(query, params)
+        while True:
+            rows = cur.fetchmany(args.fetch_size)
+            if count == 0:
+                writer.header([d.name for d in cur.description])
+            if not rows:
+                break
+            for row in rows:
+                writer.row(row)
+            count += len(rows)
+            last_key = rows[-1][key]
+    finally:
+        cur.close()
+        conn.close()
+        if args.output:
+            out.close()
+
+    print(f"Exported {count} rows from {args.table}", file=sys.stderr)
+    if args.limit and count == args.limit:
+        print(f"Next page: --after {last_key}", file=sys.stderr)
+
+
+def summary(args):
+    conn = get_connection()
+    cur = conn.cursor()
+    params = {'since': date.today() - timedelta(days=args.days)}
+    try:
+        for title, query in SUMMARIES[args.table]:
+            cur.execute(query, params)
+            columns = [d.name for d in cur.description]
+            print(f"\n{title}:")
+            print("  " + " | ".join(columns))
+            for row in cur:
+                print("  " + " | ".join('' if v is None else str(v) for v in row))
+    finally:
+        cur.close()
+        conn.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Выгрузка и просмотр базы данных BookTable")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    export_parser = subparsers.add_parser('export', help="Потоковая выгрузка таблицы")
+    export_parser.add_argument('table', choices=sorted(TABLES))
+    export_parser.add_argument('--format', choices=sorted(WRITERS), default='table', help="Формат вывода")
+    export_parser.add_argument('--output', help="Файл для выгрузки (по умолчанию stdout)")
+    export_parser.add_argument('--fetch-size', type=int, default=2000, help="Строк за одно обращение к серверу")
+    export_parser.add_argument('--filter', action='append', default=[], help="Фильтр column=value (можно несколько)")
+    export_parser.add_argument('--since', help="Дата начала (включительно), YYYY-MM-DD")
+    export_parser.add_argument('--until', help="Дата конца (не включительно), YYYY-MM-DD")
+    export_parser.add_argument('--after', help="Выгружать строки с ключом больше указанного")
+    export_parser.add_argument('--limit', type=int, help="Максимум строк (размер страницы)")
+    export_parser.add_argument('--details', action='store_true', help="Для restaurants: включить колонки restaurant_details")
+    export_parser.set_defaults(func=export)
+
+    summary_parser = subparsers.add_parser('summary', help="Сводка, посчитанная в SQL")
+    summary_parser.add_argument('table', choices=sorted(SUMMARIES))
+    summary_parser.add_argument('--days', type=int, default=30, help="Период для сводок по датам")
+    summary_parser.set_defaults(func=summary)
+
+    args = parser.parse_args()
+    args.func(args)
+
+if __name__ == "__main__":
+    main()
@@ -7,6 +7,8 @@
 - Подключается к базе данных PostgreSQL
 - Выводит содержимое таблицы users
 - Показывает все поля для каждого пользователя
+- Читает пользователей пачками через серверный курсор
+  (для выгрузок и фильтров см. scripts/admin.py)
 
 Использование:
     python3 scripts/check_db.py
@@ -32,15 +34,16 @@ def check_users():
             host="/var/run/postgresql"
         )
         
-        # Создаем курсор с поддержкой именованных колонок
-        cur = conn.cursor(cursor_factory=DictCursor)
+        # Создаем серверный курсор с поддержкой именованных колонок,
+        # чтобы не загружать всю таблицу в память
+        cur = conn.cursor(name="check_users", cursor_factory=DictCursor)
+        cur.itersize = 1000
         
         # Получаем всех пользователей
-        cur.execute("SELECT * FROM users;")
-        users = cur.fetchall()
+        cur.execute("SELECT * FROM users ORDER BY client_number;")
         
         # Выводим информацию о каждом пользователе
-        for user in users:
+        for user in cur:
             print("\nИнформация о пользователе:")
             print(f"Порядковый номер: {user['client_number']}")
             print(f"ID в Telegram: {user['telegram_user_id']}")
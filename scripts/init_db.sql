@@ -1,12 +1,15 @@
 -- Скрипт инициализации базы данных BookTable
--- Версия: 1.0.0
--- Дата: 2024-03-15
+-- Версия: 1.1.0
+-- Дата: 2026-10-19
 -- Описание: Создает структуру базы данных для бота BookTable
 --
 -- Структура базы:
 -- 1. Таблица users - информация о пользователях
 -- 2. Таблица bookings - информация о бронированиях
--- 3. Таблица restaurants - информация о ресторанах
+-- 3. Таблица restaurants - горячие колонки каталога ресторанов
+-- 4. Таблица restaurant_details - остальные сведения о ресторанах
+--    (вместе - представление restaurants_full)
+-- 5. Таблица bot_sessions - сессии бота
 --
 -- Использование:
 --     psql -h /var/run/postgresql -U root -d booktable -f scripts/init_db.sql
@@ -48,22 +51,44 @@ CREATE TABLE bookings (
 );
 
 -- Создание таблицы Restaurants
--- Хранит подробную информацию о ресторанах
+-- Горячая часть каталога: только колонки, которые читает поиск (см. restaurants.py)
 CREATE TABLE restaurants (
     id SERIAL PRIMARY KEY,                      -- Уникальный идентификатор
     name VARCHAR(255) NOT NULL,                 -- Название ресторана
     cuisine VARCHAR(255),                       -- Тип кухни
     location VARCHAR(255),                      -- Расположение
-    atmosphere TEXT,                            -- Атмосфера
     average_check DECIMAL(10,2),                -- Средний чек
+    coordinates POINT,                          -- Координаты (долгота, широта)
+    active BOOLEAN DEFAULT true,                -- Активен ли ресторан
+    discount DECIMAL(5,2),                      -- Скидка
+    google_rating DECIMAL(2,1),                 -- Рейтинг Google
+    tripadvisor_rating DECIMAL(2,1),            -- Рейтинг TripAdvisor
+    michelin BOOLEAN,                           -- Есть ли звезда Мишлен
+    romantic BOOLEAN,                           -- Подходит ли для романтических встреч
+    group_friendly BOOLEAN,                     -- Подходит ли для групп
+    kids_menu BOOLEAN,                          -- Есть ли детское меню
+    child_friendly BOOLEAN,                     -- Подходит ли для детей
+    local_favorite BOOLEAN,                     -- Любимое место местных
+    business_friendly BOOLEAN,                  -- Подходит ли для бизнес-встреч
+    solo_friendly BOOLEAN,                      -- Подходит ли для одиночных посетителей
+    tourist_friendly BOOLEAN,                   -- Подходит ли для туристов
+    outdoor_seating BOOLEAN,                    -- Есть ли места на улице
+    private_dining BOOLEAN,                     -- Есть ли приватная зона
+    reservation_required BOOLEAN,               -- Требуется ли бронирование
+    created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,  -- Дата создания записи
+    updated_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP-- Дата обновления записи
+);
+
+-- Создание таблицы Restaurant_details
+-- Холодная часть каталога: детали для карточки ресторана и бронирования
+CREATE TABLE restaurant_details (
+    restaurant_id INTEGER PRIMARY KEY REFERENCES restaurants(id) ON DELETE CASCADE,  -- Ресторан из restaurants
+    atmosphere TEXT,                            -- Атмосфера
     features TEXT[],                            -- Особенности
     working_hours JSONB,                        -- Часы работы
     booking_method VARCHAR(50),                 -- Способ бронирования
     booking_contact VARCHAR(255),               -- Контакты для бронирования
-    active BOOLEAN DEFAULT true,                -- Активен ли ресторан
-    discount DECIMAL(5,2),                      -- Скидка
     key_dishes TEXT[],                          -- Ключевые блюда
-    michelin BOOLEAN,                           -- Есть ли звезда Мишлен
     map_link TEXT,                              -- Ссылка на карту
     meal_types TEXT[],                          -- Типы блюд
     service_options TEXT[],                     -- Опции обслуживания
@@ -76,14 +101,12 @@ CREATE TABLE restaurants (
     website TEXT,                               -- Веб-сайт
     instagram TEXT,                             -- Instagram
     tripadvisor_link TEXT,                      -- Ссылка на TripAdvisor
-    reservation_required BOOLEAN,               -- Требуется ли бронирование
     payment_methods TEXT[],                     -- Способы оплаты
     wifi BOOLEAN,                               -- Есть ли Wi-Fi
     languages_spoken TEXT[],                    -- Языки персонала
     menu_languages TEXT[],                      -- Языки меню
     menu_options TEXT[],                        -- Опции меню
     spicy_dishes BOOLEAN,                       -- Есть ли острые блюда
-    kids_menu BOOLEAN,                          -- Есть ли детское меню
     portion_size VARCHAR(50),                   -- Размер порций
     customizable_dishes BOOLEAN,                -- Можно ли изменять блюда
     dish_of_the_day BOOLEAN,                    -- Есть ли блюдо дня
@@ -103,12 +126,10 @@ CREATE TABLE restaurants (
     coffee_tea_options TEXT[],                  -- Опции кофе и чая
     sommelier_available BOOLEAN,                -- Есть ли сомелье
     noise_level VARCHAR(50),                    -- Уровень шума
-    outdoor_seating BOOLEAN,                    -- Есть ли места на улице
     view TEXT[],                                -- Вид
     air_conditioning BOOLEAN,                   -- Есть ли кондиционер
     smoking_area BOOLEAN,                       -- Есть ли зона для курения
     pet_friendly BOOLEAN,                       -- Можно ли с питомцами
-    child_friendly BOOLEAN,                     -- Подходит ли для детей
     kids_area BOOLEAN,                          -- Есть ли детская зона
     high_chairs BOOLEAN,                        -- Есть ли детские стульчики
     animation_family_entertainment BOOLEAN,     -- Есть ли анимация и развлечения для семьи
@@ -117,26 +138,17 @@ CREATE TABLE restaurants (
     qr_menu BOOLEAN,                            -- Есть ли QR-меню
     mobile_app BOOLEAN,                         -- Есть ли мобильное приложение
     online_chat_available BOOLEAN,              -- Доступен ли онлайн-чат
-    private_dining BOOLEAN,                     -- Есть ли приватная зона
-    group_friendly BOOLEAN,                     -- Подходит ли для групп
     event_support BOOLEAN,                      -- Поддерживает ли мероприятия
     gift_cards BOOLEAN,                         -- Есть ли подарочные карты
     holiday_specials BOOLEAN,                   -- Есть ли специальные предложения на праздники
-    romantic BOOLEAN,                           -- Подходит ли для романтических встреч
     instagrammable BOOLEAN,                     -- Подходит ли для Instagram
     chef_interaction BOOLEAN,                   -- Есть ли взаимодействие с шефом
     unique_features TEXT[],                     -- Уникальные особенности
     story_or_concept TEXT,                      -- История или концепция
     nearby_landmarks TEXT[],                    -- Ближайшие достопримечательности
     popular_with TEXT[],                        -- Популярен среди
-    solo_friendly BOOLEAN,                      -- Подходит ли для одиночных посетителей
     senior_friendly BOOLEAN,                    -- Подходит ли для пожилых
-    tourist_friendly BOOLEAN,                   -- Подходит ли для туристов
-    local_favorite BOOLEAN,                     -- Любимое место местных
-    business_friendly BOOLEAN,                  -- Подходит ли для бизнес-встреч
     fast_service BOOLEAN,                       -- Быстрое обслуживание
-    google_rating DECIMAL(2,1),                 -- Рейтинг Google
-    tripadvisor_rating DECIMAL(2,1),            -- Рейтинг TripAdvisor
     notable_mentions TEXT[],                    -- Значимые упоминания
     celebrity_visits TEXT[],                    -- Посещения знаменитостей
     press_features TEXT[],                      -- Упоминания в прессе
@@ -144,9 +156,41 @@ CREATE TABLE restaurants (
     hygiene_measures TEXT[],                    -- Меры гигиены
     certifications TEXT[],                      -- Сертификаты
     cleaning_protocol TEXT,                     -- Протокол уборки
-    safety_policy TEXT,                         -- Политика безопасности
-    created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,  -- Дата создания записи
-    updated_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP   -- Дата обновления записи
+    safety_policy TEXT                          -- Политика безопасности
+);
+
+-- Полное представление ресторана (горячие + холодные колонки)
+CREATE VIEW restaurants_full AS
+SELECT r.*,
+    d.atmosphere, d.features, d.working_hours, d.booking_method,
+    d.booking_contact, d.key_dishes, d.map_link, d.meal_types, d.service_options,
+    d.dietary_options, d.occasions, d.drinks_entertainment, d.accessibility,
+    d.address, d.phone, d.website, d.instagram,
+    d.tripadvisor_link, d.payment_methods, d.wifi, d.languages_spoken,
+    d.menu_languages, d.menu_options, d.spicy_dishes, d.portion_size,
+    d.customizable_dishes, d.dish_of_the_day, d.organic_local_ingredients, d.tasting_menu,
+    d.takeaway_available, d.delivery_options, d.catering_available, d.allergen_info,
+    d.product_source_info, d.sustainability_policy, d.drink_specials, d.corkage_fee,
+    d.wine_list, d.cocktails, d.non_alcoholic_drinks, d.coffee_tea_options,
+    d.sommelier_available, d.noise_level, d.view, d.air_conditioning,
+    d.smoking_area, d.pet_friendly, d.kids_area, d.high_chairs,
+    d.animation_family_entertainment, d.dress_code, d.power_sockets, d.qr_menu,
+    d.mobile_app, d.online_chat_available, d.event_support, d.gift_cards,
+    d.holiday_specials, d.instagrammable, d.chef_interaction, d.unique_features,
+    d.story_or_concept, d.nearby_landmarks, d.popular_with, d.senior_friendly,
+    d.fast_service, d.notable_mentions, d.celebrity_visits, d.press_features,
+    d.customer_quotes, d.hygiene_measures, d.certifications, d.cleaning_protocol,
+    d.safety_policy
+FROM restaurants r
+LEFT JOIN restaurant_details d ON d.restaurant_id = r.id;
+
+-- Создание таблицы Bot_sessions
+-- Хранит сессии бота (context.user_data) для многопроцессного режима
+CREATE TABLE bot_sessions (
+    telegram_user_id BIGINT PRIMARY KEY,        -- ID пользователя в Telegram
+    user_data JSONB NOT NULL DEFAULT '{}',      -- Данные сессии (язык, бюджет, история диалога)
+    version BIGINT NOT NULL DEFAULT 1,          -- Растет при каждом сохранении
+    updated_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP  -- Дата последнего сохранения
 );
 
 -- Создание индексов для оптимизации запросов
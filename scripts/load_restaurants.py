@@ -0,0 +1,344 @@
+#!/usr/bin/env python3
+"""
+Массовая загрузка каталога ресторанов BookTable из CSV или JSONL.
+
+Функциональность:
+- Читает файл потоково, пачками по --chunk-size строк (память не растет с размером файла)
+- Проверяет и нормализует поля TEXT[], JSONB, DECIMAL, POINT, BOOLEAN
+- Загружает пачки через COPY во временную staging-таблицу
+- В одной транзакции сливает staging в restaurants и restaurant_details
+  (обновление по ключу + вставка новых ресторанов)
+- Режим --dry-run: все проверки и подсчеты, но транзакция откатывается
+
+Форматы значений:
+- TEXT[]  - JSON-массив или строка с разделителем ";" ("суши; рамен")
+- JSONB   - JSON-объект или строка с JSON
+- POINT   - "(lon,lat)", "lon,lat", [lon, lat] или {"lat": .., "lon": ..}
+- BOOLEAN - true/false, yes/no, 1/0, да/нет
+
+Использование:
+    python3 scripts/load_restaurants.py catalog.csv
+    python3 scripts/load_restaurants.py catalog.jsonl --key id --dry-run
+    python3 scripts/load_restaurants.py catalog.csv --chunk-size 20000 --max-errors 0
+
+Требования:
+- Выполнена миграция scripts/split_restaurants.sql (или схема из init_db.sql)
+- Пользователь root должен иметь права на запись в restaurants и restaurant_details
+"""
+
+import argparse
+import csv
+import io
+import json
+import os
+import re
+import sys
+import time
+from decimal import Decimal, InvalidOperation
+
+import psycopg2
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from restaurants import HOT_COLUMNS, DETAIL_COLUMNS
+
+COLUMNS = {**HOT_COLUMNS, **DETAIL_COLUMNS}
+TRUE_VALUES = {'true', 't', 'yes', 'y', '1', 'да'}
+FALSE_VALUES = {'false', 'f', 'no', 'n', '0', 'нет'}
+DECIMAL_RE = re.compile(r'DECIMAL\((\d+),(\d+)\)')
+VARCHAR_RE = re.compile(r'VARCHAR\((\d+)\)')
+
+
+class RowError(ValueError):
+    pass
+
+
+def is_empty(value):
+    return value is None or (isinstance(value, str) and not value.strip())
+
+
+def parse_array(value):
+    if isinstance(value, str):
+        value = value.strip()
+        if value.startswith('['):
+            value = json.loads(value)
+        else:
+            value = value.split(';')
+    if not isinstance(value, list):
+        raise RowError(f"expected array, got {type(value).__name__}")
+    items = [str(item).strip() for item in value if not is_empty(item)]
+    # Литерал массива PostgreSQL: {"a","b"}
+    return '{' + ','.join('"' + i.replace('\\', '\\\\').replace('"', '\\"') + '"' for i in items) + '}'
+
+
+def parse_json(value):
+    if isinstance(value, str):
+        value = json.loads(value)
+    return json.dumps(value, ensure_ascii=False)
+
+
+def parse_decimal(value, precision, scale):
+    text = str(value).replace('฿', '').replace(',', '').replace(' ', '')
+    try:
+        number = Decimal(text)
+        if not number.is_finite():
+            raise RowError(f"invalid number {value!r}")
+        number = number.quantize(Decimal(1).scaleb(-scale))
+    except InvalidOperation:
+        raise RowError(f"invalid number {value!r}")
+    if abs(number) >= Decimal(10) ** (precision - scale):
+        raise RowError(f"number {value!r} does not fit DECIMAL({precision},{scale})")
+    return str(number)
+
+
+def parse_point(value):
+    if isinstance(value, dict):
+        lon, lat = value.get('lon', value.get('lng')), value.get('lat')
+    elif isinstance(value, (list, tuple)):
+        lon, lat = value
+    else:
+        parts = str(value).strip().strip('()').split(',')
+        if len(parts) != 2:
+            raise RowError(f"invalid point {value!r}")
+        lon, lat = parts
+    lon, lat = float(lon), float(lat)
+    if not (-180 <= lon <= 180 and -90 <= lat <= 90):
+        raise RowError(f"point {value!r} is out of range")
+    return f"({lon},{lat})"
+
+
+def parse_bool(value):
+    if isinstance(value, bool):
+        return 't' if value else 'f'
+    text = str(value).strip().lower()
+    if text in TRUE_VALUES:
+        return 't'
+    if text in FALSE_VALUES:
+        return 'f'
+    raise RowError(f"invalid boolean {value!r}")
+
+
+def normalize(column, value):
+    """Приводит значение к текстовому представлению PostgreSQL или None"""
+    if is_empty(value):
+        return None
+    sql_type = COLUMNS[column]
+    try:
+        if sql_type == 'TEXT[]':
+            return parse_array(value)
+        if sql_type == 'JSONB':
+            return parse_json(value)
+        if sql_type == 'POINT':
+            return parse_point(value)
+        if sql_type == 'BOOLEAN':
+            return parse_bool(value)
+        if sql_type == 'INTEGER':
+            return str(int(value))
+        match = DECIMAL_RE.match(sql_type)
+        if match:
+            return parse_decimal(value, int(match.group(1)), int(match.group(2)))
+        text = str(value).strip()
+        match = VARCHAR_RE.match(sql_type)
+        if match and len(text) > int(match.group(1)):
+            raise RowError(f"value longer than {match.group(1)} characters")
+        return text
+    except (ValueError, TypeError) as e:
+        raise RowError(f"{column}: {e}")
+
+
+def copy_escape(value):
+    """Экранирование для COPY в текстовом формате"""
+    if value is None:
+        return '\\N'
+    return value.replace('\\', '\\\\').replace('\t', '\\t').replace('\n', '\\n').replace('\r', '\\r')
+
+
+def read_rows(path, file_format):
+    """
+    Потоково читает файл, возвращая (номер строки, запись).
+    Для CSV запись - словарь, для JSONL - исходная строка (см. parse_record),
+    чтобы ошибка разбора JSON относилась к своей строке, а не обрывала загрузку.
+    """
+    with open(path, 'r', encoding='utf-8', newline='') as f:
+        if file_format == 'csv':
+            for line_no, row in enumerate(csv.DictReader(f), start=2):
+                yield line_no, row
+        else:
+            for line_no, line in enumerate(f, start=1):
+                if line.strip():
+                    yield line_no, line
+
+
+def parse_record(row):
+    """Запись из read_rows в виде словаря"""
+    if isinstance(row, dict):
+        return row
+    try:
+        record = json.loads(row)
+    except json.JSONDecodeError as e:
+        raise RowError(f"invalid JSON: {e}")
+    if not isinstance(record, dict):
+        raise RowError(f"expected JSON object, got {type(record).__name__}")
+    return record
+
+
+def read_header(path, file_format):
+    """Список колонок файла: заголовок CSV или объединение ключей всех записей JSONL"""
+    if file_format == 'csv':
+        with open(path, 'r', encoding='utf-8', newline='') as f:
+            return next(csv.reader(f), [])
+    # В JSONL у записей может быть разный набор полей; ошибки разбора покажет основной проход
+    columns = {}
+    for _, row in read_rows(path, file_format):
+        try:
+            columns.update(dict.fromkeys(parse_record(row)))
+        except RowError:
+            continue
+    return list(columns)
+
+
+def key_condition(keys, left, right):
+    # Простое равенство, чтобы планировщик мог использовать hash join
+    return ' AND '.join(f"{left}.{k} = {right}.{k}" for k in keys)
+
+
+def merge(cur, columns, keys):
+    """Сливает staging-таблицу в restaurants и restaurant_details. Возвращает счетчики."""
+    stats = {}
+
+    # Если ключ встречается в файле несколько раз, побеждает последняя строка
+    cur.execute(f"""
+        DELETE FROM restaurants_staging s USING restaurants_staging t
+        WHERE {key_condition(keys, 's', 't')} AND s.row_no < t.row_no
+    """)
+    stats['duplicates'] = cur.rowcount
+
+    hot = [c for c in columns if c in HOT_COLUMNS and c != 'id']
+    details = [c for c in columns if c in DETAIL_COLUMNS]
+
+    if hot:
+        cur.execute(f"""
+            UPDATE restaurants r SET {', '.join(f'{c} = s.{c}' for c in hot)}
+            FROM restaurants_staging s
+            WHERE {key_condition(keys, 'r', 's')}
+        """)
+        stats['updated'] = cur.rowcount
+    else:
+        stats['updated'] = 0
+
+    insert_columns = [c for c in columns if c in HOT_COLUMNS]
+    cur.execute(f"""
+        INSERT INTO restaurants ({', '.join(insert_columns)})
+        SELECT {', '.join('s.' + c for c in insert_columns)}
+        FROM restaurants_staging s
+        WHERE NOT EXISTS (SELECT 1 FROM restaurants r WHERE {key_condition(keys, 'r', 's')})
+    """)
+    stats['inserted'] = cur.rowcount
+    if 'id' in insert_columns:
+        # Вставка с явными id не двигает последовательность
+        cur.execute("SELECT setval(pg_get_serial_sequence('restaurants', 'id'), COALESCE(MAX(id), 1)) FROM restaurants")
+
+    # У каждого ресторана должна быть строка деталей, даже пустая
+    if details:
+        conflict = f"DO UPDATE SET {', '.join(f'{c} = EXCLUDED.{c}' for c in details)}"
+    else:
+        conflict = "DO NOTHING"
+    cur.execute(f"""
+        INSERT INTO restaurant_details (restaurant_id{''.join(', ' + c for c in details)})
+        SELECT r.id{''.join(', s.' + c for c in details)}
+        FROM restaurants_staging s
+        JOIN restaurants r ON {key_condition(keys, 'r', 's')}
+        ON CONFLICT (restaurant_id) {conflict}
+    """)
+    stats['details'] = cur.rowcount
+    return stats
+
+
+def load(args):
+    file_format = args.format or ('jsonl' if args.path.endswith(('.jsonl', '.ndjson')) else 'csv')
+    header = read_header(args.path, file_format)
+    unknown = [c for c in header if c not in COLUMNS]
+    if unknown:
+        print(f"Ignoring unknown columns: {', '.join(unknown)}", file=sys.stderr)
+    columns = [c for c in COLUMNS if c in header]
+    keys = args.key.split(',')
+    missing_keys = [k for k in keys if k not in columns]
+    if missing_keys:
+        sys.exit(f"Key columns missing from file: {', '.join(missing_keys)}")
+    if 'name' not in columns:
+        sys.exit("Column 'name' is required")
+
+    started = time.monotonic()
+    conn = psycopg2.connect(dbname="booktable", user="root", host="/var/run/postgresql")
+    cur = conn.cursor()
+    try:
+        cur.execute(f"""
+            CREATE TEMP TABLE restaurants_staging (
+                row_no BIGINT,
+                {', '.join(f'{c} {COLUMNS[c]}' for c in columns)}
+            ) ON COMMIT DROP
+        """)
+        copy_sql = f"COPY restaurants_staging (row_no, {', '.join(columns)}) FROM STDIN"
+
+        loaded = errors = 0
+        buffer = io.StringIO()
+        pending = 0
+        for line_no, row in read_rows(args.path, file_format):
+            try:
+                row = parse_record(row)
+                values = [normalize(c, row.get(c)) for c in columns]
+                for key in set(keys) | {'name'}:
+                    if values[columns.index(key)] is None:
+                        raise RowError(f"{key} is empty")
+            except RowError as e:
+                errors += 1
+                print(f"line {line_no}: {e}", file=sys.stderr)
+                if errors > args.max_errors:
+                    sys.exit(f"Too many invalid rows ({errors}), nothing was loaded")
+                continue
+            buffer.write(str(line_no) + '\t' + '\t'.join(copy_escape(v) for v in values) + '\n')
+            pending += 1
+            if pending >= args.chunk_size:
+                buffer.seek(0)
+                cur.copy_expert(copy_sql, buffer)
+                loaded += pending
+                buffer, pending = io.StringIO(), 0
+        if pending:
+            buffer.seek(0)
+            cur.copy_expert(copy_sql, buffer)
+            loaded += pending
+
+        stats = merge(cur, columns, keys)
+        if args.dry_run:
+            conn.rollback()
+        else:
+            conn.commit()
+            cur.execute("ANALYZE restaurants")
+            cur.execute("ANALYZE restaurant_details")
+            conn.commit()
+    except BaseException:
+        conn.rollback()
+        raise
+    finally:
+        cur.close()
+        conn.close()
+
+    mode = "DRY RUN, rolled back" if args.dry_run else "committed"
+    print(
+        f"{loaded} rows staged, {errors} invalid, {stats['duplicates']} duplicate keys; "
+        f"{stats['updated']} updated, {stats['inserted']} inserted ({mode}) "
+        f"in {time.monotonic() - started:.1f}s"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Загрузка каталога ресторанов через COPY")
+    parser.add_argument('path', help="Файл CSV или JSONL")
+    parser.add_argument('--format', choices=['csv', 'jsonl'], help="Формат файла (по умолчанию по расширению)")
+    parser.add_argument('--key', default='name,location', help="Колонки ключа для обновления, через запятую")
+    parser.add_argument('--chunk-size', type=int, default=10000, help="Строк в одной пачке COPY")
+    parser.add_argument('--max-errors', type=int, default=100, help="Сколько невалидных строк допустимо")
+    parser.add_argument('--dry-run', action='store_true', help="Проверить и посчитать, но не сохранять")
+    load(parser.parse_args())
+
+if __name__ == "__main__":
+    main()
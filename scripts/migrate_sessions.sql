@@ -0,0 +1,28 @@
+-- Скрипт миграции базы данных BookTable
+-- Версия: 1.1.0
+-- Дата: 2026-10-19
+-- Описание: Добавляет таблицу bot_sessions для хранения сессий бота
+--
+-- Изменения:
+-- 1. Таблица bot_sessions - context.user_data каждого пользователя в JSONB
+--    (нужна для многопроцессного режима, см. dispatcher.py)
+-- 2. Колонка version - номер записи сессии, по нему воркер узнает,
+--    что его копия устарела (см. persistence.py)
+--
+-- Использование:
+--     psql -h /var/run/postgresql -U root -d booktable -f scripts/migrate_sessions.sql
+--
+-- Требования:
+-- - PostgreSQL должен быть запущен
+-- - База данных booktable должна существовать
+-- - Пользователь root должен иметь права на создание таблиц
+
+CREATE TABLE IF NOT EXISTS bot_sessions (
+    telegram_user_id BIGINT PRIMARY KEY,        -- ID пользователя в Telegram
+    user_data JSONB NOT NULL DEFAULT '{}',      -- Данные сессии (язык, бюджет, история диалога)
+    version BIGINT NOT NULL DEFAULT 1,          -- Растет при каждом сохранении
+    updated_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP  -- Дата последнего сохранения
+);
+
+-- Для баз, где таблица уже была создана без версии
+ALTER TABLE bot_sessions ADD COLUMN IF NOT EXISTS version BIGINT NOT NULL DEFAULT 1;
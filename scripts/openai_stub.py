@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+"""
+Локальная OpenAI-совместимая заглушка для проверки маршрутизации моделей.
+
+Отвечает на POST /v1/chat/completions фиксированным текстом с задержкой,
+которую можно задать для каждой модели. Так можно проверить hedged-запросы
+и учет задержек/стоимости без обращения к OpenAI.
+
+Использование:
+    python3 scripts/openai_stub.py --port 8800 --delay gpt-4=10 --delay gpt-4o-mini=0.5
+    OPENAI_BASE_URL=http://127.0.0.1:8800/v1 OPENAI_API_KEY=stub python3 main.py
+
+Ответ для задачи определения языка - "en", для запросов в JSON-режиме
+(совмещенная реплика, turn.py) - JSON с эхом, для остальных - эхо последнего сообщения.
+"""
+
+import argparse
+import asyncio
+import json
+import time
+import uuid
+
+from aiohttp import web
+
+
+def make_handler(delays, default_delay):
+    async def chat_completions(request):
+        body = await request.json()
+        model = body.get('model', 'stub')
+        await asyncio.sleep(delays.get(model, default_delay))
+
+        prompt = body['messages'][-1]['content']
+        if body.get('response_format', {}).get('type') == 'json_object':
+            content = json.dumps({
+                'language': 'en', 'intent': 'other', 'slots': {},
+                'reply': f"[{model}] {prompt[-200:]}",
+            }, ensure_ascii=False)
+        elif 'ISO 639-1' in prompt:
+            content = 'en'
+        else:
+            content = f"[{model}] {prompt[-200:]}"
+        prompt_tokens = sum(len(m['content'].split()) for m in body['messages'])
+        completion_tokens = len(content.split())
+        return web.json_response({
+            'id': f"chatcmpl-{uuid.uuid4().hex}",
+            'object': 'chat.completion',
+            'created': int(time.time()),
+            'model': model,
+            'choices': [{
+                'index': 0,
+                'message': {'role': 'assistant', 'content': content},
+                'finish_reason': 'stop',
+            }],
+            'usage': {
+                'prompt_tokens': prompt_tokens,
+                'completion_tokens': completion_tokens,
+                'total_tokens': prompt_tokens + completion_tokens,
+            },
+        })
+    return chat_completions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="OpenAI-совместимая заглушка")
+    parser.add_argument('--port', type=int, default=8800)
+    parser.add_argument('--delay', action='append', default=[], help="Задержка модели: model=seconds")
+    parser.add_argument('--default-delay', type=float, default=0.1)
+    args = parser.parse_args()
+
+    delays = {}
+    for item in args.delay:
+        model, _, seconds = item.partition('=')
+        delays[model] = float(seconds)
+
+    app = web.Application()
+    app.router.add_post('/v1/chat/completions', make_handler(delays, args.default_delay))
+    web.run_app(app, host='127.0.0.1', port=args.port)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+"""
+Бенчмарк движка ранжирования ресторанов (ranking.py).
+Строит синтетический каталог и измеряет время построения матрицы
+признаков и одного ранжирования.
+
+Функциональность:
+- Каталог заданного размера со случайными чеками, координатами на Пхукете,
+  рейтингами и флагами (база данных не нужна)
+- Медиана времени ранжирования по всему острову, по району и по радиусу
+- Код возврата 1, если медиана превышает бюджет
+
+Использование:
+    python3 scripts/ranking_benchmark.py
+    python3 scripts/ranking_benchmark.py --restaurants 10000 --runs 200 --budget 0.005
+
+Требования:
+- numpy (requirements.txt)
+- Запускать из корня проекта (рядом с main.py) или из scripts/
+"""
+
+import argparse
+import os
+import random
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from ranking import Catalog, Ranker
+from restaurants import FLAG_COLUMNS
+
+AREAS = ['Чалонг', 'Фестиваль', 'Паттонг', 'Ката', 'Карон', 'Пхукет-таун', 'Камала', 'Равай', 'Най Харн', 'Банг Тао', 'Сурин']
+
+def synthetic_rows(count, seed=1):
+    rng = random.Random(seed)
+    rows = []
+    for i in range(count):
+        row = {
+            'id': i + 1,
+            'name': f"Restaurant {i + 1}",
+            'cuisine': rng.choice(['тайская', 'итальянская', 'японская', 'морепродукты', None]),
+            'location': rng.choice(AREAS),
+            'average_check': rng.uniform(100, 5000),
+            'coordinates': f"({rng.uniform(98.25, 98.45)},{rng.uniform(7.75, 8.10)})",
+            'google_rating': rng.choice([None, round(rng.uniform(3, 5), 1)]),
+            'tripadvisor_rating': rng.choice([None, round(rng.uniform(3, 5), 1)]),
+            'discount': rng.choice([None, 0, 10, 15]),
+        }
+        for flag in FLAG_COLUMNS:
+            row[flag] = rng.random() < 0.2
+        rows.append(row)
+    return rows
+
+def median_ms(func, runs):
+    timings = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - started)
+    return statistics.median(timings) * 1000
+
+def main():
+    parser = argparse.ArgumentParser(description="Проверка скорости ранжирования ресторанов")
+    parser.add_argument('--restaurants', type=int, default=10000, help="Размер синтетического каталога")
+    parser.add_argument('--runs', type=int, default=100, help="Количество прогонов")
+    parser.add_argument('--budget', type=float, default=0.005, help="Бюджет на одно ранжирование (сек)")
+    args = parser.parse_args()
+
+    rows = synthetic_rows(args.restaurants)
+    started = time.perf_counter()
+    catalog = Catalog(rows)
+    print(f"Catalog of {len(catalog)} restaurants built in {time.perf_counter() - started:.3f}s")
+
+    # Без базы: матрица подставляется напрямую, проверка версии каталога отключена
+    ranker = Ranker(connect=None, config={'refresh_interval': float('inf')})
+    ranker.catalog = catalog
+
+    cases = {
+        'any': lambda: ranker.rank((500, 1500)),
+        'area': lambda: ranker.rank((500, 1500), area='Паттонг'),
+        'radius': lambda: ranker.rank((500, 1500), coordinates=(7.89, 98.30)),
+        'preferences': lambda: ranker.rank((1500, 3000), preferences=['romantic', 'outdoor_seating']),
+        'cuisine': lambda: ranker.rank((500, 1500), cuisine='Тайская'),
+    }
+    worst = 0.0
+    for name, func in cases.items():
+        ms = median_ms(func, args.runs)
+        worst = max(worst, ms)
+        print(f"  {name:12s} {ms:7.3f} ms")
+
+    if worst > args.budget * 1000:
+        print("FAILED: ranking budget exceeded")
+        sys.exit(1)
+    print("OK")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,263 @@
+-- Скрипт миграции базы данных BookTable
+-- Версия: 1.2.0
+-- Дата: 2026-10-19
+-- Описание: Делит таблицу restaurants на горячую и холодную части
+--
+-- Изменения:
+-- 0. Колонки coordinates и map_link добавляются, если их нет
+-- 1. Новая таблица restaurant_details с редко читаемыми колонками
+--    (адрес, контакты, ссылка на карту, меню, пресса, протоколы и т.д.)
+-- 2. Перенос данных из restaurants в restaurant_details
+-- 3. Удаление перенесенных колонок из restaurants, чтобы поиск читал узкие строки
+-- 4. Представление restaurants_full со всеми колонками для отчетов и выгрузок
+--
+-- Список колонок совпадает с HOT_COLUMNS / DETAIL_COLUMNS в restaurants.py
+--
+-- Использование:
+--     psql -h /var/run/postgresql -U root -d booktable -f scripts/split_restaurants.sql
+--
+-- Требования:
+-- - PostgreSQL должен быть запущен
+-- - База данных booktable должна существовать
+-- - Пользователь root должен иметь права на изменение таблицы restaurants
+
+BEGIN;
+
+-- Базы, созданные старыми версиями init_db.sql и scripts/init_db.sql, различаются:
+-- в одной нет coordinates (нужна поиску), в другой нет map_link (переносится в детали)
+ALTER TABLE restaurants ADD COLUMN IF NOT EXISTS coordinates POINT;
+ALTER TABLE restaurants ADD COLUMN IF NOT EXISTS map_link TEXT;
+
+-- Создаем таблицу с холодными колонками
+CREATE TABLE restaurant_details (
+    restaurant_id INTEGER PRIMARY KEY REFERENCES restaurants(id) ON DELETE CASCADE,
+    atmosphere TEXT,
+    features TEXT[],
+    working_hours JSONB,
+    booking_method VARCHAR(50),
+    booking_contact VARCHAR(255),
+    key_dishes TEXT[],
+    map_link TEXT,
+    meal_types TEXT[],
+    service_options TEXT[],
+    dietary_options TEXT[],
+    occasions TEXT[],
+    drinks_entertainment TEXT[],
+    accessibility TEXT[],
+    address TEXT,
+    phone VARCHAR(50),
+    website TEXT,
+    instagram TEXT,
+    tripadvisor_link TEXT,
+    payment_methods TEXT[],
+    wifi BOOLEAN,
+    languages_spoken TEXT[],
+    menu_languages TEXT[],
+    menu_options TEXT[],
+    spicy_dishes BOOLEAN,
+    portion_size VARCHAR(50),
+    customizable_dishes BOOLEAN,
+    dish_of_the_day BOOLEAN,
+    organic_local_ingredients BOOLEAN,
+    tasting_menu BOOLEAN,
+    takeaway_available BOOLEAN,
+    delivery_options TEXT[],
+    catering_available BOOLEAN,
+    allergen_info TEXT,
+    product_source_info TEXT,
+    sustainability_policy TEXT,
+    drink_specials TEXT[],
+    corkage_fee DECIMAL(10,2),
+    wine_list TEXT[],
+    cocktails TEXT[],
+    non_alcoholic_drinks TEXT[],
+    coffee_tea_options TEXT[],
+    sommelier_available BOOLEAN,
+    noise_level VARCHAR(50),
+    view TEXT[],
+    air_conditioning BOOLEAN,
+    smoking_area BOOLEAN,
+    pet_friendly BOOLEAN,
+    kids_area BOOLEAN,
+    high_chairs BOOLEAN,
+    animation_family_entertainment BOOLEAN,
+    dress_code VARCHAR(255),
+    power_sockets BOOLEAN,
+    qr_menu BOOLEAN,
+    mobile_app BOOLEAN,
+    online_chat_available BOOLEAN,
+    event_support BOOLEAN,
+    gift_cards BOOLEAN,
+    holiday_specials BOOLEAN,
+    instagrammable BOOLEAN,
+    chef_interaction BOOLEAN,
+    unique_features TEXT[],
+    story_or_concept TEXT,
+    nearby_landmarks TEXT[],
+    popular_with TEXT[],
+    senior_friendly BOOLEAN,
+    fast_service BOOLEAN,
+    notable_mentions TEXT[],
+    celebrity_visits TEXT[],
+    press_features TEXT[],
+    customer_quotes TEXT[],
+    hygiene_measures TEXT[],
+    certifications TEXT[],
+    cleaning_protocol TEXT,
+    safety_policy TEXT
+);
+
+-- Переносим данные
+INSERT INTO restaurant_details (
+    restaurant_id,
+    atmosphere, features, working_hours, booking_method,
+    booking_contact, key_dishes, map_link, meal_types, service_options,
+    dietary_options, occasions, drinks_entertainment, accessibility,
+    address, phone, website, instagram,
+    tripadvisor_link, payment_methods, wifi, languages_spoken,
+    menu_languages, menu_options, spicy_dishes, portion_size,
+    customizable_dishes, dish_of_the_day, organic_local_ingredients, tasting_menu,
+    takeaway_available, delivery_options, catering_available, allergen_info,
+    product_source_info, sustainability_policy, drink_specials, corkage_fee,
+    wine_list, cocktails, non_alcoholic_drinks, coffee_tea_options,
+    sommelier_available, noise_level, view, air_conditioning,
+    smoking_area, pet_friendly, kids_area, high_chairs,
+    animation_family_entertainment, dress_code, power_sockets, qr_menu,
+    mobile_app, online_chat_available, event_support, gift_cards,
+    holiday_specials, instagrammable, chef_interaction, unique_features,
+    story_or_concept, nearby_landmarks, popular_with, senior_friendly,
+    fast_service, notable_mentions, celebrity_visits, press_features,
+    customer_quotes, hygiene_measures, certifications, cleaning_protocol,
+    safety_policy
+)
+SELECT
+    id,
+    atmosphere, features, working_hours, booking_method,
+    booking_contact, key_dishes, map_link, meal_types, service_options,
+    dietary_options, occasions, drinks_entertainment, accessibility,
+    address, phone, website, instagram,
+    tripadvisor_link, payment_methods, wifi, languages_spoken,
+    menu_languages, menu_options, spicy_dishes, portion_size,
+    customizable_dishes, dish_of_the_day, organic_local_ingredients, tasting_menu,
+    takeaway_available, delivery_options, catering_available, allergen_info,
+    product_source_info, sustainability_policy, drink_specials, corkage_fee,
+    wine_list, cocktails, non_alcoholic_drinks, coffee_tea_options,
+    sommelier_available, noise_level, view, air_conditioning,
+    smoking_area, pet_friendly, kids_area, high_chairs,
+    animation_family_entertainment, dress_code, power_sockets, qr_menu,
+    mobile_app, online_chat_available, event_support, gift_cards,
+    holiday_specials, instagrammable, chef_interaction, unique_features,
+    story_or_concept, nearby_landmarks, popular_with, senior_friendly,
+    fast_service, notable_mentions, celebrity_visits, press_features,
+    customer_quotes, hygiene_measures, certifications, cleaning_protocol,
+    safety_policy
+FROM restaurants;
+
+-- Удаляем перенесенные колонки из горячей таблицы
+ALTER TABLE restaurants
+    DROP COLUMN atmosphere,
+    DROP COLUMN features,
+    DROP COLUMN working_hours,
+    DROP COLUMN booking_method,
+    DROP COLUMN booking_contact,
+    DROP COLUMN key_dishes,
+    DROP COLUMN map_link,
+    DROP COLUMN meal_types,
+    DROP COLUMN service_options,
+    DROP COLUMN dietary_options,
+    DROP COLUMN occasions,
+    DROP COLUMN drinks_entertainment,
+    DROP COLUMN accessibility,
+    DROP COLUMN address,
+    DROP COLUMN phone,
+    DROP COLUMN website,
+    DROP COLUMN instagram,
+    DROP COLUMN tripadvisor_link,
+    DROP COLUMN payment_methods,
+    DROP COLUMN wifi,
+    DROP COLUMN languages_spoken,
+    DROP COLUMN menu_languages,
+    DROP COLUMN menu_options,
+    DROP COLUMN spicy_dishes,
+    DROP COLUMN portion_size,
+    DROP COLUMN customizable_dishes,
+    DROP COLUMN dish_of_the_day,
+    DROP COLUMN organic_local_ingredients,
+    DROP COLUMN tasting_menu,
+    DROP COLUMN takeaway_available,
+    DROP COLUMN delivery_options,
+    DROP COLUMN catering_available,
+    DROP COLUMN allergen_info,
+    DROP COLUMN product_source_info,
+    DROP COLUMN sustainability_policy,
+    DROP COLUMN drink_specials,
+    DROP COLUMN corkage_fee,
+    DROP COLUMN wine_list,
+    DROP COLUMN cocktails,
+    DROP COLUMN non_alcoholic_drinks,
+    DROP COLUMN coffee_tea_options,
+    DROP COLUMN sommelier_available,
+    DROP COLUMN noise_level,
+    DROP COLUMN view,
+    DROP COLUMN air_conditioning,
+    DROP COLUMN smoking_area,
+    DROP COLUMN pet_friendly,
+    DROP COLUMN kids_area,
+    DROP COLUMN high_chairs,
+    DROP COLUMN animation_family_entertainment,
+    DROP COLUMN dress_code,
+    DROP COLUMN power_sockets,
+    DROP COLUMN qr_menu,
+    DROP COLUMN mobile_app,
+    DROP COLUMN online_chat_available,
+    DROP COLUMN event_support,
+    DROP COLUMN gift_cards,
+    DROP COLUMN holiday_specials,
+    DROP COLUMN instagrammable,
+    DROP COLUMN chef_interaction,
+    DROP COLUMN unique_features,
+    DROP COLUMN story_or_concept,
+    DROP COLUMN nearby_landmarks,
+    DROP COLUMN popular_with,
+    DROP COLUMN senior_friendly,
+    DROP COLUMN fast_service,
+    DROP COLUMN notable_mentions,
+    DROP COLUMN celebrity_visits,
+    DROP COLUMN press_features,
+    DROP COLUMN customer_quotes,
+    DROP COLUMN hygiene_measures,
+    DROP COLUMN certifications,
+    DROP COLUMN cleaning_protocol,
+    DROP COLUMN safety_policy;
+
+-- Полное представление ресторана (горячие + холодные колонки)
+CREATE VIEW restaurants_full AS
+SELECT r.*,
+    d.atmosphere, d.features, d.working_hours, d.booking_method,
+    d.booking_contact, d.key_dishes, d.map_link, d.meal_types, d.service_options,
+    d.dietary_options, d.occasions, d.drinks_entertainment, d.accessibility,
+    d.address, d.phone, d.website, d.instagram,
+    d.tripadvisor_link, d.payment_methods, d.wifi, d.languages_spoken,
+    d.menu_languages, d.menu_options, d.spicy_dishes, d.portion_size,
+    d.customizable_dishes, d.dish_of_the_day, d.organic_local_ingredients, d.tasting_menu,
+    d.takeaway_available, d.delivery_options, d.catering_available, d.allergen_info,
+    d.product_source_info, d.sustainability_policy, d.drink_specials, d.corkage_fee,
+    d.wine_list, d.cocktails, d.non_alcoholic_drinks, d.coffee_tea_options,
+    d.sommelier_available, d.noise_level, d.view, d.air_conditioning,
+    d.smoking_area, d.pet_friendly, d.kids_area, d.high_chairs,
+    d.animation_family_entertainment, d.dress_code, d.power_sockets, d.qr_menu,
+    d.mobile_app, d.online_chat_available, d.event_support, d.gift_cards,
+    d.holiday_specials, d.instagrammable, d.chef_interaction, d.unique_features,
+    d.story_or_concept, d.nearby_landmarks, d.popular_with, d.senior_friendly,
+    d.fast_service, d.notable_mentions, d.celebrity_visits, d.press_features,
+    d.customer_quotes, d.hygiene_measures, d.certifications, d.cleaning_protocol,
+    d.safety_policy
+FROM restaurants r
+LEFT JOIN restaurant_details d ON d.restaurant_id = r.id;
+
+COMMIT;
+
+-- DROP COLUMN не освобождает место, поэтому переписываем таблицу
+VACUUM FULL restaurants;
+ANALYZE restaurants;
+ANALYZE restaurant_details;
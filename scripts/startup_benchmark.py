@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+"""
+Бенчмарк холодного старта бота BookTable.
+Запускает чистый интерпретатор с `-X importtime`, импортирует main.py
+и сравнивает суммарное время импорта с бюджетом.
+
+Функциональность:
+- Несколько прогонов, в зачет идет медиана
+- Список самых медленных модулей по собственному времени импорта
+  (без вложенных импортов), с кумулятивным временем рядом
+- Код возврата 1, если бюджет превышен (для проверки перед деплоем)
+
+Использование:
+    python3 scripts/startup_benchmark.py
+    python3 scripts/startup_benchmark.py --budget 0.5 --runs 5 --top 15
+
+Требования:
+- Зависимости из requirements.txt должны быть установлены
+- Запускать из корня проекта (рядом с main.py)
+"""
+
+import argparse
+import os
+import re
+import statistics
+import subprocess
+import sys
+
+DEFAULT_BUDGET = 0.6  # секунды на `import main`
+
+# Строка вида: "import time:       123 |       4567 |   package.module"
+LINE_RE = re.compile(r'^import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)')
+
+def measure(module='main'):
+    """
+    Один прогон импорта в отдельном процессе.
+    Возвращает суммарное время (сек) и список всех модулей
+    (собственное время, кумулятивное время, модуль).
+    """
+    env = dict(os.environ, PYTHONDONTWRITEBYTECODE='1')
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+        capture_output=True, text=True, env=env
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"import {module} failed:\n{result.stderr[-2000:]}")
+
+    total = 0.0
+    modules = []
+    for line in result.stderr.splitlines():
+        match = LINE_RE.match(line)
+        if not match:
+            continue
+        own, cumulative = int(match.group(1)) / 1e6, int(match.group(2)) / 1e6
+        modules.append((own, cumulative, match.group(4)))
+        # Модули верхнего уровня идут с отступом в один пробел, их время - суммарное
+        if len(match.group(3)) == 1:
+            total += cumulative
+    return total, modules
+
+def main():
+    parser = argparse.ArgumentParser(description="Проверка времени холодного старта бота")
+    parser.add_argument('--budget', type=float, default=DEFAULT_BUDGET, help="Бюджет в секундах")
+    parser.add_argument('--runs', type=int, default=3, help="Количество прогонов")
+    parser.add_argument('--top', type=int, default=10, help="Сколько медленных модулей показать")
+    parser.add_argument('--module', default='main', help="Какой модуль импортировать")
+    args = parser.parse_args()
+
+    totals = []
+    modules = []
+    for _ in range(args.runs):
+        total, modules = measure(args.module)
+        totals.append(total)
+
+    median = statistics.median(totals)
+    print(f"import {args.module}: median {median:.3f}s over {args.runs} runs (budget {args.budget:.3f}s)")
+    print(f"  {'self':>8s}  {'cumul.':>8s}  module")
+    for own, cumulative, name in sorted(modules, reverse=True)[:args.top]:
+        print(f"  {own:8.3f}s {cumulative:8.3f}s  {name}")
+
+    if median > args.budget:
+        print("FAILED: startup budget exceeded")
+        sys.exit(1)
+    print("OK")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,24 @@
+"""
+Настройки бота из config.ini.
+
+Путь к файлу задается переменной окружения BOOKTABLE_CONFIG
+(по умолчанию config.ini рядом с ботом). Если файла нет, модули
+используют значения по умолчанию. Пример - config.ini-example.
+"""
+
+import configparser
+import os
+from functools import lru_cache
+
+
+@lru_cache(maxsize=None)
+def load_config():
+    config = configparser.ConfigParser()
+    config.read(os.getenv('BOOKTABLE_CONFIG', 'config.ini'), encoding='utf-8')
+    return config
+
+
+def get_section(name):
+    """Секция конфигурации как словарь (пустой, если секции нет)"""
+    config = load_config()
+    return dict(config[name]) if config.has_section(name) else {}
@@ -37,11 +37,21 @@ else
     check_status "Activating virtual environment"
 fi
 
+# Проверяем время холодного старта (бюджет импорта main.py), запуск не блокируем
+echo "$(date): Checking startup import budget"
+if python3 scripts/startup_benchmark.py --runs 3; then
+    echo "$(date): Startup budget - OK"
+else
+    echo "$(date): WARNING: startup budget exceeded or benchmark failed, see output above"
+fi
+
 # Убиваем все процессы бота
 echo "$(date): Stopping existing bot processes"
+pkill -f supervisor.py || true
 pkill -f main.py || true
 sleep 2  # Даём время на корректное завершение
-pkill -9 -f main.py || true  # Принудительно убиваем, если остались
+pkill -9 -f supervisor.py || true  # Принудительно убиваем, если остались
+pkill -9 -f main.py || true
 
 # Убиваем старую tmux-сессию, если она есть
 if tmux has-session -t mybot 2>/dev/null; then
@@ -61,12 +71,13 @@ tmux send-keys -t mybot 'cd /root/booktable_bot' C-m
 sleep 1
 tmux send-keys -t mybot 'source venv/bin/activate' C-m
 sleep 1
-tmux send-keys -t mybot 'python3 main.py' C-m
+# Бот работает под супервизором: перезагрузка без простоя через kill -HUP $(cat supervisor.pid)
+tmux send-keys -t mybot 'python3 supervisor.py' C-m
 check_status "Sending start command to tmux"
 
 # Проверяем, что бот запустился
 sleep 5  # Даём время на запуск
-if pgrep -f "python3 main.py" > /dev/null; then
+if pgrep -f "python3 supervisor.py" > /dev/null && pgrep -f "main.py" > /dev/null; then
     echo "$(date): Bot started successfully"
 else
     echo "$(date): Bot failed to start"
@@ -0,0 +1,175 @@
+#!/usr/bin/env python
+"""
+Супервизор бота BookTable: перезагрузка без простоя.
+
+Держит один рабочий процесс main.py. По SIGHUP выполняет перезагрузку:
+1. Запускает новый процесс в режиме ожидания (--standby) и ждет его готовности
+2. Отправляет SIGTERM старому: тот прекращает polling, дорабатывает уже
+   полученные обновления и сохраняет сессии в PostgreSQL (--released-file)
+3. Сразу после этого отправляет SIGUSR1 новому, и тот начинает polling
+   с того же места; старый параллельно только закрывает соединения
+
+Если новый процесс не стал готов, перезагрузка отменяется и продолжает
+работать старый. Упавший или не ставший готовым рабочий процесс
+перезапускается с экспоненциальной задержкой (от RESTART_BACKOFF до
+RESTART_BACKOFF_MAX); задержка сбрасывается, если процесс проработал
+дольше STABLE_AFTER.
+
+Использование:
+    python3 supervisor.py
+    kill -HUP $(cat supervisor.pid)    # перезагрузка (это делает watchdog_script.py)
+
+Требования:
+- Таблица bot_sessions (scripts/migrate_sessions.sql)
+"""
+
+import logging
+import os
+import signal
+import subprocess
+import sys
+import tempfile
+import time
+
+logger = logging.getLogger(__name__)
+
+PID_FILE = 'supervisor.pid'
+READY_TIMEOUT = 60   # Сколько ждать готовности нового процесса (сек)
+DRAIN_TIMEOUT = 30   # Сколько ждать, пока старый процесс доработает обновления (сек)
+RESTART_BACKOFF = 1       # Задержка перед первым перезапуском упавшего процесса (сек)
+RESTART_BACKOFF_MAX = 60  # Предел задержки перезапуска (сек)
+STABLE_AFTER = 60         # Сколько процесс должен проработать, чтобы задержка сбросилась (сек)
+
+
+class Supervisor:
+
+    def __init__(self):
+        self.worker = None
+        self.released_file = None
+        self.started_at = 0.0
+        self.failures = 0
+        self.restart_at = None
+        self.draining = []  # [(процесс, срок)] - старые процессы, закрывающиеся после перезагрузки
+        self.reload_requested = False
+        self.stopping = False
+
+    def spawn(self, standby):
+        base = os.path.join(tempfile.gettempdir(), f"booktable-{os.getpid()}-{time.time_ns()}")
+        ready_file, released_file = f"{base}-ready", f"{base}-released"
+        command = [sys.executable, 'main.py', '--persist', '--ready-file', ready_file, '--released-file', released_file]
+        if standby:
+            command.append('--standby')
+        process = subprocess.Popen(command)
+        logger.info(f"Started worker {process.pid}{' in standby' if standby else ''}")
+        return process, ready_file, released_file
+
+    def wait_file(self, process, path, timeout):
+        """Ждет, пока процесс создаст файл path; False, если процесс завершился или истек таймаут"""
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if os.path.exists(path):
+                os.remove(path)
+                return True
+            if process.poll() is not None:
+                return False
+            time.sleep(0.05)
+        return False
+
+    def stop_worker(self, process):
+        """SIGTERM и ожидание, пока процесс доработает обновления"""
+        process.send_signal(signal.SIGTERM)
+        try:
+            process.wait(timeout=DRAIN_TIMEOUT)
+        except subprocess.TimeoutExpired:
+            logger.warning(f"Worker {process.pid} did not drain in {DRAIN_TIMEOUT}s, killing")
+            process.kill()
+            process.wait()
+
+    def start(self):
+        process, ready_file, self.released_file = self.spawn(standby=False)
+        self.worker, self.started_at = process, time.monotonic()
+        if not self.wait_file(process, ready_file, READY_TIMEOUT):
+            logger.error("Worker failed to start")
+            # Зависший при старте процесс перезапускается так же, как упавший
+            if process.poll() is None:
+                process.kill()
+                process.wait()
+
+    def restart_delay(self):
+        if time.monotonic() - self.started_at > STABLE_AFTER:
+            self.failures = 0
+        delay = min(RESTART_BACKOFF * 2 ** self.failures, RESTART_BACKOFF_MAX)
+        self.failures += 1
+        return delay
+
+    def reload(self):
+        logger.info("Reloading worker")
+        new, ready_file, released_file = self.spawn(standby=True)
+        if not self.wait_file(new, ready_file, READY_TIMEOUT):
+            logger.error("New worker did not become ready, keeping the old one")
+            if new.poll() is None:
+                new.kill()
+                new.wait()
+            return
+        old = self.worker
+        started = time.monotonic()
+        old.send_signal(signal.SIGTERM)
+        if not self.wait_file(old, self.released_file, DRAIN_TIMEOUT) and old.poll() is None:
+            # Нельзя начинать polling, пока старый процесс может обрабатывать тех же пользователей
+            logger.warning(f"Worker {old.pid} did not drain in {DRAIN_TIMEOUT}s, killing")
+            old.kill()
+        new.send_signal(signal.SIGUSR1)
+        self.worker, self.released_file, self.started_at = new, released_file, time.monotonic()
+        self.restart_at = None
+        self.draining.append((old, time.monotonic() + DRAIN_TIMEOUT))
+        logger.info(f"Handover {old.pid} -> {new.pid} done, polling gap {time.monotonic() - started:.2f}s")
+
+    def reap(self):
+        """Следит за старыми процессами, закрывающимися после перезагрузки"""
+        for entry in list(self.draining):
+            process, deadline = entry
+            if process.poll() is not None:
+                logger.info(f"Worker {process.pid} exited")
+                self.draining.remove(entry)
+            elif time.monotonic() > deadline:
+                logger.warning(f"Worker {process.pid} did not exit in {DRAIN_TIMEOUT}s, killing")
+                process.kill()
+                process.wait()
+                self.draining.remove(entry)
+
+    def run(self):
+        signal.signal(signal.SIGHUP, lambda *_: setattr(self, 'reload_requested', True))
+        signal.signal(signal.SIGTERM, lambda *_: setattr(self, 'stopping', True))
+        signal.signal(signal.SIGINT, lambda *_: setattr(self, 'stopping', True))
+        with open(PID_FILE, 'w') as f:
+            f.write(str(os.getpid()))
+
+        try:
+            self.start()
+            while not self.stopping:
+                self.reap()
+                if self.reload_requested:
+                    self.reload_requested = False
+                    self.reload()
+                elif self.worker.poll() is not None:
+                    if self.restart_at is None:
+                        delay = self.restart_delay()
+                        logger.error(
+                            f"Worker {self.worker.pid} exited with code {self.worker.returncode}, "
+                            f"restarting in {delay:.1f}s"
+                        )
+                        self.restart_at = time.monotonic() + delay
+                    elif time.monotonic() >= self.restart_at:
+                        self.restart_at = None
+                        self.start()
+                time.sleep(0.2)
+        finally:
+            for process in [self.worker] + [p for p, _ in self.draining]:
+                if process and process.poll() is None:
+                    self.stop_worker(process)
+            os.remove(PID_FILE)
+
+
+if __name__ == '__main__':
+    logging.basicConfig(format='%(asctime)s - %(name)s - %(levelname)s - %(message)s', level=logging.INFO)
+    Supervisor().run()
@@ -0,0 +1,158 @@
+"""
+Совмещенная реплика диалога: один запрос к LLM вместо двух.
+
+Обычная реплика - это определение языка, затем ask() с ответом на нужном
+языке. В совмещенном режиме модель за один вызов возвращает JSON:
+
+    {
+      "language": "ru",
+      "intent": "search",
+      "slots": {"cuisine": "тайская", "guests": 4, "date": "2026-03-08",
+                "time": "19:30", "area": "Ката"},
+      "reply": "текст ответа пользователю"
+    }
+
+Ответ проверяется по схеме (parse_turn). Если JSON не разобрался или
+обязательные поля неверны - TurnError, и бот идет обычным путем.
+Некорректные слоты просто отбрасываются.
+
+Район и кухня выбираются из словарей (районы Пхукета, кухни каталога),
+чтобы слот совпадал со значениями в базе независимо от языка пользователя.
+
+Включается в config.ini:
+
+    [turn]
+    fused = true
+"""
+
+import json
+import logging
+import re
+from collections import Counter
+from datetime import date, datetime
+
+logger = logging.getLogger(__name__)
+
+INTENTS = ['search', 'booking', 'question', 'smalltalk', 'other']
+
+LANGUAGE_RE = re.compile(r'^[a-z]{2,3}([-_][a-z]{2,4})?$')
+FENCE_RE = re.compile(r'^```(?:json)?\s*|\s*```$')
+MAX_GUESTS = 50
+
+# Сводные метрики: сколько реплик обработано одним запросом и сколько ушло на обычный путь
+stats = Counter()
+
+TURN_INSTRUCTIONS = """Ответь на последнее сообщение пользователя как обычно, но верни только JSON-объект без пояснений:
+{{
+  "language": код языка сообщения пользователя в формате ISO 639-1 (например "en", "ru", "th"),
+  "intent": одно из {intents},
+  "slots": {{
+    "cuisine": {cuisine},
+    "guests": число гостей, если упомянуто,
+    "date": дата в формате YYYY-MM-DD, если упомянута (сегодня {today}),
+    "time": время в формате HH:MM, если упомянуто,
+    "area": район Пхукета из списка [{areas}], если упомянут
+  }},
+  "reply": твой ответ пользователю на языке его сообщения
+}}
+Не упомянутые слоты не включай."""
+
+CUISINE_FREE = "кухня или блюдо, если упомянуты"
+CUISINE_FROM_LIST = (
+    "кухня из списка [{cuisines}], если упомянута; всегда значение из списка как есть, "
+    "даже если пользователь пишет на другом языке"
+)
+
+
+class TurnError(ValueError):
+    pass
+
+
+def turn_messages(chat_log, text, areas, cuisines=()):
+    """
+    Сообщения для совмещенного запроса: история, инструкция о формате, реплика пользователя.
+    cuisines - кухни каталога; если словарь пуст, кухня принимается свободным текстом.
+    """
+    instructions = TURN_INSTRUCTIONS.format(
+        intents=', '.join(f'"{i}"' for i in INTENTS),
+        today=date.today().isoformat(),
+        areas=', '.join(areas),
+        cuisine=CUISINE_FROM_LIST.format(cuisines=', '.join(cuisines)) if cuisines else CUISINE_FREE,
+    )
+    return chat_log + [
+        {"role": "system", "content": instructions},
+        {"role": "user", "content": text},
+    ]
+
+
+def _clean_slots(raw, areas, cuisines=()):
+    """Проверяет слоты по одному, некорректные отбрасывает"""
+    if not isinstance(raw, dict):
+        return {}
+    slots = {}
+
+    cuisine = raw.get('cuisine')
+    if isinstance(cuisine, str) and cuisine.strip() and len(cuisine) <= 100:
+        if not cuisines:
+            slots['cuisine'] = cuisine.strip()
+        else:
+            known = {c.lower(): c for c in cuisines}
+            if cuisine.strip().lower() in known:
+                slots['cuisine'] = known[cuisine.strip().lower()]
+
+    guests = raw.get('guests')
+    if isinstance(guests, str) and guests.strip().isdigit():
+        guests = int(guests)
+    if isinstance(guests, int) and not isinstance(guests, bool) and 1 <= guests <= MAX_GUESTS:
+        slots['guests'] = guests
+
+    for key, fmt in (('date', '%Y-%m-%d'), ('time', '%H:%M')):
+        value = raw.get(key)
+        if isinstance(value, str):
+            try:
+                datetime.strptime(value.strip(), fmt)
+                slots[key] = value.strip()
+            except ValueError:
+                pass
+
+    area = raw.get('area')
+    if isinstance(area, str):
+        known = {a.lower(): a for a in areas}
+        if area.strip().lower() in known:
+            slots['area'] = known[area.strip().lower()]
+
+    dropped = set(k for k, v in raw.items() if v not in (None, '')) - set(slots)
+    if dropped:
+        logger.debug(f"Dropped invalid slots: {sorted(dropped)}")
+    return slots
+
+
+def parse_turn(content, areas, cuisines=()):
+    """
+    Разбирает и проверяет ответ модели.
+    Возвращает словарь language, intent, slots, reply или бросает TurnError.
+    """
+    try:
+        data = json.loads(FENCE_RE.sub('', content.strip()))
+    except (json.JSONDecodeError, AttributeError) as e:
+        raise TurnError(f"not a JSON object: {e}")
+    if not isinstance(data, dict):
+        raise TurnError("not a JSON object")
+
+    language = data.get('language')
+    if not isinstance(language, str) or not LANGUAGE_RE.match(language.strip().lower()):
+        raise TurnError(f"invalid language {language!r}")
+    reply = data.get('reply')
+    if not isinstance(reply, str) or not reply.strip():
+        raise TurnError("empty reply")
+
+    intent = data.get('intent')
+    if intent not in INTENTS:
+        intent = 'other'
+
+    return {
+        'language': language.strip().lower(),
+        'intent': intent,
+        'slots': _clean_slots(data.get('slots'), areas, cuisines),
+        'reply': reply.strip(),
+    }
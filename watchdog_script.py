@@ -1,15 +1,32 @@
 from watchdog.observers import Observer
 from watchdog.events import FileSystemEventHandler
 import time
-import subprocess
 import os
+import signal
+
+# Перезагрузка выполняется супервизором (supervisor.py) без остановки polling:
+# новый процесс стартует до остановки старого, сессии сохраняются в базе
+PID_FILE = 'supervisor.pid'
+DEBOUNCE = 1.0  # Редакторы сохраняют файл несколькими событиями подряд
 
 class ChangeHandler(FileSystemEventHandler):
+    def __init__(self):
+        self.changed_at = None
+
     def on_modified(self, event):
         if event.src_path.endswith('.py'):
-            print(f'{event.src_path} изменен, перезапуск бота...')
-            subprocess.run(['pkill', '-f', 'gpt-bot.py'])
-            subprocess.run(['python3', 'gpt-bot.py'])
+            print(f'{event.src_path} изменен, перезагрузка бота...')
+            self.changed_at = time.monotonic()
+
+    def reload_if_due(self):
+        if self.changed_at is None or time.monotonic() - self.changed_at < DEBOUNCE:
+            return
+        self.changed_at = None
+        try:
+            with open(PID_FILE) as f:
+                os.kill(int(f.read().strip()), signal.SIGHUP)
+        except (OSError, ValueError) as e:
+            print(f'Супервизор не найден ({e}), запустите python3 supervisor.py')
 
 if __name__ == "__main__":
     path = '.'
@@ -19,7 +36,8 @@ if __name__ == "__main__":
     observer.start()
     try:
         while True:
-            time.sleep(1)
+            time.sleep(0.2)
+            event_handler.reload_if_due()
     except KeyboardInterrupt:
         observer.stop()
     observer.join()